@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-import time
+import os
+import sys
 
 import docker
 import python_on_whales
@@ -11,6 +12,13 @@ from seedemu.layers import ScionBase, ScionRouting, ScionIsd, Scion
 from seedemu.layers.Scion import LinkType as ScLinkType
 from seedemu.services import ScionBwtestService
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from seedtest.buildsched import build
+from seedtest.campaign import Campaign, find_endpoints, predicted_links
+from seedtest.paths import PathPredictor, Topology
+from seedtest.readiness import wait_until_ready
+from seedtest.telemetry import TelemetrySampler, summarize
+
 
 # Initialize
 emu = Emulator()
@@ -96,21 +104,39 @@ emu.compile(Docker(internetMapPort=5000), './output', override=True)
 
 # Build Docker containers and run the network
 whales = python_on_whales.DockerClient(compose_files=["./output/docker-compose.yml"])
-whales.compose.build()
+build('./output')
 whales.compose.up(detach=True)
 
 # Use Docker SDK to interact with the containers
 client: docker.DockerClient = docker.from_env()
 ctrs = {ctr.name: client.containers.get(ctr.id) for ctr in whales.compose.ps()}
 
-time.sleep(10) # Give SCION some time
-for name, ctr in ctrs.items():
-    if "bwtest" not in name:
-        continue
-    print("Run bwtest in", name, end="")
-    ec, output = ctr.exec_run("scion-bwtestclient -s 1-150,10.150.0.30:40002")
-    for line in output.decode('utf8').splitlines():
-        print("  " + line)
+# Wait until SCION is up and every bwtest host has paths to all others
+bwtest_ases = (150, 151, 152, 153)
+wait_until_ready(ctrs, paths=[(f"1-{a}", f"1-{b}") for a in bwtest_ases for b in bwtest_ases if a != b])
+
+# The topology above for the path predictor, so tests whose paths share a
+# link run in different rounds
+topology = Topology()
+for asn in (150, 151, 152):
+    topology.add_as(1, asn, core=True)
+topology.add_as(1, 153)
+topology.add_core_link(150, 151)
+topology.add_core_link(151, 152)
+topology.add_core_link(152, 150)
+topology.add_link(150, 153, "PROVIDER")
+
+# Run bwtest between every pair of bwtest hosts, in rounds without shared endpoints or links
+campaign = Campaign(find_endpoints(ctrs, ports={150: 40002}), links=predicted_links(PathPredictor(topology)))
+with TelemetrySampler(ctrs, "telemetry-bwtest.jsonl.gz"):
+    campaign.run()
+campaign.save("bwtest.csv")
+usage = summarize("telemetry-bwtest.jsonl.gz")
+if usage["saturated"]:
+    print(f"Warning: host saturated during the bwtest campaign: {usage}")
+for row in campaign.results:
+    print(f"  {row['client']} -> {row['server']} {row['direction']}: "
+          f"{row.get('achieved_bps')} bps, loss {row.get('loss_percent')}%")
 
 # Shut the network down
 whales.compose.down()
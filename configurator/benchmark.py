@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+import docker
+import python_on_whales
+import yaml
+
+from seedemu.compiler import Docker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from seedtest.addressing import AddressPlan
+from seedtest.buildsched import build
+from seedtest.bundles import BundleCache
+from seedtest.convergence import BgpRoutes, RouteMonitor, compare, print_comparison, scion_paths
+from seedtest.faults import FaultScheduler, parse_link
+from seedtest.fflog import follow
+from seedtest.incremental import compile_and_build, hash_inputs, source_inputs
+from seedtest.links import apply_links, configure_links
+from seedtest.readiness import wait_for_log
+from seedtest.results import ResultStore
+from seedtest.session import BgpSession, Session
+from seedtest.topology import TopologyModel, build_bgp, build_scion
+
+
+# Failover benchmark of SCION against BGP. Both variants are built from the
+# same topology model, addresses and link parameters, one after the other,
+# and every scenario of the scenarios file runs against both. Per run the
+# data-plane outage (ReconnectTimes of the failover client) and the
+# reconvergence time (last route or path change after the fault, see
+# seedtest/convergence.py) are recorded; the comparison report aggregates
+# them per scenario and variant.
+
+# Failover applications per variant. {src}, {dst}, {src_addr} and {dst_addr}
+# are the client and server ISD-AS and host addresses; the scenarios file can
+# override every entry under `apps`. The ip-failover entries follow the
+# scion-fast-failover client and are not checked against ip-failover itself:
+# if the client of a variant never writes `ready` to `log`, the variant is
+# stopped after its first run instead of timing out in every scenario.
+APPS = {
+    "scion": {
+        "server": "/scion-fast-failover/fast-failover server -local {dst},{dst_addr}:31000",
+        "client": "/scion-fast-failover/fast-failover client -daemon 127.0.0.1:30255 "
+                  "-local {src},{src_addr}:31000 -remote {dst},{dst_addr}:31000",
+        "server_pattern": "fast-failover server",
+        "client_pattern": "fast-failover client",
+        "log": "fast-failover-client.log",
+        "ready": "Selected path",
+    },
+    "bgp": {
+        "server": "/ip-failover/ip-failover server -local {dst_addr}:31000",
+        "client": "/ip-failover/ip-failover client -local {src_addr}:31000 -remote {dst_addr}:31000",
+        "server_pattern": "ip-failover server",
+        "client_pattern": "ip-failover client",
+        "log": "ip-failover-client.log",
+        "ready": "Selected path",
+    },
+}
+
+VARIANTS = {
+    "scion": (build_scion, "./output", Session),
+    "bgp": (build_bgp, "./output_bgp", BgpSession),
+}
+
+
+parser = argparse.ArgumentParser(description="Compare SCION and BGP failover on the same topology")
+parser.add_argument("--config", default="config/config.yaml")
+parser.add_argument("--scenarios", default="config/scenarios.yaml", help="link-failure scenarios to run")
+parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=["scion", "bgp"])
+parser.add_argument("--iterations", type=int, default=1, help="runs per scenario and variant")
+parser.add_argument("--settle", type=float, default=10.0,
+                    help="seconds without route changes after which a run counts as reconverged")
+parser.add_argument("--limit", type=float, default=300.0, help="longest wait for reconvergence after a fault")
+parser.add_argument("--incremental", action="store_true",
+                    help="only rebuild nodes whose configuration changed since the last run")
+parser.add_argument("--rebuild", action="store_true", help="build all images again, even if they exist")
+parser.add_argument("--log-timeout", type=float, default=300.0,
+                    help="seconds after which a run without ReconnectTimes in the client log counts as failed")
+parser.add_argument("--report", default="comparison.json")
+args = parser.parse_args()
+
+with open(args.config, "r") as f:
+    config = yaml.safe_load(f)
+with open(args.scenarios, "r") as f:
+    scenarios = yaml.safe_load(f)
+src, dst = scenarios.get("src", "1-157"), scenarios.get("dst", "1-154")
+src_asn, dst_asn = int(src.split("-")[1]), int(dst.split("-")[1])
+
+plan_file = os.path.splitext(args.config)[0] + ".plan.json"
+plan = AddressPlan.load(plan_file)
+model = TopologyModel.from_config(config)
+bundles = BundleCache(mirror=os.environ.get("SEED_TEST_MIRROR"))
+client: docker.DockerClient = docker.from_env()
+store = ResultStore("results.db")
+topology_hash = hash_inputs(args.config)
+results = []
+
+for variant in args.variants:
+    builder, output, session_cls = VARIANTS[variant]
+    emu, base, index = builder(model, plan, bundles)
+    plan.save(plan_file)
+    configure_links(config, index)
+    apply_links(base, index)
+
+    whales = python_on_whales.DockerClient(compose_files=[f"{output}/docker-compose.yml"])
+    recreate = set()
+    if args.incremental:
+        inputs = hash_inputs(*source_inputs(args.config, plan_file, os.path.abspath(__file__)),
+                             keys=bundles.built)
+        recreate = compile_and_build(emu, Docker(internetMapPort=5000), output, whales, inputs=inputs,
+                                     builder=lambda output: build(output, rebuild=args.rebuild))
+    else:
+        emu.compile(Docker(internetMapPort=5000), output, override=True)
+        build(output, rebuild=args.rebuild)
+
+    session = session_cls(whales, client, index, paths=[(src, dst)])
+    session.up(recreate)
+    index.save(f"{output}/topology-index.json")
+
+    app = dict(APPS[variant], **scenarios.get("apps", {}).get(variant, {}))
+    names = {"src": src, "dst": dst, "src_addr": plan.host_address(src_asn), "dst_addr": plan.host_address(dst_asn)}
+    server_ctr = index.host(dst_asn)
+    client_ctr = index.host(src_asn)
+    session.add_app(server_ctr, app["server"].format(**names), app["server_pattern"])
+    session.add_app(client_ctr, app["client"].format(**names), app["client_pattern"], logs=[app["log"]])
+
+    if variant == "scion":
+        probe = scion_paths(client_ctr, dst)
+    else:
+        routers = [ctr for (_, _, role, _), ctr in index.ctrs.items() if role == "brd"]
+        probe = BgpRoutes(routers, names["dst_addr"])
+
+    ready_seen = False
+    skip_variant = False
+
+    for scenario in scenarios["scenarios"]:
+        if skip_variant:
+            break
+        missing = [fault["link"] for fault in scenario["faults"] if "link" in fault
+                   and parse_link(fault["link"]) not in index.links]
+        if missing:
+            print(f"Skipping {scenario['name']} on {variant}: no link {', '.join(missing)}")
+            continue
+        for iteration in range(args.iterations):
+            session.reset()
+            run_id = store.start_run(topology_hash, config=args.config, variant=variant, scenario=scenario["name"],
+                                     iteration=iteration)
+            if not wait_for_log(client_ctr, app["log"], app["ready"]):
+                # No faults without a working client, the run would measure nothing
+                store.fail_run(run_id, "client not ready")
+                results.append({"variant": variant, "scenario": scenario["name"], "iteration": iteration,
+                                "run_id": run_id, "failed": "client not ready"})
+                print(f"{variant} {scenario['name']} #{iteration}: failed, no '{app['ready']}' in {app['log']}")
+                if not ready_seen:
+                    _, tail = client_ctr.exec_run(["tail", "-n", "20", app["log"]])
+                    print(f"Skipping {variant}: the client never got ready, check apps.{variant} in "
+                          f"{args.scenarios}. Last lines of {app['log']}:\n{tail.decode('utf8', errors='replace')}")
+                    skip_variant = True
+                    break
+                continue
+            ready_seen = True
+            client_log = follow(client_ctr, app["log"], until="ReconnectTimes", timeout=args.log_timeout)
+            ingest = threading.Thread(target=store.ingest, args=(run_id, src, client_log, dst))
+            ingest.start()
+
+            monitor = RouteMonitor(probe).start()
+            faults = FaultScheduler(index, scenario["faults"])
+            faults.run()
+            fault_ns = faults.start_ns + min(r["start_ns"] for r in faults.records)
+            settled = monitor.settle(fault_ns, quiet=args.settle, limit=args.limit)
+            ingest.join(timeout=args.log_timeout)
+            # follow() gives up at its own timeout, so the thread ends shortly after;
+            # nothing is written to the store from here while it still runs
+            timed_out = ingest.is_alive()
+            ingest.join()
+            store.add_faults(run_id, faults.records)
+            if timed_out or not store.query("SELECT 1 FROM stats WHERE run_id = ?", run_id):
+                store.fail_run(run_id, "no ReconnectTimes in the client log")
+                results.append({"variant": variant, "scenario": scenario["name"], "iteration": iteration,
+                                "run_id": run_id, "failed": "no ReconnectTimes in the client log"})
+                print(f"{variant} {scenario['name']} #{iteration}: failed, no ReconnectTimes in the client log")
+                continue
+
+            outages = [d for (d,) in store.query("SELECT duration_s FROM reconnects WHERE run_id = ?", run_id)]
+            result = {
+                "variant": variant,
+                "scenario": scenario["name"],
+                "iteration": iteration,
+                "run_id": run_id,
+                "outage_s": sum(outages),
+                "reconnects": len(outages),
+                "reconvergence_s": monitor.convergence(fault_ns),
+                "settled": settled,
+                "route_changes": len(monitor.changes) - 1,
+            }
+            results.append(result)
+            print(f"{variant} {scenario['name']} #{iteration}: outage {result['outage_s'] * 1e3:.1f} ms, "
+                  f"reconvergence {result['reconvergence_s']:.2f} s{'' if settled else ' (not settled)'}")
+    if isinstance(probe, BgpRoutes):
+        probe.close()
+    session.down()
+
+report = compare(results)
+with open(args.report, "w") as f:
+    json.dump({"config": args.config, "scenarios": args.scenarios, "src": src, "dst": dst,
+               "report": report, "runs": results}, f, indent=2)
+print_comparison(report)
@@ -1,184 +1,207 @@
 #!/usr/bin/env python3
 
+import argparse
+import os
+import sys
+import threading
 import time
 
 import docker
 import python_on_whales
 import yaml
 
-from ipaddress import IPv4Network
 from seedemu.compiler import Docker
-from seedemu.core import Emulator, OptionMode, OptionRegistry
-from seedemu.layers import ScionBase, ScionRouting, ScionIsd, Scion, Ospf
-from seedemu.layers.Scion import LinkType as ScLinkType
-from seedemu.services import ScionBwtestService
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from seedtest.addressing import AddressPlan
+from seedtest.beaconing import BeaconLoad, print_report
+from seedtest.buildsched import build
+from seedtest.bundles import BundleCache
+from seedtest.capture import LinkCapture, links_of
+from seedtest.faults import FaultScheduler
+from seedtest.fflog import follow
+from seedtest.incremental import compile_and_build, hash_inputs, source_inputs
+from seedtest.links import apply_links, configure_links
+from seedtest.profiling import Profiler
+from seedtest.readiness import wait_for_log
+from seedtest.results import ResultStore
+from seedtest.session import Session
+from seedtest.sharding import ShardedNetwork, load_shards, partition
+from seedtest.telemetry import TelemetrySampler, summarize
+from seedtest.topology import TopologyModel, build_scion
+
+
+bundles = BundleCache(mirror=os.environ.get("SEED_TEST_MIRROR"))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--config", default="config/config.yaml")
+parser.add_argument("--incremental", action="store_true",
+                    help="only rebuild nodes whose configuration changed since the last run")
+parser.add_argument("--rebuild", action="store_true", help="build all images again, even if they exist")
+parser.add_argument("--profile", metavar="FILE", help="write render, compile, build and up times to FILE")
+parser.add_argument("--cprofile", metavar="DIR", help="also write a cProfile of every phase to DIR")
+parser.add_argument("--faults", default="config/faults.yaml", help="fault timeline of the failover test")
+parser.add_argument("--capture", action="store_true",
+                    help="capture packet headers on the faulted links and write per-link timelines")
+parser.add_argument("--capture-window", type=float, nargs=2, default=[2.0, 5.0], metavar=("PRE", "POST"),
+                    help="seconds of capture kept before and after the faults; the faults start PRE seconds "
+                         "after the capture")
+parser.add_argument("--log-timeout", type=float, default=300.0,
+                    help="seconds after which an iteration without ReconnectTimes in the client log counts as failed")
+parser.add_argument("--iterations", type=int, default=1,
+                    help="repeat the failover test on the running network, resetting it in between")
+parser.add_argument("--beacon-load", type=float, metavar="SECONDS",
+                    help="measure beaconing load per AS over SECONDS after startup and write beacon-load.json")
+parser.add_argument("--shards", metavar="FILE",
+                    help="run the network on the Docker engines of FILE (see seedtest/sharding.py)")
+args = parser.parse_args()
+if args.shards and (args.incremental or args.capture):
+    # Capture reads the local host and incremental builds one compose file
+    raise Exception("--shards cannot be combined with --incremental or --capture")
+
+with open(args.config, "r") as f:
+    config = yaml.safe_load(f)
 
-class CrossConnectNetAssigner:
-    def __init__(self):
-        self.subnet_iter = IPv4Network("10.3.0.0/16").subnets(new_prefix=29)
-        self.xc_nets = {}
-
-    def next_addr(self, net):
-        if net not in self.xc_nets:
-            hosts = next(self.subnet_iter).hosts()
-            next(hosts) # Skip first IP (reserved for Docker)
-            self.xc_nets[net] = hosts
-        return "{}/29".format(next(self.xc_nets[net]))
-
-xc_nets = CrossConnectNetAssigner()
-
-# Initialize
-emu = Emulator()
-base = ScionBase()
-routing = ScionRouting()
-ospf = Ospf()
-scion_isd = ScionIsd()
-scion = Scion()
-bwtest = ScionBwtestService()
+# Shared with configurator_bgp.py, so both variants use the same addresses
+plan_file = os.path.splitext(args.config)[0] + ".plan.json"
+plan = AddressPlan.load(plan_file)
 
+# SCION variant of the topology, rendered, with interface names and
+# addresses of all links in the index
+profiler = Profiler(args.cprofile)
+model = TopologyModel.from_config(config)
+emu, base, index = build_scion(model, plan, bundles, profiler=profiler)
+plan.save(plan_file)
 
-with open("config/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-
-routers = {}
-core_ases = {}
-for _isd in range(1, config["MAIN"]["ISDs"] + 1):
-    isd_config = config[f"ISD{_isd}"]
-    isd = isd_config["ISDN"]
-    isd_ix = 100 + isd
-    base.createInternetExchange(isd_ix, create_rs=False)
-    routers[isd] = {}
-    core_ases[isd] = []
-    base.createIsolationDomain(isd)
-    for _, as_data in isd_config["ASes"]["CORE"].items():
-        asn = as_data["ASN"]
-        routers[isd][asn] = {}
-        core_as = base.createAutonomousSystem(asn)
-        core_as.setOption(OptionRegistry().scion_disable_bfd("false", mode = OptionMode.RUN_TIME))
-        scion_isd.addIsdAs(isd, asn, is_core=True)
-        for br_id in range(as_data["BRs"]):
-            core_as.createNetwork(f'net{br_id}')
-            boarder_router = core_as.createRouter(f'br{br_id}')
-            routers[isd][asn][br_id] = boarder_router
-            boarder_router.joinNetwork(f'net{br_id}')
-            boarder_router.joinNetwork(f'net{(br_id + 1) % as_data["BRs"]}')
-            if f"br{br_id}" == as_data["INTER_BR"]:
-                boarder_router.joinNetwork(f"ix{isd_ix}")
-        core_as.createControlService('cs1').joinNetwork('net0')
-        core_as.createControlService('cs2').joinNetwork('net1')
-        for previous_core_as in core_ases[isd]:
-            print(isd_ix, (isd, asn), (isd, previous_core_as))
-            scion.addIxLink(isd_ix, (isd, previous_core_as), (isd, asn), ScLinkType.Core, a_router="br1", b_router="br1")
-        core_ases[isd] += [asn]
-        print("CORE", core_ases)
-
-    for level in range(1, isd_config["LEVELS"] + 1):
-        for _, as_data in isd_config["ASes"][f"LEVEL{level}"].items():
-            asn = as_data["ASN"]
-            routers[isd][asn] = {}
-            customer_as = base.createAutonomousSystem(asn)
-            customer_as.setOption(OptionRegistry().scion_disable_bfd("false", mode = OptionMode.RUN_TIME))
-            scion_isd.addIsdAs(isd, asn, is_core=False)
-            scion_isd.setCertIssuer((isd, asn), core_ases[isd][0])
-            customer_as.createNetwork(f'net0')
-            boarder_router = customer_as.createRouter(f'br0')
-            routers[isd][asn][0] = boarder_router
-            boarder_router.joinNetwork(f'net0')
-            customer_as.createControlService('cs1').joinNetwork('net0')
-            if "HOST" in as_data and as_data["HOST"]:
-                customer_as.createHost('host').joinNetwork('net0', address=f'10.{asn}.0.30')
-                host = customer_as.getHost('host')
-                host.addSoftware("git")
-                # install go 1.25.1
-                host.addBuildCommand("rm -rf /usr/local/go && curl -LO https://golang.org/dl/go1.25.1.linux-amd64.tar.gz && \
-                    echo \"7716a0d940a0f6ae8e1f3b3f4f36299dc53e31b16840dbd171254312c41ca12e go1.25.1.linux-amd64.tar.gz\" | sha256sum -c && \
-                    tar -C /usr/local -xzf go1.25.1.linux-amd64.tar.gz \
-                    && rm go1.25.1.linux-amd64.tar.gz")
-                # install scion-fast-failover
-                host.addBuildCommand("git clone https://github.com/aaronbojarski/scion-fast-failover.git && \
-                    cd scion-fast-failover && \
-                    /usr/local/go/bin/go build fast-failover.go server.go client.go")
-
-            for connection in as_data["CONNECTIONS"]:
-                print(connection)
-                boarder_router.crossConnect(connection["AS"], connection["BR"], xc_nets.next_addr(f"{connection["AS"]}-{asn}"))
-                routers[isd][connection["AS"]][0].crossConnect(asn, "br0", xc_nets.next_addr(f"{connection["AS"]}-{asn}"))
-                if connection["RELATION"] == "PROVIDER":
-                    scion.addXcLink((isd, connection["AS"]), (isd, asn), ScLinkType.Transit)
-                elif connection["RELATION"] == "PEER":
-                    scion.addXcLink((isd, connection["AS"]), (isd, asn), ScLinkType.Peer)
-
-# Rendering
-emu.addLayer(base)
-emu.addLayer(routing)
-emu.addLayer(ospf)
-emu.addLayer(scion_isd)
-emu.addLayer(scion)
-emu.addLayer(bwtest)
-
-emu.render()
-
-# get cross connect link names to be able to crash them
-cross_connects = {}
-for _isd in range(1, config["MAIN"]["ISDs"] + 1):
-    isd = isd_config["ISDN"]
-    for level in range(1, isd_config["LEVELS"] + 1):
-        for _, as_data in isd_config["ASes"][f"LEVEL{level}"].items():
-            asn = as_data["ASN"]
-            for connection in as_data["CONNECTIONS"]:
-                _, cx_name, _ = routers[isd][asn][0].getCrossConnect(connection["AS"], connection["BR"])
-                cross_connects[(isd, asn, isd, connection["AS"])] = cx_name
-                _, cx_name, _ = routers[isd][connection["AS"]][0].getCrossConnect(asn, "br0")
-                cross_connects[(isd, connection["AS"], isd, asn)] = cx_name
+# Latency, jitter, bandwidth and loss of config.yaml
+configure_links(config, index)
+apply_links(base, index)
 
 # Compilation
-emu.compile(Docker(internetMapPort=5000), './output', override=True)
-
 whales = python_on_whales.DockerClient(compose_files=["./output/docker-compose.yml"])
-whales.compose.build()
-whales.compose.up(detach=True)
-
 # Use Docker SDK to interact with the containers
 client: docker.DockerClient = docker.from_env()
-ctrs = {ctr.name: client.containers.get(ctr.id) for ctr in whales.compose.ps()}
-
-time.sleep(10) # Give SCION some time
-print(ctrs.items())
-
-
-for name, ctr in ctrs.items():
-    if "as154h-host" in name:
-        #start the server
-        ec, server_output = ctr.exec_run("./scion-fast-failover/fast-failover server -local 1-154,10.154.0.30:31000", detach=True)
-
-for name, ctr in ctrs.items():
-    if "as157h-host" in name:
-        #start the server
-        print("Starting the client")
-        ec, client_output = ctr.exec_run("./scion-fast-failover/fast-failover client -daemon 127.0.0.1:30255 -local 1-157,10.157.0.30:31000 -remote 1-154,10.154.0.30:31000", detach=True)
-
-time.sleep(5)
-
-print("Cross Connects:", cross_connects)
-for name, ctr in ctrs.items():
-    if "as156brd-br0" in name:
-        #start the server
-        print(f"BR 156: $ ip link set {cross_connects[(1, 156, 1, 154)]} down")
-        ec, client_output = ctr.exec_run(f"ip link set {cross_connects[(1, 156, 1, 154)]} down")
-
-time.sleep(15)
-
-for name, ctr in ctrs.items():
-    if "as157h-host" in name:
-        with open('data.tar', 'wb') as f:
-            bits, stat = ctr.get_archive('fast-failover-client.log')
-            print(stat)
-            for chunk in bits:
-                f.write(chunk)
-
-print("Started")
+recreate = set()
+if args.shards:
+    # One compose file per engine, cut networks stitched with VXLAN on up
+    shards = load_shards(args.shards)
+    whales = ShardedNetwork('./output', shards, partition(model, shards))
+    client = whales.client
+    with profiler.phase("compile"):
+        emu.compile(Docker(internetMapPort=5000), './output', override=True)
+        whales.split()
+    with profiler.phase("build"):
+        whales.build(rebuild=args.rebuild)
+elif args.incremental:
+    inputs = hash_inputs(*source_inputs(args.config, plan_file, os.path.abspath(__file__)),
+                         keys=bundles.built)
+    with profiler.phase("compile"):
+        recreate = compile_and_build(emu, Docker(internetMapPort=5000), './output', whales, inputs=inputs,
+                                     builder=lambda output: build(output, rebuild=args.rebuild))
+else:
+    with profiler.phase("compile"):
+        emu.compile(Docker(internetMapPort=5000), './output', override=True)
+    with profiler.phase("build"):
+        build('./output', rebuild=args.rebuild)
+
+# Bring the network up once, iterations run against the warm network.
+# Wait until SCION is up and the client AS has paths to the server AS.
+session = Session(whales, client, index, paths=[("1-157", "1-154")])
+with profiler.phase("up"):
+    timeline = session.up(recreate)
+timeline.save("readiness.json")
+index.save("./output/topology-index.json")
+if args.profile:
+    profiler.save(args.profile)
+    profiler.print_report()
+
+if args.beacon_load:
+    # Beacon rates, PCB database size and control-service CPU per AS with the
+    # CONTROL_SERVICES and BEACONING of config.yaml, next to how fast
+    # beaconing converged at startup
+    load = BeaconLoad(session.ctrs)
+    beacon_load = load.measure(args.beacon_load)
+    for entry in beacon_load:
+        entry["beaconing"] = model.ases[entry["as"]].beaconing
+        entry["first_beacon_s"] = timeline.first("beacons", entry["as"])
+    load.save("beacon-load.json", beacon_load, config=args.config, seconds=args.beacon_load,
+              paths_s=timeline.first("paths"))
+    print_report(beacon_load)
+
+server_ctr = index.host(154)
+session.add_app(server_ctr, f"/scion-fast-failover/fast-failover server -local 1-154,{plan.host_address(154)}:31000",
+                "fast-failover server")
+client_ctr = index.host(157)
+session.add_app(client_ctr, f"/scion-fast-failover/fast-failover client -daemon 127.0.0.1:30255 -local 1-157,{plan.host_address(157)}:31000 -remote 1-154,{plan.host_address(154)}:31000",
+                "fast-failover client", logs=["fast-failover-client.log"])
+
+store = ResultStore("results.db")
+for iteration in range(args.iterations):
+    # Restores links, recovers drifted containers and restarts server and client
+    reset = session.reset()
+    print(f"Iteration {reset['iteration']}: reset in {reset['reset_s']:.1f} s, recovered {reset['recovered']}")
+
+    run_id = store.start_run(hash_inputs(args.config), config=args.config, faults=args.faults, iteration=iteration)
+    if not wait_for_log(client_ctr, "fast-failover-client.log", "Selected path"):
+        # No faults without a working client, the run would measure nothing
+        store.fail_run(run_id, "client selected no path")
+        print(f"Iteration {iteration} failed: the client selected no path, faults skipped")
+        continue
+
+    # Parse the client log into the results store while the test runs
+    client_log = follow(client_ctr, "fast-failover-client.log", until="ReconnectTimes", timeout=args.log_timeout)
+    ingest = threading.Thread(target=store.ingest, args=(run_id, "1-157", client_log))
+    ingest.start()
+    # Resource usage of all containers while the test runs, read from the
+    # cgroups of the local host, so not available on sharded networks
+    telemetry_file = f"telemetry-{run_id}.jsonl.gz"
+    telemetry = None if args.shards else TelemetrySampler(session.ctrs, telemetry_file).start()
+
+    capture = LinkCapture(index, window=sum(args.capture_window)) if args.capture else None
+    try:
+        if capture is not None:
+            # Header capture on both ends of every faulted link; the rings keep
+            # the last seconds before the faults and are frozen after them
+            with open(args.faults, "r") as f:
+                capture.arm(links_of(yaml.safe_load(f)["faults"]))
+            time.sleep(args.capture_window[0])
+
+        faults = FaultScheduler.from_file(index, args.faults)
+        for record in faults.run():
+            print(f"{record['start_ns'] / 1e6:.3f} ms: {record['container']} $ {record['command'] or record['action']}")
+        faults.save("faults.json")
+        if capture is not None:
+            time.sleep(args.capture_window[1])
+            capture.freeze()
+            capture.export(f"capture/{run_id}")
+            capture.save(f"capture-{run_id}.json", faults.records, pre=args.capture_window[0],
+                         post=args.capture_window[1])
+    finally:
+        # No tcpdump left running on the host, whatever happened
+        if capture is not None:
+            capture.clear()
+
+    ingest.join(timeout=args.log_timeout)
+    # follow() gives up at its own timeout, so the thread ends shortly after;
+    # nothing is written to the store from here while it still runs
+    timed_out = ingest.is_alive()
+    ingest.join()
+    store.add_faults(run_id, faults.records)
+    if timed_out or not store.query("SELECT 1 FROM stats WHERE run_id = ?", run_id):
+        store.fail_run(run_id, "no ReconnectTimes in the client log")
+        print(f"Iteration {iteration} failed: no ReconnectTimes in the client log within {args.log_timeout:.0f} s")
+    if telemetry is None:
+        continue
+    telemetry.stop()
+    usage = summarize(telemetry_file)
+    store.add_telemetry(run_id, usage, telemetry_file)
+    if usage["saturated"]:
+        print(f"Warning: host saturated during iteration {iteration} (cpu pressure {usage['psi_max']}%, "
+              f"peak {usage['cpu_peak']} of {usage['cpus']} CPUs, throttled {usage['throttled']})")
+
+for src, dst, runs, count, mean, worst in store.reconnect_summary(hash_inputs(args.config)):
+    print(f"{src} -> {dst}: {count} reconnects in {runs} runs, mean {mean * 1e3:.1f} ms, max {worst * 1e3:.1f} ms")
 
 # Shut the network down
-whales.compose.down()
-
+session.down()
@@ -1,122 +1,82 @@
 #!/usr/bin/env python3
 
-import time
+import argparse
+import os
+import sys
 
 import docker
 import python_on_whales
 import yaml
 
-from ipaddress import IPv4Network
 from seedemu.compiler import Docker
-from seedemu.core import Emulator, OptionMode, OptionRegistry
-from seedemu.layers import Base, Routing, Ospf, Ibgp, Ebgp, PeerRelationship
-from seedemu.layers import PeerRelationship as PeerRel
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from seedtest.addressing import AddressPlan
+from seedtest.buildsched import build
+from seedtest.bundles import BundleCache
+from seedtest.incremental import compile_and_build, hash_inputs, source_inputs
+from seedtest.links import apply_links, configure_links
+from seedtest.profiling import Profiler
+from seedtest.topology import TopologyModel, build_bgp
 
-class CrossConnectNetAssigner:
-    def __init__(self):
-        self.subnet_iter = IPv4Network("10.3.0.0/16").subnets(new_prefix=29)
-        self.xc_nets = {}
 
-    def next_addr(self, net):
-        if net not in self.xc_nets:
-            hosts = next(self.subnet_iter).hosts()
-            next(hosts) # Skip first IP (reserved for Docker)
-            self.xc_nets[net] = hosts
-        return "{}/29".format(next(self.xc_nets[net]))
+bundles = BundleCache(mirror=os.environ.get("SEED_TEST_MIRROR"))
 
-xc_nets = CrossConnectNetAssigner()
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--config", default="config/config.yaml")
+parser.add_argument("--incremental", action="store_true",
+                    help="only rebuild nodes whose configuration changed since the last run")
+parser.add_argument("--rebuild", action="store_true", help="build all images again, even if they exist")
+parser.add_argument("--profile", metavar="FILE", help="write render, compile, build and up times to FILE")
+parser.add_argument("--cprofile", metavar="DIR", help="also write a cProfile of every phase to DIR")
+args = parser.parse_args()
 
-# Initialize
-emu = Emulator()
-base = Base()
-routing = Routing()
-ospf = Ospf()
-ibgp = Ibgp()
-ebgp = Ebgp()
+with open(args.config, "r") as f:
+    config = yaml.safe_load(f)
 
+# Shared with configurator.py, so both variants use the same addresses
+plan_file = os.path.splitext(args.config)[0] + ".plan.json"
+plan = AddressPlan.load(plan_file)
 
-with open("config/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+# BGP variant of the topology, rendered, with interface names and addresses
+# of all links in the index
+profiler = Profiler(args.cprofile)
+emu, base, index = build_bgp(TopologyModel.from_config(config), plan, bundles, profiler=profiler)
+plan.save(plan_file)
 
-routers = {}
-for _isd in range(1, config["MAIN"]["ISDs"] + 1):
-    isd_config = config[f"ISD{_isd}"]
-    isd = isd_config["ISDN"]
-    isd_ix = 100 + isd
-    base.createInternetExchange(isd_ix)
-    routers[isd] = {}
-    for _, as_data in isd_config["ASes"]["CORE"].items():
-        asn = as_data["ASN"]
-        routers[isd][asn] = {}
-        core_as = base.createAutonomousSystem(asn)
-        for br_id in range(as_data["BRs"]):
-            core_as.createNetwork(f'net{br_id}')
-            boarder_router = core_as.createRouter(f'br{br_id}')
-            routers[isd][asn][br_id] = boarder_router
-            boarder_router.joinNetwork(f'net{br_id}')
-            boarder_router.joinNetwork(f'net{(br_id + 1) % as_data["BRs"]}')
-            if f"br{br_id}" == as_data["INTER_BR"]:
-                boarder_router.joinNetwork(f"ix{isd_ix}")
-        ebgp.addRsPeer(isd_ix, asn)
-
-    for level in range(1, isd_config["LEVELS"] + 1):
-        for _, as_data in isd_config["ASes"][f"LEVEL{level}"].items():
-            asn = as_data["ASN"]
-            routers[isd][asn] = {}
-            customer_as = base.createAutonomousSystem(asn)
-            customer_as.setOption(OptionRegistry().scion_disable_bfd("false", mode = OptionMode.RUN_TIME))
-            customer_as.createNetwork(f'net0')
-            boarder_router = customer_as.createRouter(f'br0')
-            routers[isd][asn][0] = boarder_router
-            boarder_router.joinNetwork(f'net0')
-            if "HOST" in as_data and as_data["HOST"]:
-                customer_as.createHost('host').joinNetwork('net0', address=f'10.{asn}.0.30')
-                host = customer_as.getHost('host')
-                host.addSoftware("traceroute")
-                host.addSoftware("git")
-                # install go 1.25.1
-                host.addBuildCommand("rm -rf /usr/local/go && curl -LO https://golang.org/dl/go1.25.1.linux-amd64.tar.gz && \
-                    echo \"7716a0d940a0f6ae8e1f3b3f4f36299dc53e31b16840dbd171254312c41ca12e go1.25.1.linux-amd64.tar.gz\" | sha256sum -c && \
-                    tar -C /usr/local -xzf go1.25.1.linux-amd64.tar.gz \
-                    && rm go1.25.1.linux-amd64.tar.gz")
-                # install scion-fast-failover
-                host.addBuildCommand("git clone https://github.com/aaronbojarski/ip-failover.git && \
-                    cd ip-failover && \
-                    /usr/local/go/bin/go build ip-failover.go server.go client.go")
-
-            for connection in as_data["CONNECTIONS"]:
-                print(connection)
-                boarder_router.crossConnect(connection["AS"], connection["BR"], xc_nets.next_addr(f"{connection["AS"]}-{asn}"), latency=5)
-                routers[isd][connection["AS"]][0].crossConnect(asn, "br0", xc_nets.next_addr(f"{connection["AS"]}-{asn}"), latency=5)
-                if connection["RELATION"] == "PROVIDER":
-                    ebgp.addCrossConnectPeering(connection["AS"], asn, PeerRelationship.Provider)
-                elif connection["RELATION"] == "PEER":
-                    ebgp.addCrossConnectPeering(connection["AS"], asn, PeerRelationship.Peer)
-                else:
-                    raise Exception(f"Unknown Connection Relation: {connection["RELATION"]}")
-
-# Rendering
-emu.addLayer(base)
-emu.addLayer(routing)
-emu.addLayer(ospf)
-emu.addLayer(ibgp)
-emu.addLayer(ebgp)
-
-emu.render()
+# Latency, jitter, bandwidth and loss of config.yaml
+configure_links(config, index)
+apply_links(base, index)
 
 
 # Compilation
-emu.compile(Docker(internetMapPort=5000), './output_bgp', override=True)
-
 whales = python_on_whales.DockerClient(compose_files=["./output_bgp/docker-compose.yml"])
-whales.compose.build()
-whales.compose.up(detach=True)
+recreate = set()
+if args.incremental:
+    inputs = hash_inputs(*source_inputs(args.config, plan_file, os.path.abspath(__file__)),
+                         keys=bundles.built)
+    with profiler.phase("compile"):
+        recreate = compile_and_build(emu, Docker(internetMapPort=5000), './output_bgp', whales, inputs=inputs,
+                                     builder=lambda output: build(output, rebuild=args.rebuild))
+else:
+    with profiler.phase("compile"):
+        emu.compile(Docker(internetMapPort=5000), './output_bgp', override=True)
+    with profiler.phase("build"):
+        build('./output_bgp', rebuild=args.rebuild)
+with profiler.phase("up"):
+    if recreate:
+        whales.compose.up(sorted(recreate), detach=True, force_recreate=True)
+    whales.compose.up(detach=True)
 
 # Use Docker SDK to interact with the containers
 client: docker.DockerClient = docker.from_env()
 ctrs = {ctr.name: client.containers.get(ctr.id) for ctr in whales.compose.ps()}
+index.attach(ctrs)
+index.save("./output_bgp/topology-index.json")
+if args.profile:
+    profiler.save(args.profile)
+    profiler.print_report()
 
 print("Started")
 
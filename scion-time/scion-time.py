@@ -5,8 +5,40 @@ from seedemu.core import Emulator
 from seedemu.layers import ScionBase, ScionRouting, ScionIsd, Scion
 from seedemu.layers.Scion import LinkType as ScLinkType
 
+import argparse
 import json
 import os
+import sys
+
+import docker
+import python_on_whales
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from seedtest.buildsched import build
+from seedtest.bundles import BundleCache, SCION_TIME
+from seedtest.incremental import IncrementalCompiler, compile_and_build
+from seedtest.readiness import wait_until_ready
+from seedtest.timebench import TimeBenchmark, TimeHost
+from seedtest.topoindex import TopologyIndex
+from seedtest.tlsgen import CertificateAuthority
+from seedtest.transforms import TransformPipeline, in_as, json_transform
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--incremental", action="store_true",
+                    help="only rewrite node directories whose configuration changed")
+parser.add_argument("--cert-per-as", action="store_true",
+                    help="share one NTS-KE certificate between all time hosts of an AS")
+parser.add_argument("--benchmark", metavar="CONFIG",
+                    help="bring the network up and run the clock-sync benchmark described in CONFIG")
+args = parser.parse_args()
+
+bundles = BundleCache(mirror=os.environ.get("SEED_TEST_MIRROR"))
+# NTS-KE certificates are issued at compile time from a cached local CA
+tls = CertificateAuthority()
+
+def install_tls(host, asn):
+    name = f"as{asn}" if args.cert_per_as else f"as{asn}-{host.getName()}"
+    tls.install(host, name)
 
 # Initialize
 emu = Emulator()
@@ -21,6 +53,37 @@ base.createIsolationDomain(1)
 # Internet Exchange
 base.createInternetExchange(100, create_rs=False)
 
+# Time hosts: ASN -> address. AS 150 runs the server, the others are clients.
+TIME_SERVER = 150
+time_hosts = {150: '10.150.0.30', 153: '10.153.0.30'}
+
+ts_server_config = """
+local_address = "1-{asn},{address}"
+scion_daemon_address = "127.0.0.1:30255"
+
+ntske_cert_file = "/tls.crt"
+ntske_key_file = "/tls.key"
+ntske_server_name = "localhost"
+"""
+
+def create_time_host(as_, asn):
+    address = time_hosts[asn]
+    host = as_.createHost('time').joinNetwork('net0', address=address)
+    # install prebuilt scion-time
+    bundles.install(host, SCION_TIME)
+    # kill the dispatcher since it is incompatible with scion-time
+    host.appendStartCommand("pkill dispatcher", isPostConfigCommand=True)
+    if asn == TIME_SERVER:
+        host.setFile(path="ts_config.toml", content=ts_server_config.format(asn=asn, address=address))
+        # certificate for the NTSKE server
+        install_tls(host, asn)
+        # start the scion-time server
+        host.appendStartCommand("/scion-time/timeservice server -verbose -config ts_config.toml > time.log 2>&1", fork=True, isPostConfigCommand=True)
+    # Clients need no config, the benchmark starts them with -local and -remote
+    return host
+
+index = TopologyIndex()
+
 # AS-150
 as150 = base.createAutonomousSystem(150)
 scion_isd.addIsdAs(1, 150, is_core=True)
@@ -29,48 +92,7 @@ as150.createControlService('cs1').joinNetwork('net0')
 as150_router = as150.createRouter('br0')
 as150_router.joinNetwork('net0').joinNetwork('ix100')
 as150_router.crossConnect(153, 'br0', '10.50.0.2/29')
-as150.createHost('time').joinNetwork('net0', address='10.150.0.30')
-host = as150.getHost('time')
-host.addSoftware("git")
-# install go 1.25.1
-host.addBuildCommand("rm -rf /usr/local/go && curl -LO https://golang.org/dl/go1.25.1.linux-amd64.tar.gz && \
-    echo \"7716a0d940a0f6ae8e1f3b3f4f36299dc53e31b16840dbd171254312c41ca12e go1.25.1.linux-amd64.tar.gz\" | sha256sum -c && \
-    tar -C /usr/local -xzf go1.25.1.linux-amd64.tar.gz \
-    && rm go1.25.1.linux-amd64.tar.gz")
-# install scion-time
-host.addBuildCommand("git clone https://github.com/marcfrei/scion-time.git && \
-    cd scion-time && \
-    /usr/local/go/bin/go build timeservice.go timeservice_t.go")
-
-ts_config = """
-local_address = "1-150,10.150.0.30"
-scion_daemon_address = "127.0.0.1:30255"
-
-ntske_cert_file = "/tls.crt"
-ntske_key_file = "/tls.key"
-ntske_server_name = "localhost"
-"""
-host.setFile(path="ts_config.toml", content=ts_config)
-
-cert_config = """[ req ]
-distinguished_name = dn
-prompt = no
-
-[ dn ]
-C = CH
-ST = Zurich
-L = .
-O = .
-OU = .
-CN = .
-"""
-host.setFile(path="tls-cert.conf", content=cert_config)
-# generate certificate for NTSKE Server
-host.appendStartCommand("openssl req -new -newkey rsa:4096 -x509 -sha256 -days 365 -nodes -out /tls.crt -keyout /tls.key -config /tls-cert.conf")
-# kill the dispatcher since it is incompatible with the scion-time server
-host.appendStartCommand("pkill dispatcher", isPostConfigCommand=True)
-# start the scion-time server
-host.appendStartCommand("./scion-time/timeservice server -verbose -config ts_config.toml > time.log 2>&1", fork=True, isPostConfigCommand=True)
+create_time_host(as150, 150)
 
 # AS-151
 as151 = base.createAutonomousSystem(151)
@@ -95,24 +117,17 @@ as153.createControlService('cs1').joinNetwork('net0')
 as153_router = as153.createRouter('br0')
 as153_router.joinNetwork('net0')
 as153_router.crossConnect(150, 'br0', '10.50.0.3/29')
-as153.createHost('time').joinNetwork('net0', address='10.153.0.30')
-host = as153.getHost('time')
-host.addSoftware("git")
-# install go 1.25.1
-host.addBuildCommand("rm -rf /usr/local/go && curl -LO https://golang.org/dl/go1.25.1.linux-amd64.tar.gz && \
-    echo \"7716a0d940a0f6ae8e1f3b3f4f36299dc53e31b16840dbd171254312c41ca12e go1.25.1.linux-amd64.tar.gz\" | sha256sum -c && \
-    tar -C /usr/local -xzf go1.25.1.linux-amd64.tar.gz \
-    && rm go1.25.1.linux-amd64.tar.gz")
-# install scion-time
-host.addBuildCommand("git clone https://github.com/marcfrei/scion-time.git && \
-    cd scion-time && \
-    /usr/local/go/bin/go build timeservice.go timeservice_t.go")
+create_time_host(as153, 153)
 
 # Inter-AS routing
 scion.addIxLink(100, (1, 150), (1, 151), ScLinkType.Core)
 scion.addIxLink(100, (1, 151), (1, 152), ScLinkType.Core)
 scion.addIxLink(100, (1, 152), (1, 150), ScLinkType.Core)
 scion.addXcLink((1, 150), (1, 153), ScLinkType.Transit)
+index.add_link((1, 150), (1, 151), "core", ix=100)
+index.add_link((1, 151), (1, 152), "core", ix=100)
+index.add_link((1, 152), (1, 150), "core", ix=100)
+index.add_link((1, 150), (1, 153), "transit")
 
 # Rendering
 emu.addLayer(base)
@@ -121,21 +136,58 @@ emu.addLayer(scion_isd)
 emu.addLayer(scion)
 
 emu.render()
+index.resolve(base)
 
-# Compilation
-emu.compile(Docker(internetMapPort=5000), './output', override=True)
-
-# Post process topology.json in AS 150 to dispatch all ports.
+# Post process topology.json in the time host ASes to dispatch all ports.
 # It would be nice if this could be configured with seedemu.
-folders = ["brdnode_150_br0", "csnode_150_cs1", "hnode_150_time"]
-for folder in folders:
-    for filename in os.listdir(f"output/{folder}/"):
-        with open(f"output/{folder}/{filename}", "r") as f:
-            try:
-                topology = json.load(f)
-            except:
-                continue
-        if "dispatched_ports" in topology:
-            topology["dispatched_ports"] = "all"
-            with open(f"output/{folder}/{filename}", "w") as f:
-                json.dump(topology, f, indent=2)
+def dispatch_all_ports(topology, node):
+    if "dispatched_ports" not in topology:
+        return False
+    topology["dispatched_ports"] = "all"
+    return True
+
+transforms = TransformPipeline()
+transforms.register(in_as(*time_hosts), "*topology.json", json_transform(dispatch_all_ports))
+
+# Compilation
+compiler = Docker(internetMapPort=5000)
+whales = python_on_whales.DockerClient(compose_files=["./output/docker-compose.yml"])
+recreate = set()
+if args.incremental and args.benchmark:
+    recreate = compile_and_build(emu, compiler, './output', whales, postprocess=transforms, builder=build)
+elif args.incremental:
+    # Patches are applied before hashing, so unchanged nodes are not rewritten
+    IncrementalCompiler("./output").compile(emu, compiler, postprocess=transforms)
+else:
+    emu.compile(compiler, './output', override=True)
+    transforms.apply("./output")
+    if args.benchmark:
+        build('./output')
+
+if args.benchmark:
+    if recreate:
+        whales.compose.up(sorted(recreate), detach=True, force_recreate=True)
+    whales.compose.up(detach=True)
+    client: docker.DockerClient = docker.from_env()
+    ctrs = {ctr.name: client.containers.get(ctr.id) for ctr in whales.compose.ps()}
+    index.attach(ctrs)
+    index.save("./output/topology-index.json")
+
+    clients = [asn for asn in time_hosts if asn != TIME_SERVER]
+    wait_until_ready(ctrs, paths=[(f"1-{asn}", f"1-{TIME_SERVER}") for asn in clients])
+
+    server = TimeHost(index.host(TIME_SERVER, "time"), f"1-{TIME_SERVER}", time_hosts[TIME_SERVER])
+    bench = TimeBenchmark.from_file(server, [
+        TimeHost(index.host(asn, "time"), f"1-{asn}", time_hosts[asn], router=index.router(asn))
+        for asn in clients], args.benchmark)
+    bench.shape_links(index)
+    summary = bench.run("timebench.jsonl")
+    with open("timebench-summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    for phase in summary:
+        print(f"phase {phase['phase']}: {phase['clients']} clients, {phase['converged']} converged "
+              f"(max {phase['convergence_s_max']} s), offset error p50 {phase['offset_error_s']['p50']} s, "
+              f"p99 {phase['offset_error_s']['p99']} s, server cpu {phase['server_cpu_mean']}%")
+
+    # Shut the network down
+    whales.compose.down()
@@ -0,0 +1,196 @@
+import json
+import os
+
+from ipaddress import ip_address, ip_network
+
+
+# Address plan for a whole topology. Every allocation is an index into a list
+# of pools, so the address of a link or AS network is computed arithmetically
+# from its index instead of being drawn from live subnet iterators. The plan
+# only stores which key got which index and can be saved and reloaded, so a
+# re-run yields the same addressing.
+
+DEFAULT_LINK_POOLS = ["10.3.0.0/16", "198.18.0.0/15"]
+DEFAULT_AS_POOLS = ["100.64.0.0/10"]
+
+
+def default_link_prefixlen(version, reserve_gateway):
+    # Docker puts its gateway on the first address of every network it
+    # creates, so cross-connects that become Docker networks need room for
+    # three hosts. Without a gateway, links use /31 (RFC 3021) or /127.
+    if version == 4:
+        return 29 if reserve_gateway else 31
+    return 126 if reserve_gateway else 127
+
+
+def default_as_prefixlens(version):
+    # Block reserved per AS and the networks it is split into, 4 networks per
+    # block. ASes with more networks (core ASes, one per BR) get more blocks.
+    return (22, 24) if version == 4 else (62, 64)
+
+
+class PoolSet:
+    def __init__(self, prefixes, prefixlen):
+        self.prefixes = [str(p) for p in prefixes]
+        self.networks = [ip_network(p) for p in self.prefixes]
+        self.prefixlen = prefixlen
+        self.capacities = []
+        for net in self.networks:
+            if net.prefixlen > prefixlen:
+                raise Exception(f"Pool {net} is smaller than a /{prefixlen}")
+            self.capacities.append(2 ** (prefixlen - net.prefixlen))
+
+    @property
+    def capacity(self):
+        return sum(self.capacities)
+
+    def base(self, index):
+        # First address of block `index` as an integer
+        for net, capacity in zip(self.networks, self.capacities):
+            if index < capacity:
+                return int(net.network_address) + index * 2 ** (net.max_prefixlen - self.prefixlen)
+            index -= capacity
+        raise Exception(f"Address pools {self.prefixes} exhausted")
+
+    def block(self, index):
+        return ip_network((self.base(index), self.prefixlen))
+
+
+class AddressPlan:
+    def __init__(self, link_pools=None, link_prefixlen=None, reserve_gateway=True,
+                 as_pools=None, as_prefixlen=None, net_prefixlen=None, legacy_asn=True):
+        # link_pools:   prefixes for cross-connect links
+        # as_pools:     prefixes for AS networks that cannot use 10.<asn>.<net>.0/24
+        # as_prefixlen: block size, an AS gets as many blocks as its networks need
+        # net_prefixlen: networks the blocks are split into
+        # legacy_asn:   keep 10.<asn>.<net>.0/24 for ASNs up to 255
+        link_pools = link_pools or DEFAULT_LINK_POOLS
+        if link_prefixlen is None:
+            link_prefixlen = default_link_prefixlen(ip_network(link_pools[0]).version, reserve_gateway)
+        as_pools = as_pools or DEFAULT_AS_POOLS
+        default_as, default_net = default_as_prefixlens(ip_network(as_pools[0]).version)
+        as_prefixlen = default_as if as_prefixlen is None else as_prefixlen
+        net_prefixlen = default_net if net_prefixlen is None else net_prefixlen
+        if net_prefixlen < as_prefixlen:
+            raise Exception(f"/{net_prefixlen} networks do not fit into /{as_prefixlen} AS blocks")
+        self.reserve_gateway = reserve_gateway
+        self.links = PoolSet(link_pools, link_prefixlen)
+        self.ases = PoolSet(as_pools, as_prefixlen)
+        self.net_prefixlen = net_prefixlen
+        self.legacy_asn = legacy_asn
+        self.link_keys = []
+        self.link_index = {}
+        self.as_keys = []
+        self.as_index = {}  # AS -> indices of its blocks
+        self.ixes = []
+        self.legacy_ases = set()
+        # Offset of the first usable address inside a link block
+        max_prefixlen = self.links.networks[0].max_prefixlen
+        self.first_host = (0 if link_prefixlen >= max_prefixlen - 1 else 1) + (1 if reserve_gateway else 0)
+
+    def _link_index(self, key):
+        key = str(key)
+        if key not in self.link_index:
+            if len(self.link_keys) >= self.links.capacity:
+                raise Exception(f"Address pools {self.links.prefixes} exhausted")
+            self.link_index[key] = len(self.link_keys)
+            self.link_keys.append(key)
+        return self.link_index[key]
+
+    def link(self, key):
+        return self.links.block(self._link_index(key))
+
+    def link_addresses(self, key):
+        # Addresses of both ends of a point-to-point link as "addr/len"
+        first = self.links.base(self._link_index(key)) + self.first_host
+        prefixlen = self.links.prefixlen
+        return f"{ip_address(first)}/{prefixlen}", f"{ip_address(first + 1)}/{prefixlen}"
+
+    def _legacy(self, asn):
+        if asn in self.legacy_ases:
+            return ip_network(f"10.{asn}.0.0/16")
+        if not self.legacy_asn or not 0 < asn <= 255 or asn in self.ixes:
+            return None
+        net = ip_network(f"10.{asn}.0.0/16")
+        if any(net.overlaps(pool) for pool in self.links.networks + self.ases.networks):
+            return None
+        self.legacy_ases.add(asn)
+        return net
+
+    def ix_network(self, ix):
+        # seedemu places IX networks at 10.<ix>.0.0/24, keep ASes out of it
+        if ix in self.legacy_ases:
+            raise Exception(f"IX {ix} collides with the networks of AS {ix}")
+        if ix not in self.ixes:
+            self.ixes.append(ix)
+        return f"10.{ix}.0.0/24"
+
+    def _as_blocks(self, asn, count):
+        # Indices of the first `count` blocks of an AS, allocated on demand
+        key = str(asn)
+        blocks = self.as_index.setdefault(key, [])
+        while len(blocks) < count:
+            if len(self.as_keys) >= self.ases.capacity:
+                raise Exception(f"Address pools {self.ases.prefixes} exhausted")
+            blocks.append(len(self.as_keys))
+            self.as_keys.append(key)
+        return blocks
+
+    def as_block(self, asn):
+        legacy = self._legacy(asn)
+        if legacy is not None:
+            return legacy
+        return self.ases.block(self._as_blocks(asn, 1)[0])
+
+    def network(self, asn, net=0):
+        if self._legacy(asn) is not None:
+            if net > 255:
+                raise Exception(f"AS {asn} has no room for network {net}")
+            return str(ip_network(f"10.{asn}.{net}.0/24"))
+        per_block = 2 ** (self.net_prefixlen - self.ases.prefixlen)
+        block = self.ases.block(self._as_blocks(asn, net // per_block + 1)[net // per_block])
+        size = 2 ** (block.max_prefixlen - self.net_prefixlen)
+        return str(ip_network((int(block.network_address) + net % per_block * size, self.net_prefixlen)))
+
+    def host_address(self, asn, net=0, offset=30):
+        return str(ip_network(self.network(asn, net))[offset])
+
+    def to_dict(self):
+        return {
+            "link_pools": self.links.prefixes,
+            "link_prefixlen": self.links.prefixlen,
+            "reserve_gateway": self.reserve_gateway,
+            "as_pools": self.ases.prefixes,
+            "as_prefixlen": self.ases.prefixlen,
+            "net_prefixlen": self.net_prefixlen,
+            "legacy_asn": self.legacy_asn,
+            "links": self.link_keys,
+            "ases": self.as_keys,
+            "ixes": self.ixes,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        plan = cls(link_pools=data["link_pools"], link_prefixlen=data["link_prefixlen"],
+                   reserve_gateway=data["reserve_gateway"], as_pools=data["as_pools"],
+                   as_prefixlen=data["as_prefixlen"], net_prefixlen=data["net_prefixlen"],
+                   legacy_asn=data["legacy_asn"])
+        plan.link_keys = list(data["links"])
+        plan.link_index = {key: i for i, key in enumerate(plan.link_keys)}
+        plan.as_keys = list(data["ases"])
+        for i, key in enumerate(plan.as_keys):
+            plan.as_index.setdefault(key, []).append(i)
+        plan.ixes = list(data["ixes"])
+        return plan
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        # Reuse the plan stored at `path`, or start a new one
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                return cls.from_dict(json.load(f))
+        return cls(**kwargs)
@@ -0,0 +1,119 @@
+import json
+import time
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from seedtest.readiness import CS_METRICS_PORT, _metric_values, _metrics, parse_container_name
+
+
+# Beaconing load of the control services of a running SCION network, to pick
+# control-service placement and beaconing intervals (CONTROL_SERVICES and
+# BEACONING in config.yaml, see seedtest/topology.py) that keep convergence
+# fast without overloading the emulation host:
+#
+#   load = BeaconLoad(session.ctrs)
+#   report = load.measure(60)
+#   load.save("beacon-load.json", report)
+#
+# Every control service is sampled at the start and the end of the window:
+# the beaconing counters of its Prometheus metrics, the size of its beacon
+# (PCB) database and the CPU time of its container from its cgroup. Per AS
+# the report holds beacon messages per second by kind, the database size at
+# the end and the CPU used by its control services, as a share of one CPU:
+#
+#   {"as": 150, "control_services": 2, "beacons_per_s": {"received": 4.2, ...}, "pcb_db_bytes": 4096, "cpu": 0.03}
+#
+# Everything is read with docker exec, so sharded networks are covered too.
+
+BEACON_METRICS = {
+    "received": "control_beaconing_received_beacons_total",
+    "originated": "control_beaconing_originated_beacons_total",
+    "propagated": "control_beaconing_propagated_beacons_total",
+    "registered": "control_beaconing_registered_segments_total",
+}
+
+# seedemu keeps the databases of a control service in /cache
+BEACON_DB = "/cache/*beacon.db*"
+CPU_STAT = "/sys/fs/cgroup/cpu.stat"
+
+
+def _exec(ctr, script):
+    ec, output = ctr.exec_run(["sh", "-c", script])
+    return output.decode("utf8") if ec == 0 else ""
+
+
+def sample(ctr, port=CS_METRICS_PORT, db=BEACON_DB):
+    # Beaconing counters, beacon database bytes and CPU microseconds of one
+    # control service container
+    metrics = _metrics(ctr, port) or ""
+    beacons = {kind: sum(_metric_values(metrics, name)) for kind, name in BEACON_METRICS.items()}
+    db_bytes = sum(int(size) for size in _exec(ctr, f"stat -c %s {db} 2>/dev/null").split())
+    cpu_us = None
+    for line in _exec(ctr, f"cat {CPU_STAT}").splitlines():
+        if line.startswith("usage_usec "):
+            cpu_us = int(line.split()[1])
+    return {"t": time.monotonic(), "beacons": beacons, "db_bytes": db_bytes, "cpu_us": cpu_us,
+            "metrics": bool(metrics)}
+
+
+class BeaconLoad:
+    def __init__(self, ctrs, port=CS_METRICS_PORT, db=BEACON_DB, workers=32):
+        # ctrs: container name -> container, control services are picked out
+        self.port = port
+        self.db = db
+        self.workers = workers
+        self.services = {}  # name -> (asn, container)
+        for name, ctr in ctrs.items():
+            parsed = parse_container_name(name)
+            if parsed is not None and parsed[1] == "cs":
+                self.services[name] = (parsed[0], ctr)
+
+    def sample(self):
+        names = sorted(self.services)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            samples = pool.map(lambda name: sample(self.services[name][1], self.port, self.db), names)
+            return dict(zip(names, samples))
+
+    def measure(self, seconds):
+        # Per AS load over a window of `seconds`
+        start = self.sample()
+        time.sleep(seconds)
+        return self.report(start, self.sample())
+
+    def report(self, start, end):
+        ases = defaultdict(lambda: {"control_services": 0, "beacons_per_s": defaultdict(float), "pcb_db_bytes": 0,
+                                    "cpu": 0.0, "missing_metrics": 0})
+        for name, (asn, _) in self.services.items():
+            before, after = start[name], end[name]
+            seconds = after["t"] - before["t"]
+            entry = ases[asn]
+            entry["control_services"] += 1
+            for kind in BEACON_METRICS:
+                entry["beacons_per_s"][kind] += (after["beacons"][kind] - before["beacons"][kind]) / seconds
+            entry["pcb_db_bytes"] += after["db_bytes"]
+            if before["cpu_us"] is not None and after["cpu_us"] is not None:
+                entry["cpu"] += (after["cpu_us"] - before["cpu_us"]) / 1e6 / seconds
+            if not after["metrics"]:
+                entry["missing_metrics"] += 1
+        result = []
+        for asn, entry in sorted(ases.items()):
+            entry["beacons_per_s"] = {kind: round(rate, 3) for kind, rate in entry["beacons_per_s"].items()}
+            entry["cpu"] = round(entry["cpu"], 4)
+            result.append({"as": asn, **entry})
+        return result
+
+    def save(self, path, report, **extra):
+        with open(path, "w") as f:
+            json.dump({**extra, "ases": report}, f, indent=2)
+
+
+def print_report(report):
+    print(f"{'AS':>6} {'CS':>3} {'recv/s':>8} {'orig/s':>8} {'prop/s':>8} {'reg/s':>8} {'PCB DB':>10} {'CPU':>7}")
+    for entry in report:
+        rates = entry["beacons_per_s"]
+        print(f"{entry['as']:>6} {entry['control_services']:>3} {rates['received']:>8.2f} {rates['originated']:>8.2f} "
+              f"{rates['propagated']:>8.2f} {rates['registered']:>8.2f} {entry['pcb_db_bytes'] / 1024:>8.0f} K "
+              f"{entry['cpu'] * 100:>6.1f}%")
+    total = sum(entry["cpu"] for entry in report)
+    print(f"Control services use {total:.2f} CPUs in total")
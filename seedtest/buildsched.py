@@ -0,0 +1,344 @@
+import hashlib
+import heapq
+import json
+import os
+import subprocess
+import threading
+import time
+
+import yaml
+
+from seedtest.incremental import COMPOSE_FILE, hash_tree
+
+
+# Image build scheduler for the compose files generated by seedemu. Every
+# service is hashed by its Dockerfile and the files it copies, services with
+# the same hash share one image, and every distinct image is built once with
+# `docker build`. Images are tagged by content hash (of the build context and
+# of the images they start FROM) and the tags are written to the compose file,
+# so `compose up` uses them and images that already exist are not built again.
+# Base images referenced by name keep their name as a second tag, which is
+# moved to the image of the current content.
+#
+# seedemu node images start FROM the base images of its "dummy" services, so
+# images are built in dependency order. Images are started by priority: the
+# longest (estimated or previously measured) build time down the dependency
+# chain first, so the heavy builds on the critical path do not end up last.
+# Parallelism is bounded by cores and available memory; builds with heavy
+# RUN commands (compiling, package installs) have a lower limit of their own.
+
+HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".cache", "seed_test", "build-times.json")
+
+# Build memory budget per parallel build
+BUILD_MEMORY = 1 << 30
+
+# Estimated seconds of a RUN command containing these words
+HEAVY_COMMANDS = {
+    "go build": 120, "go install": 120, "cargo build": 180, "make": 60, "gcc": 30,
+    "apt-get install": 30, "apt install": 30, "apk add": 10, "pip install": 20, "git clone": 10,
+}
+RUN_COST = 1
+COPY_COST = 0.1
+HEAVY_THRESHOLD = 30
+
+
+def _memory_available():
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_workers():
+    workers = os.cpu_count() or 1
+    memory = _memory_available()
+    if memory is not None:
+        workers = min(workers, max(1, memory // BUILD_MEMORY))
+    return workers
+
+
+def _instructions(dockerfile):
+    # Dockerfile instructions with line continuations joined
+    instructions = []
+    current = ""
+    with open(dockerfile, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not current and (not line.strip() or line.lstrip().startswith("#")):
+                continue
+            if line.endswith("\\"):
+                current += line[:-1] + " "
+                continue
+            current += line
+            keyword, _, args = current.strip().partition(" ")
+            instructions.append((keyword.upper(), args.strip()))
+            current = ""
+    if current.strip():
+        keyword, _, args = current.strip().partition(" ")
+        instructions.append((keyword.upper(), args.strip()))
+    return instructions
+
+
+class Image:
+    def __init__(self, key, context, dockerfile, instructions):
+        self.key = key
+        self.context = context
+        self.dockerfile = dockerfile
+        self.services = []
+        self.tag = None
+        self.name = None
+        self.parents = set()
+        self.children = set()
+        self.bases = [args.split()[0] for kw, args in instructions if kw == "FROM" and args]
+        self.estimate = 0.0
+        for kw, args in instructions:
+            if kw == "RUN":
+                self.estimate += RUN_COST + sum(cost for cmd, cost in HEAVY_COMMANDS.items() if cmd in args)
+            elif kw in ("COPY", "ADD"):
+                self.estimate += COPY_COST
+        self.heavy = self.estimate >= HEAVY_THRESHOLD
+        self.priority = 0.0
+        self.seconds = None
+        self.cached = False
+        self.exit_code = None
+        self.output = ""
+
+
+def _service_build(root, service):
+    build = service["build"]
+    if isinstance(build, str):
+        context, dockerfile = build, "Dockerfile"
+    else:
+        context, dockerfile = build.get("context", "."), build.get("dockerfile", "Dockerfile")
+    context = os.path.normpath(os.path.join(root, context))
+    return context, os.path.join(context, dockerfile)
+
+
+def hash_build(context, dockerfile, instructions):
+    # Hash of the Dockerfile and every local file it copies
+    h = hashlib.sha256()
+    with open(dockerfile, "rb") as f:
+        h.update(f.read())
+    for kw, args in instructions:
+        if kw not in ("COPY", "ADD"):
+            continue
+        sources = [a for a in args.split() if not a.startswith("--")][:-1]
+        if any(a.startswith("--from") for a in args.split()):
+            continue
+        for src in sources:
+            path = os.path.join(context, src)
+            if os.path.exists(path):
+                h.update(src.encode())
+                h.update(b"\0")
+                h.update(hash_tree(path).encode())
+    return h.hexdigest()
+
+
+class BuildScheduler:
+    def __init__(self, output, workers=None, heavy_workers=None, prefix="seedtest", history=HISTORY_FILE,
+                 docker="docker", host=None, compose_file=COMPOSE_FILE):
+        # host: Docker engine to build on (docker -H), default the local one
+        self.output = os.path.abspath(output)
+        self.compose_path = os.path.join(self.output, compose_file)
+        self.workers = workers or default_workers()
+        self.heavy_workers = heavy_workers or max(1, self.workers // 4)
+        self.prefix = prefix
+        self.history_path = history
+        self.docker = [docker] + (["-H", host] if host else [])
+        self.history = {}
+        if history and os.path.exists(history):
+            with open(history, "r") as f:
+                self.history = json.load(f)
+        with open(self.compose_path, "r") as f:
+            self.compose = yaml.safe_load(f)
+        self.images = self._group()
+
+    def _group(self):
+        images = {}
+        for name, service in self.compose.get("services", {}).items():
+            if "build" not in service:
+                continue
+            context, dockerfile = _service_build(self.output, service)
+            instructions = _instructions(dockerfile)
+            key = hash_build(context, dockerfile, instructions)
+            if key not in images:
+                images[key] = Image(key, context, dockerfile, instructions)
+            image = images[key]
+            image.services.append(name)
+            # Images referenced by name (the seedemu base images) keep it;
+            # tags written by tag_compose are not names
+            tag = service.get("image")
+            if tag and not tag.startswith(f"{self.prefix}/") and image.name is None:
+                image.name = tag
+        by_name = {image.name: image for image in images.values() if image.name}
+        for image in images.values():
+            for base in image.bases:
+                parent = by_name.get(base) or by_name.get(base.split(":")[0])
+                if parent is not None and parent is not image:
+                    image.parents.add(parent.key)
+                    parent.children.add(image.key)
+        self._tag(images)
+        self._prioritize(images)
+        return images
+
+    def _tag(self, images):
+        # Content tag of every image, including the tags of its parents, so a
+        # changed base image changes the tags of everything built FROM it
+        def tag(image):
+            if image.tag is None:
+                h = hashlib.sha256(image.key.encode())
+                for parent in sorted(tag(images[p]) for p in image.parents):
+                    h.update(parent.encode())
+                image.tag = f"{self.prefix}/{h.hexdigest()[:24]}"
+            return image.tag
+        for image in images.values():
+            tag(image)
+
+    def _cost(self, image):
+        return self.history.get(image.key, image.estimate)
+
+    def _prioritize(self, images):
+        # Longest build time from the image down to the end of its dependency chain
+        done = {}
+
+        def priority(key):
+            if key not in done:
+                done[key] = None
+                image = images[key]
+                done[key] = self._cost(image) + max((priority(c) or 0 for c in image.children), default=0)
+            return done[key]
+        for key, image in images.items():
+            image.priority = priority(key)
+
+    def _existing(self):
+        result = subprocess.run(self.docker + ["images", "--format", "{{.Repository}}:{{.Tag}}"],
+                                capture_output=True, text=True)
+        existing = set()
+        for line in result.stdout.split():
+            existing.add(line)
+            if line.endswith(":latest"):
+                existing.add(line[:-len(":latest")])
+        return existing
+
+    def _build(self, image):
+        start = time.monotonic()
+        names = ["-t", image.name] if image.name else []
+        result = subprocess.run(self.docker + ["build", "-t", image.tag] + names + ["-f", image.dockerfile, image.context],
+                                capture_output=True, text=True, env=dict(os.environ, DOCKER_BUILDKIT="1"))
+        image.seconds = time.monotonic() - start
+        image.exit_code = result.returncode
+        image.output = (result.stdout + result.stderr)[-4000:]
+
+    def run(self, rebuild=False):
+        # Builds every image that is missing (all with `rebuild`) and tags the
+        # compose services. Returns the images by key.
+        existing = set() if rebuild else self._existing()
+        pending = {}
+        ready = []
+        for key, image in self.images.items():
+            if image.tag in existing:
+                image.cached = True
+                if image.name:
+                    # The name may still point at the image of other content
+                    subprocess.run(self.docker + ["tag", image.tag, image.name], capture_output=True)
+                continue
+            pending[key] = {p for p in image.parents if not self.images[p].cached}
+        for key, parents in pending.items():
+            if not parents:
+                heapq.heappush(ready, (-self.images[key].priority, key))
+
+        lock = threading.Condition()
+        running = {"all": 0, "heavy": 0}
+        failed = []
+
+        def worker(image):
+            try:
+                self._build(image)
+            finally:
+                with lock:
+                    running["all"] -= 1
+                    running["heavy"] -= image.heavy
+                    if image.exit_code != 0:
+                        failed.append(image)
+                    else:
+                        for child in image.children:
+                            if child in pending:
+                                pending[child].discard(image.key)
+                                if not pending[child]:
+                                    heapq.heappush(ready, (-self.images[child].priority, child))
+                    del pending[image.key]
+                    lock.notify_all()
+
+        threads = []
+        with lock:
+            while pending and not failed:
+                started = False
+                deferred = []
+                while ready and running["all"] < self.workers:
+                    priority, key = heapq.heappop(ready)
+                    image = self.images[key]
+                    if image.heavy and running["heavy"] >= self.heavy_workers:
+                        deferred.append((priority, key))
+                        continue
+                    running["all"] += 1
+                    running["heavy"] += image.heavy
+                    thread = threading.Thread(target=worker, args=(image,))
+                    thread.start()
+                    threads.append(thread)
+                    started = True
+                for item in deferred:
+                    heapq.heappush(ready, item)
+                if not started or running["all"] >= self.workers or not ready:
+                    lock.wait()
+        for thread in threads:
+            thread.join()
+        if failed:
+            raise Exception(f"Building {failed[0].tag} for {failed[0].services[0]} failed:\n{failed[0].output}")
+
+        self._save_history()
+        self.tag_compose()
+        return self.images
+
+    def _save_history(self):
+        if not self.history_path:
+            return
+        for image in self.images.values():
+            if image.seconds is not None:
+                self.history[image.key] = image.seconds
+        os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+        with open(self.history_path, "w") as f:
+            json.dump(self.history, f)
+
+    def tag_compose(self):
+        # Point every service at its image, so compose up does not build
+        for image in self.images.values():
+            for name in image.services:
+                self.compose["services"][name]["image"] = image.name or image.tag
+        with open(self.compose_path, "w") as f:
+            yaml.safe_dump(self.compose, f, default_flow_style=False, sort_keys=False)
+
+    def report(self):
+        rows = [{"tag": image.tag, "services": len(image.services), "heavy": image.heavy,
+                 "cached": image.cached, "seconds": image.seconds}
+                for image in self.images.values()]
+        return sorted(rows, key=lambda r: -(r["seconds"] or 0))
+
+    def print_report(self, top=10):
+        rows = self.report()
+        built = [r for r in rows if r["seconds"] is not None]
+        services = sum(r["services"] for r in rows)
+        print(f"{len(rows)} images for {services} services, {len(built)} built, "
+              f"{sum(r['cached'] for r in rows)} cached, {sum(r['seconds'] for r in built):.1f} s build time")
+        for r in built[:top]:
+            print(f"  {r['seconds']:7.1f} s  {r['tag']} ({r['services']} services{', heavy' if r['heavy'] else ''})")
+
+
+def build(output, rebuild=False, **kwargs):
+    scheduler = BuildScheduler(output, **kwargs)
+    scheduler.run(rebuild)
+    scheduler.print_report()
+    return scheduler
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import urllib.request
+
+
+GO_DOWNLOAD_URL = "https://golang.org/dl/{}"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "seed_test", "bundles")
+
+
+class GoToolchain:
+    def __init__(self, version, sha256, arch="linux-amd64"):
+        self.version = version
+        self.sha256 = sha256
+        self.arch = arch
+
+    @property
+    def archive(self):
+        return f"go{self.version}.{self.arch}.tar.gz"
+
+
+class SoftwareBundle:
+    # A Go program that is cloned and compiled once on the build machine and
+    # then copied into every host that needs it. `binaries` maps the name of
+    # each produced binary to the source files passed to `go build`.
+    def __init__(self, name, repo, toolchain, binaries, commit=None, install_dir=None):
+        self.name = name
+        self.repo = repo
+        self.toolchain = toolchain
+        self.binaries = binaries
+        self.commit = commit
+        self.install_dir = install_dir or f"/{name}"
+
+    def key(self, commit):
+        # Content hash of everything that determines the build output
+        desc = {
+            "name": self.name,
+            "go": [self.toolchain.version, self.toolchain.sha256, self.toolchain.arch],
+            "repo": self.repo,
+            "commit": commit,
+            "binaries": self.binaries,
+        }
+        return hashlib.sha256(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+
+
+GO_1_25_1 = GoToolchain("1.25.1", "7716a0d940a0f6ae8e1f3b3f4f36299dc53e31b16840dbd171254312c41ca12e")
+
+SCION_FAST_FAILOVER = SoftwareBundle(
+    "scion-fast-failover", "https://github.com/aaronbojarski/scion-fast-failover.git", GO_1_25_1,
+    {"fast-failover": ["fast-failover.go", "server.go", "client.go"]})
+
+IP_FAILOVER = SoftwareBundle(
+    "ip-failover", "https://github.com/aaronbojarski/ip-failover.git", GO_1_25_1,
+    {"ip-failover": ["ip-failover.go", "server.go", "client.go"]})
+
+SCION_TIME = SoftwareBundle(
+    "scion-time", "https://github.com/marcfrei/scion-time.git", GO_1_25_1,
+    {"timeservice": ["timeservice.go", "timeservice_t.go"]})
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BundleCache:
+    # Artifacts are stored under <cache_dir>/artifacts/<key>. A bundle whose key
+    # already has an artifact directory is never rebuilt.
+    #
+    # With `mirror` set, nothing is downloaded: the Go archive is taken from
+    # <mirror>/<archive>, repositories are cloned from <mirror>/<repo name>.git
+    # and Go modules are resolved from <mirror>/goproxy (if present).
+    def __init__(self, cache_dir=None, mirror=None):
+        self.cache_dir = os.path.abspath(cache_dir or DEFAULT_CACHE_DIR)
+        self.mirror = os.path.abspath(mirror) if mirror else None
+        self.built = {}
+        self.commits = {}
+
+    def _source(self, repo):
+        if self.mirror is None:
+            return repo
+        name = os.path.basename(repo.rstrip("/"))
+        if not name.endswith(".git"):
+            name += ".git"
+        return os.path.join(self.mirror, name)
+
+    def resolve_commit(self, bundle):
+        if bundle.commit is not None:
+            return bundle.commit
+        if bundle.repo not in self.commits:
+            out = subprocess.run(["git", "ls-remote", self._source(bundle.repo), "HEAD"],
+                                 check=True, capture_output=True, text=True).stdout
+            if not out:
+                raise Exception(f"Could not resolve HEAD of {bundle.repo}")
+            self.commits[bundle.repo] = out.split()[0]
+        return self.commits[bundle.repo]
+
+    def toolchain(self, tc):
+        goroot = os.path.join(self.cache_dir, "toolchains", f"go{tc.version}.{tc.arch}")
+        if os.path.exists(os.path.join(goroot, "go", "bin", "go")):
+            return os.path.join(goroot, "go")
+
+        if self.mirror is not None:
+            archive = os.path.join(self.mirror, tc.archive)
+        else:
+            archive = os.path.join(self.cache_dir, "downloads", tc.archive)
+            if not os.path.exists(archive):
+                os.makedirs(os.path.dirname(archive), exist_ok=True)
+                urllib.request.urlretrieve(GO_DOWNLOAD_URL.format(tc.archive), archive + ".part")
+                os.replace(archive + ".part", archive)
+        if _sha256_file(archive) != tc.sha256:
+            raise Exception(f"Checksum mismatch for {archive}")
+
+        os.makedirs(os.path.dirname(goroot), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(goroot))
+        with tarfile.open(archive) as tar:
+            tar.extractall(tmp)
+        os.replace(tmp, goroot)
+        return os.path.join(goroot, "go")
+
+    def build(self, bundle):
+        commit = self.resolve_commit(bundle)
+        key = bundle.key(commit)
+        if key in self.built:
+            return self.built[key]
+        artifact_dir = os.path.join(self.cache_dir, "artifacts", key)
+        if os.path.exists(os.path.join(artifact_dir, "bundle.json")):
+            self.built[key] = artifact_dir
+            return artifact_dir
+
+        goroot = self.toolchain(bundle.toolchain)
+        env = dict(os.environ)
+        env.update({
+            "GOROOT": goroot,
+            "GOPATH": os.path.join(self.cache_dir, "gopath"),
+            "GOMODCACHE": os.path.join(self.cache_dir, "gomod"),
+            "GOCACHE": os.path.join(self.cache_dir, "gocache"),
+            "CGO_ENABLED": "0",
+            "GOOS": "linux",
+            "GOARCH": bundle.toolchain.arch.split("-")[1],
+        })
+        if self.mirror is not None:
+            goproxy = os.path.join(self.mirror, "goproxy")
+            env["GOPROXY"] = f"file://{goproxy}" if os.path.isdir(goproxy) else "off"
+
+        os.makedirs(os.path.dirname(artifact_dir), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(artifact_dir))
+        try:
+            src = os.path.join(tmp, "src")
+            subprocess.run(["git", "clone", "--quiet", self._source(bundle.repo), src], check=True)
+            subprocess.run(["git", "-C", src, "checkout", "--quiet", commit], check=True)
+            for binary, files in bundle.binaries.items():
+                subprocess.run([os.path.join(goroot, "bin", "go"), "build", "-o", os.path.join(tmp, binary)] + files,
+                               cwd=src, env=env, check=True)
+            shutil.rmtree(src)
+            with open(os.path.join(tmp, "bundle.json"), "w") as f:
+                json.dump({"name": bundle.name, "repo": bundle.repo, "commit": commit,
+                           "go": bundle.toolchain.version, "binaries": list(bundle.binaries)}, f, indent=2)
+            os.replace(tmp, artifact_dir)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.built[key] = artifact_dir
+        return artifact_dir
+
+    def install(self, host, bundle):
+        # Copy the prebuilt binaries into the node instead of building in the image
+        artifact_dir = self.build(bundle)
+        for binary in bundle.binaries:
+            path = f"{bundle.install_dir}/{binary}"
+            host.importFile(os.path.join(artifact_dir, binary), path)
+            host.appendStartCommand(f"chmod +x {path}")
+        return host
+
+
+class PlaceholderBundles(BundleCache):
+    # Installs a placeholder script for every binary instead of the built
+    # program: nothing is cloned, downloaded or compiled, for renders and
+    # compiles whose images are never run (seedtest.scaling)
+    def build(self, bundle):
+        artifact_dir = os.path.join(self.cache_dir, "placeholders", bundle.name)
+        if bundle.name not in self.built:
+            os.makedirs(artifact_dir, exist_ok=True)
+            for binary in bundle.binaries:
+                with open(os.path.join(artifact_dir, binary), "w") as f:
+                    f.write(f"#!/bin/sh\necho '{bundle.name} placeholder, not built' >&2\nexit 1\n")
+            self.built[bundle.name] = artifact_dir
+        return artifact_dir
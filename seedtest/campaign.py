@@ -0,0 +1,155 @@
+import csv
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from seedtest.paths import links_of
+from seedtest.readiness import parse_container_name
+
+
+BWTEST_PORT = 40002
+
+RESULT_SECTION = re.compile(r"^(S->C|C->S) results")
+BANDWIDTH = re.compile(r"^(Attempted|Achieved) bandwidth: (\d+) bps")
+LOSS = re.compile(r"^Loss rate: ([\d.]+)\s*%")
+INTERARRIVAL = re.compile(r"^Interarrival time min/avg/max/mdev = ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms")
+
+RESULT_FIELDS = ["round", "client", "server", "direction", "attempted_bps", "achieved_bps",
+                 "loss_percent", "interarrival_avg_ms", "exit_code", "duration_s"]
+
+
+class BwtestEndpoint:
+    def __init__(self, ia, address, ctr, port=BWTEST_PORT):
+        self.ia = ia
+        self.address = address
+        self.ctr = ctr
+        self.port = port
+
+    @property
+    def server(self):
+        return f"{self.ia},{self.address}:{self.port}"
+
+
+def find_endpoints(ctrs, node="bwtest", isd=1, ports=None):
+    # Every host container called `node` runs a bandwidth test server
+    endpoints = []
+    for name, ctr in sorted(ctrs.items()):
+        parsed = parse_container_name(name)
+        if parsed is None or parsed[1:] != ("h", node):
+            continue
+        asn = parsed[0]
+        address = name.rsplit("-", 1)[1]
+        endpoints.append(BwtestEndpoint(f"{isd}-{asn}", address, ctr, (ports or {}).get(asn, BWTEST_PORT)))
+    return endpoints
+
+
+def parse_bwtest(output):
+    # Per-direction results of a scion-bwtestclient run
+    results = {}
+    current = None
+    for line in output.splitlines():
+        line = line.strip()
+        m = RESULT_SECTION.match(line)
+        if m:
+            current = results.setdefault(m.group(1), {})
+            continue
+        if current is None:
+            continue
+        m = BANDWIDTH.match(line)
+        if m:
+            current[f"{m.group(1).lower()}_bps"] = int(m.group(2))
+            continue
+        m = LOSS.match(line)
+        if m:
+            current["loss_percent"] = float(m.group(1))
+            continue
+        m = INTERARRIVAL.match(line)
+        if m:
+            current["interarrival_avg_ms"] = float(m.group(2))
+    return results
+
+
+def _pairings(n):
+    # Round-robin tournament (circle method): n - 1 rounds (n if odd) in which
+    # every index appears at most once and every unordered pair exactly once
+    ids = list(range(n)) + ([None] if n % 2 else [])
+    rounds = []
+    for _ in range(len(ids) - 1):
+        half = len(ids) // 2
+        rounds.append([(a, b) for a, b in zip(ids[:half], reversed(ids[half:])) if a is not None and b is not None])
+        ids = [ids[0], ids[-1]] + ids[1:-1]
+    return rounds
+
+
+def schedule(endpoints, links=None):
+    # Groups all ordered (client, server) pairs into rounds in which no
+    # endpoint takes part in two tests and, if `links(client, server)` gives
+    # the links a test traverses, no two tests share a link.
+    pending = []
+    for pairing in _pairings(len(endpoints)):
+        pending += [(endpoints[a], endpoints[b]) for a, b in pairing]
+        pending += [(endpoints[b], endpoints[a]) for a, b in pairing]
+    pending = [(client, server, set(links(client, server)) if links else set()) for client, server in pending]
+    rounds = []
+    while pending:
+        used = set()
+        used_links = set()
+        current = []
+        remaining = []
+        for client, server, test_links in pending:
+            if client.ia in used or server.ia in used or test_links & used_links:
+                remaining.append((client, server, test_links))
+                continue
+            used.update((client.ia, server.ia))
+            used_links |= test_links
+            current.append((client, server))
+        rounds.append(current)
+        pending = remaining
+    return rounds
+
+
+def predicted_links(predictor):
+    # links(client, server) for schedule(): the AS links of the shortest path
+    # a seedtest.paths.PathPredictor predicts between the two ASes
+    def links(client, server):
+        paths = predictor.predict(int(client.ia.split("-")[1]), int(server.ia.split("-")[1]))
+        return links_of(paths[0]) if paths else set()
+    return links
+
+
+class Campaign:
+    # Runs the full client x server bwtest matrix in interference-free rounds
+    def __init__(self, endpoints, links=None, workers=16, args=""):
+        self.endpoints = endpoints
+        self.rounds = schedule(endpoints, links)
+        self.workers = workers
+        self.args = args
+        self.results = []
+
+    def _run(self, round_id, client, server):
+        start = time.monotonic()
+        ec, output = client.ctr.exec_run(f"scion-bwtestclient -s {server.server} {self.args}".strip())
+        duration = time.monotonic() - start
+        parsed = parse_bwtest(output.decode("utf8"))
+        rows = []
+        for direction in ("C->S", "S->C"):
+            row = {"round": round_id, "client": client.ia, "server": server.ia, "direction": direction,
+                   "exit_code": ec, "duration_s": round(duration, 3)}
+            row.update(parsed.get(direction, {}))
+            rows.append(row)
+        return rows
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for round_id, tests in enumerate(self.rounds):
+                print(f"Round {round_id + 1}/{len(self.rounds)}: {len(tests)} tests")
+                for rows in pool.map(lambda test: self._run(round_id, *test), tests):
+                    self.results += rows
+        return self.results
+
+    def save(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.results)
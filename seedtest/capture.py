@@ -0,0 +1,316 @@
+import json
+import math
+import os
+import shutil
+import signal
+import struct
+import subprocess
+
+from seedtest.faults import parse_link
+
+
+# Triggered, bounded packet capture on link interfaces. Captures are armed on
+# the link ends of the faulted links right before a fault schedule runs and
+# frozen after it, and every capture is a tcpdump ring buffer of `files` files
+# of `size_mb` MB in a tmpfs (/dev/shm), so memory use per link end is fixed
+# and nothing is written to disk while the experiment runs. Only headers are
+# captured (snaplen), which is enough to decode the SCION header, BFD and SCMP.
+# With a `window` (seconds of capture needed, pre + post) the rings of link
+# ends with a BANDWIDTH are sized to hold that long at full rate; timelines
+# of rings that wrapped before fault - pre are marked "truncated".
+#
+#   capture = LinkCapture(index, window=pre + post)
+#   capture.arm(links_of(faults_yaml["faults"]))
+#   time.sleep(pre)
+#   records = FaultScheduler(index, ...).run()
+#   time.sleep(post)
+#   capture.freeze()
+#   capture.export("capture/<run>")
+#   timelines = capture.timelines(records, pre=2.0, post=5.0)
+#
+# tcpdump runs on the host in the network namespace of the router container
+# (nsenter), so the images need no capture tools. This needs root and tcpdump
+# on the host, like the cgroup reads of seedtest.telemetry.
+#
+# Timelines hold, per link end and relative to the first fault, BFD state
+# changes, SCMP messages (e.g. external interface down), the SCION path
+# (interface IDs of the hop fields) of every flow whenever it changes, and
+# gaps in BFD or data traffic:
+#
+#   {"t": 0.0123, "dir": "in", "kind": "scmp", "type": "external_interface_down", "src": "1-156", ...}
+
+RING_DIR = "/dev/shm/seedtest-capture"
+
+PCAP_MAGIC = {b"\xd4\xc3\xb2\xa1": ("<", 1000), b"\xa1\xb2\xc3\xd4": (">", 1000),
+              b"\x4d\x3c\xb2\xa1": ("<", 1), b"\xa1\xb2\x3c\x4d": (">", 1)}
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+
+# SCION next header values
+SCION_UDP = 17
+SCION_SCMP = 202
+SCION_BFD = 203
+
+SCMP_TYPES = {
+    1: "destination_unreachable", 2: "packet_too_big", 4: "parameter_problem",
+    5: "external_interface_down", 6: "internal_connectivity_down",
+    128: "echo_request", 129: "echo_reply", 130: "traceroute_request", 131: "traceroute_reply",
+}
+BFD_STATES = ("admin_down", "down", "init", "up")
+
+# Silence in seconds after which a gap event is recorded
+GAPS = {"bfd": 0.5, "data": 0.05}
+
+# Largest ring file in MB when sizing rings from the link rate
+MAX_FILE_MB = 64
+
+
+def links_of(faults):
+    # Links of a fault timeline, as (isd, asn, peer isd, peer asn)
+    return sorted({parse_link(fault["link"]) for fault in faults if "link" in fault})
+
+
+def read_pcap(path):
+    # (wall-clock ns, frame) of every complete record of a pcap file
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24 or header[:4] not in PCAP_MAGIC:
+            return
+        order, scale = PCAP_MAGIC[header[:4]]
+        linktype = struct.unpack(order + "I", header[20:24])[0]
+        while True:
+            record = f.read(16)
+            if len(record) < 16:
+                return
+            sec, frac, length, _ = struct.unpack(order + "IIII", record)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield sec * 1_000_000_000 + frac * scale, _ip_payload(data, linktype)
+
+
+def _ip_payload(frame, linktype):
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14 or frame[12:14] != b"\x08\x00":
+            return None
+        return frame[14:]
+    if linktype == LINKTYPE_RAW:
+        return frame
+    return None
+
+
+def format_ia(raw):
+    isd, asn = raw >> 48, raw & ((1 << 48) - 1)
+    if asn < 1 << 32:
+        return f"{isd}-{asn}"
+    return f"{isd}-{asn >> 32:x}:{(asn >> 16) & 0xffff:x}:{asn & 0xffff:x}"
+
+
+def decode(packet):
+    # SCION packet in an IPv4/UDP underlay packet, None for anything else
+    if packet is None or len(packet) < 20 or packet[0] >> 4 != 4 or packet[9] != 17:
+        return None
+    ihl = (packet[0] & 0x0f) * 4
+    src_ip = ".".join(str(b) for b in packet[12:16])
+    dst_ip = ".".join(str(b) for b in packet[16:20])
+    scion = packet[ihl + 8:]
+    if len(scion) < 28 or scion[0] >> 4 != 0:
+        return None
+    next_hdr, hdr_len, path_type = scion[4], scion[5] * 4, scion[8]
+    dl, sl = (scion[9] >> 4) & 0x3, scion[9] & 0x3
+    result = {
+        "underlay_src": src_ip,
+        "underlay_dst": dst_ip,
+        "dst": format_ia(struct.unpack(">Q", scion[12:20])[0]),
+        "src": format_ia(struct.unpack(">Q", scion[20:28])[0]),
+        "next_hdr": next_hdr,
+    }
+    path_start = 28 + (dl + 1) * 4 + (sl + 1) * 4
+    if path_type == 1 and len(scion) >= path_start + 4:
+        meta = struct.unpack(">I", scion[path_start:path_start + 4])[0]
+        segments = [(meta >> shift) & 0x3f for shift in (12, 6, 0)]
+        hops = []
+        offset = path_start + 4 + 8 * sum(1 for s in segments if s)
+        for _ in range(sum(segments)):
+            if len(scion) < offset + 12:
+                break
+            ingress, egress = struct.unpack(">HH", scion[offset + 2:offset + 6])
+            hops.append(f"{ingress}>{egress}")
+            offset += 12
+        result["path"] = " ".join(hops)
+    payload = scion[hdr_len:] if hdr_len <= len(scion) else b""
+    if next_hdr == SCION_BFD and len(payload) >= 2:
+        result["kind"] = "bfd"
+        result["state"] = BFD_STATES[payload[1] >> 6]
+    elif next_hdr == SCION_SCMP and len(payload) >= 2:
+        result["kind"] = "scmp"
+        result["type"] = SCMP_TYPES.get(payload[0], str(payload[0]))
+        result["code"] = payload[1]
+    else:
+        result["kind"] = "data"
+    return result
+
+
+def link_events(packets, local_address, gaps=GAPS):
+    # Events of one link end from (ns, decoded packet) in time order.
+    # Direction is "out" for packets sent by the local end.
+    events = []
+    last = {}
+    bfd_state = {}
+    paths = {}
+    for ns, p in packets:
+        direction = "out" if p["underlay_src"] == local_address else "in"
+        kind = p["kind"]
+        previous = last.get((direction, kind))
+        if previous is not None and kind in gaps and (ns - previous) / 1e9 > gaps[kind]:
+            events.append({"ns": previous, "dir": direction, "kind": f"{kind}_gap", "seconds": (ns - previous) / 1e9})
+        last[(direction, kind)] = ns
+        if kind == "bfd":
+            if bfd_state.get(direction) != p["state"]:
+                bfd_state[direction] = p["state"]
+                events.append({"ns": ns, "dir": direction, "kind": "bfd", "state": p["state"]})
+        elif kind == "scmp":
+            events.append({"ns": ns, "dir": direction, "kind": "scmp", "type": p["type"], "code": p["code"],
+                           "src": p["src"], "dst": p["dst"]})
+        elif "path" in p:
+            flow = (direction, p["src"], p["dst"])
+            if paths.get(flow) != p["path"]:
+                paths[flow] = p["path"]
+                events.append({"ns": ns, "dir": direction, "kind": "path", "src": p["src"], "dst": p["dst"],
+                               "path": p["path"]})
+    end = max(last.values(), default=None)
+    for (direction, kind), ns in last.items():
+        if kind in gaps and (end - ns) / 1e9 > gaps[kind]:
+            events.append({"ns": ns, "dir": direction, "kind": f"{kind}_last"})
+    return sorted(events, key=lambda e: e["ns"])
+
+
+class RingCapture:
+    # tcpdump ring buffer on one interface of a container
+    def __init__(self, ctr, iface, directory, size_mb=1, files=4, snaplen=256, bpf="udp"):
+        self.ctr = ctr
+        self.iface = iface
+        self.directory = directory
+        self.size_mb = size_mb
+        self.files = files
+        self.snaplen = snaplen
+        self.bpf = bpf
+        self.process = None
+
+    def start(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        self.ctr.reload()
+        pid = self.ctr.attrs["State"]["Pid"]
+        self.process = subprocess.Popen(
+            ["nsenter", "-t", str(pid), "-n", "tcpdump", "-i", self.iface, "-n", "-s", str(self.snaplen),
+             "-C", str(self.size_mb), "-W", str(self.files), "-Z", "root",
+             "-w", os.path.join(self.directory, "ring.pcap"), self.bpf],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return self
+
+    def stop(self):
+        # SIGINT makes tcpdump flush its buffer, the ring is frozen afterwards
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def ring_files(self):
+        # Files of the ring, oldest first
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        return sorted(paths, key=os.path.getmtime)
+
+    def packets(self):
+        for path in self.ring_files():
+            for ns, packet in read_pcap(path):
+                decoded = decode(packet)
+                if decoded is not None:
+                    yield ns, decoded
+
+
+def ring_size(shaping, window, files, size_mb=1, max_mb=MAX_FILE_MB):
+    # MB per ring file to keep `window` seconds at the rate (kbit/s) of the
+    # link end, with headroom for the pcap record headers
+    if not window or not (shaping or {}).get("rate"):
+        return size_mb
+    needed = shaping["rate"] * 1000 / 8 * window * 1.25 / files / (1 << 20)
+    return min(max(size_mb, math.ceil(needed)), max_mb)
+
+
+class LinkCapture:
+    def __init__(self, index, directory=RING_DIR, size_mb=1, files=4, snaplen=256, window=None):
+        self.index = index
+        self.directory = directory
+        self.size_mb = size_mb
+        self.files = files
+        self.snaplen = snaplen
+        self.window = window
+        self.captures = {}  # link end key -> RingCapture
+
+    def arm(self, links):
+        # Start ring captures on both ends of `links` ((isd, asn, peer isd,
+        # peer asn) tuples or "(isd,asn)-(isd,asn)" strings)
+        for link in links:
+            a_isd, a_asn, b_isd, b_asn = parse_link(link) if isinstance(link, str) else link
+            for key in ((a_isd, a_asn, b_isd, b_asn), (b_isd, b_asn, a_isd, a_asn)):
+                if key in self.captures:
+                    continue
+                ctr, iface = self.index.link_end(*key)
+                directory = os.path.join(self.directory, f"{ctr.name}-{iface}")
+                size_mb = ring_size(self.index.link(*key).get("shaping"), self.window, self.files, self.size_mb)
+                self.captures[key] = RingCapture(ctr, iface, directory, size_mb, self.files,
+                                                 self.snaplen).start()
+        return self
+
+    def freeze(self):
+        for capture in self.captures.values():
+            capture.stop()
+
+    def export(self, path):
+        # Copy the frozen rings to `path`, one directory per link end
+        for capture in self.captures.values():
+            target = os.path.join(path, os.path.basename(capture.directory))
+            shutil.rmtree(target, ignore_errors=True)
+            shutil.copytree(capture.directory, target)
+
+    def clear(self):
+        self.freeze()
+        for capture in self.captures.values():
+            shutil.rmtree(capture.directory, ignore_errors=True)
+        self.captures = {}
+
+    def timelines(self, records, pre=2.0, post=5.0, gaps=GAPS):
+        # Per link end events within [fault - pre, fault + post] of any fault
+        # record of seedtest.faults, times in seconds after the first fault.
+        # "kept_s" is how long before the first fault the ring reaches back.
+        starts = sorted(r["wall_ns"] for r in records)
+        origin = starts[0] if starts else 0
+        windows = [(s - int(pre * 1e9), s + int(post * 1e9)) for s in starts]
+        result = []
+        for (isd, asn, peer_isd, peer_asn), capture in sorted(self.captures.items()):
+            end = self.index.link(isd, asn, peer_isd, peer_asn)
+            local = (end.get("address") or "").split("/")[0]
+            oldest = next((ns for ns, _ in capture.packets()), None)
+            kept = (origin - oldest) / 1e9 if oldest is not None and starts else None
+            truncated = kept is not None and kept < pre
+            if truncated:
+                print(f"Warning: capture of {capture.ctr.name} {capture.iface} only reaches {kept:.2f} s "
+                      f"before the first fault, not {pre} s; increase the ring size")
+            events = []
+            for event in link_events(capture.packets(), local, gaps):
+                if not windows or any(lo <= event["ns"] <= hi for lo, hi in windows):
+                    event["t"] = round((event.pop("ns") - origin) / 1e9, 6)
+                    events.append(event)
+            result.append({"link": f"({isd},{asn})-({peer_isd},{peer_asn})", "container": capture.ctr.name,
+                           "iface": capture.iface, "kept_s": kept, "truncated": truncated, "events": events})
+        return result
+
+    def save(self, path, records, **kwargs):
+        with open(path, "w") as f:
+            json.dump(self.timelines(records, **kwargs), f, indent=2)
+
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from seedtest.readiness import ip_route
+
+
+# Control-plane reconvergence after a fault. A RouteMonitor polls a probe that
+# returns the routing state relevant to one destination and records every
+# change; the reconvergence time of a fault is the time from the fault to the
+# last change of that state:
+#
+#  - BGP: the route every router uses towards the destination host
+#    (BgpRoutes), so it covers withdrawals, path exploration and the final
+#    best path of all ASes,
+#  - SCION: the alive paths of the source host to the destination AS, fetched
+#    fresh from the control service and probed (scion_paths).
+#
+# The data-plane outage is what the failover client measures itself
+# (ReconnectTimes), see compare().
+
+
+class BgpRoutes:
+    # Probe: routes of all router containers towards address. Holds a thread
+    # pool for the lookups, close() it when done.
+    def __init__(self, routers, address, workers=32):
+        self.routers = routers
+        self.address = address
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def __call__(self):
+        routes = self.pool.map(lambda r: ip_route(r, self.address), self.routers)
+        return tuple(zip([r.name for r in self.routers], routes))
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def scion_paths(ctr, dst, max_paths=100):
+    # Probe: fingerprints of the alive paths from the host container to dst
+    def probe():
+        ec, output = ctr.exec_run(f"scion showpaths {dst} --refresh --format json -m {max_paths}")
+        if ec != 0:
+            return None
+        try:
+            paths = json.loads(output.decode("utf8")).get("paths") or []
+        except ValueError:
+            return None
+        return tuple(sorted(p.get("fingerprint") for p in paths if p.get("status", "alive") == "alive"))
+    return probe
+
+
+class RouteMonitor:
+    def __init__(self, probe, interval=0.1):
+        self.probe = probe
+        self.interval = interval
+        # (monotonic ns of the probe start, state) of every change
+        self.changes = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.changes = [(time.monotonic_ns(), self.probe())]
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            at = time.monotonic_ns()
+            state = self.probe()
+            if state != self.changes[-1][1]:
+                self.changes.append((at, state))
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def settle(self, since_ns, quiet=10.0, limit=300.0):
+        # Block until the state did not change for `quiet` seconds, at most
+        # `limit` seconds after since_ns, then stop. Returns True if settled.
+        while True:
+            now = time.monotonic_ns()
+            last = max(self.changes[-1][0], since_ns)
+            if now - last >= quiet * 1e9:
+                self.stop()
+                return True
+            if now - since_ns >= limit * 1e9:
+                self.stop()
+                return False
+            time.sleep(self.interval)
+
+    def convergence(self, since_ns):
+        # Seconds from since_ns to the last change after it, 0 if nothing changed
+        after = [at for at, _ in self.changes[1:] if at >= since_ns]
+        return (after[-1] - since_ns) / 1e9 if after else 0.0
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def compare(results):
+    # Aggregates result rows ({"scenario", "variant", "outage_s",
+    # "reconvergence_s", "settled", ...}) per scenario and variant. Rows
+    # with "failed" are only counted.
+    groups = {}
+    for r in results:
+        groups.setdefault((r["scenario"], r["variant"]), []).append(r)
+    report = []
+    for (scenario, variant), rows in groups.items():
+        runs = [r for r in rows if not r.get("failed")]
+        outages = [r["outage_s"] for r in runs]
+        settled = [r["reconvergence_s"] for r in runs if r["settled"]]
+        report.append({
+            "scenario": scenario,
+            "variant": variant,
+            "runs": len(runs),
+            "outage_mean_s": _mean(outages),
+            "outage_max_s": max(outages, default=None),
+            "reconvergence_mean_s": _mean(settled),
+            "reconvergence_max_s": max(settled, default=None),
+            "unsettled": len(runs) - len(settled),
+            "failed": len(rows) - len(runs),
+        })
+    return report
+
+
+def _ms(value):
+    return f"{value * 1e3:10.1f}" if value is not None else f"{'-':>10}"
+
+
+def print_comparison(report):
+    print(f"{'scenario':24} {'variant':8} {'runs':>4} {'outage ms':>10} {'max':>10} {'reconv ms':>10} {'max':>10}")
+    for row in sorted(report, key=lambda r: (r["scenario"], r["variant"])):
+        unsettled = f"  ({row['unsettled']} not settled)" if row["unsettled"] else ""
+        unsettled += f"  ({row['failed']} failed)" if row.get("failed") else ""
+        print(f"{row['scenario']:24} {row['variant']:8} {row['runs']:4} {_ms(row['outage_mean_s'])} "
+              f"{_ms(row['outage_max_s'])} {_ms(row['reconvergence_mean_s'])} {_ms(row['reconvergence_max_s'])}"
+              f"{unsettled}")
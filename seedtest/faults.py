@@ -0,0 +1,184 @@
+import json
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+
+# Declarative fault injection. A timeline (YAML) lists faults relative to the
+# start of the schedule:
+#
+#   faults:
+#   - {at: 0.0, link: "(1,156)-(1,154)", action: down}
+#   - {at: 5.0, link: "(1,156)-(1,154)", action: up, side: both}
+#   - {at: 1.0, link: "(1,157)-(1,155)", action: flap, frequency: 2, duration: 4}
+#   - {at: 2.0, link: "(1,153)-(1,150)", action: netem, delay: 20, jitter: 5, loss: 1}
+#   - {at: 8.0, link: "(1,153)-(1,150)", action: clear}
+#   - {at: 3.0, node: "as155brd-br0", action: pause, duration: 2}
+#
+# `side` selects the end of the link the action is applied on: "a" (the first
+# AS, default), "b" or "both". Links and nodes are resolved with a
+# seedtest.topoindex.TopologyIndex. Every action is recorded with monotonic and
+# wall-clock timestamps taken right before and after it was executed.
+
+LINK = re.compile(r"^\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)\s*-\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)\s*$")
+
+# Wake up this long before an action is due and spin for the rest
+SPIN_NS = 2_000_000
+
+
+def parse_link(link):
+    m = LINK.match(link)
+    if m is None:
+        raise Exception(f"Invalid link {link}, expected (isd,asn)-(isd,asn)")
+    return tuple(int(g) for g in m.groups())
+
+
+def netem_command(iface, delay=None, jitter=None, loss=None, rate=None):
+    args = []
+    if delay is not None:
+        args += ["delay", f"{delay}ms"]
+        if jitter is not None:
+            args.append(f"{jitter}ms")
+    if loss is not None:
+        args += ["loss", f"{loss}%"]
+    if rate is not None:
+        args += ["rate", f"{rate}kbit"]
+    return f"tc qdisc replace dev {iface} root netem " + " ".join(args)
+
+
+def shaping_command(iface, params):
+    # Sets an interface to the netem parameters `params` (delay, jitter, loss,
+    # rate); without parameters all shaping is removed
+    if not params:
+        return f"tc qdisc del dev {iface} root 2>/dev/null; true"
+    if "jitter" in params and "delay" not in params:
+        params = dict(params, delay=0)
+    return netem_command(iface, params.get("delay"), params.get("jitter"), params.get("loss"), params.get("rate"))
+
+
+class Action:
+    def __init__(self, at, kind, fault, target, iface=None, command=None):
+        self.at = at
+        self.kind = kind
+        self.fault = fault
+        self.target = target
+        self.iface = iface
+        self.command = command
+
+
+class FaultScheduler:
+    def __init__(self, index, faults, workers=32):
+        self.index = index
+        self.workers = workers
+        self.records = []
+        self.actions = sorted(self._expand(faults), key=lambda a: a.at)
+
+    @classmethod
+    def from_file(cls, index, path, **kwargs):
+        with open(path, "r") as f:
+            return cls(index, yaml.safe_load(f)["faults"], **kwargs)
+
+    def _link_ends(self, fault):
+        a_isd, a_asn, b_isd, b_asn = parse_link(fault["link"])
+        side = fault.get("side", "a")
+        ends = []
+        keys = []
+        if side in ("a", "both"):
+            keys.append((a_isd, a_asn, b_isd, b_asn))
+        if side in ("b", "both"):
+            keys.append((b_isd, b_asn, a_isd, a_asn))
+        for key in keys:
+            ctr, iface = self.index.link_end(*key)
+            ends.append((ctr, iface, self.index.link(*key).get("shaping")))
+        if not ends:
+            raise Exception(f"Invalid side {side}")
+        return ends
+
+    def _expand(self, faults):
+        for i, fault in enumerate(faults):
+            at = float(fault["at"])
+            kind = fault["action"]
+            if kind in ("pause", "unpause"):
+                ctr = self.index.node(fault["node"])
+                yield Action(at, kind, i, ctr)
+                if kind == "pause" and "duration" in fault:
+                    yield Action(at + float(fault["duration"]), "unpause", i, ctr)
+                continue
+            for ctr, iface, shaping in self._link_ends(fault):
+                if kind in ("down", "up"):
+                    yield Action(at, kind, i, ctr, iface, f"ip link set {iface} {kind}")
+                elif kind == "flap":
+                    # Toggle down/up at `frequency` Hz for `duration` seconds
+                    period = 1.0 / float(fault["frequency"])
+                    steps = int(float(fault["duration"]) / period * 2)
+                    for step in range(steps):
+                        state = "down" if step % 2 == 0 else "up"
+                        yield Action(at + step * period / 2, state, i, ctr, iface, f"ip link set {iface} {state}")
+                    if steps % 2:
+                        yield Action(at + steps * period / 2, "up", i, ctr, iface, f"ip link set {iface} up")
+                elif kind == "netem":
+                    yield Action(at, kind, i, ctr, iface, netem_command(iface, fault.get("delay"), fault.get("jitter"),
+                                                                        fault.get("loss"), fault.get("rate")))
+                elif kind == "clear":
+                    # Back to the link parameters of the configuration
+                    command = shaping_command(iface, shaping) if shaping else f"tc qdisc del dev {iface} root"
+                    yield Action(at, kind, i, ctr, iface, command)
+                else:
+                    raise Exception(f"Unknown fault action {kind}")
+
+    def _execute(self, action, previous=None):
+        # Actions on the same target keep their order
+        if previous is not None:
+            previous.result()
+        start_ns = time.monotonic_ns()
+        wall_ns = time.time_ns()
+        if action.kind == "pause":
+            action.target.pause()
+            ec, output = 0, b""
+        elif action.kind == "unpause":
+            action.target.unpause()
+            ec, output = 0, b""
+        else:
+            ec, output = action.target.exec_run(action.command)
+        end_ns = time.monotonic_ns()
+        return {
+            "fault": action.fault,
+            "action": action.kind,
+            "container": action.target.name,
+            "interface": action.iface,
+            "command": action.command,
+            "scheduled_s": action.at,
+            "start_ns": start_ns - self.start_ns,
+            "end_ns": end_ns - self.start_ns,
+            "wall_ns": wall_ns,
+            "exit_code": ec,
+            "output": output.decode("utf8").strip(),
+        }
+
+    def run(self):
+        # Blocks until all actions have been executed
+        self.start_ns = time.monotonic_ns()
+        self.start_wall_ns = time.time_ns()
+        futures = []
+        last = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for action in self.actions:
+                due = self.start_ns + int(action.at * 1e9)
+                remaining = due - time.monotonic_ns()
+                if remaining > SPIN_NS:
+                    time.sleep((remaining - SPIN_NS) / 1e9)
+                while time.monotonic_ns() < due:
+                    pass
+                key = (action.target.name, action.iface)
+                future = pool.submit(self._execute, action, last.get(key))
+                last[key] = future
+                futures.append(future)
+            self.records = [f.result() for f in futures]
+        return self.records
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"start_wall_ns": self.start_wall_ns, "actions": self.records}, f, indent=2)
@@ -0,0 +1,178 @@
+import re
+import time
+
+from datetime import datetime
+
+
+# Streaming parser for scion-fast-failover (and ip-failover) client logs:
+#
+#   2025/10/08 07:52:39 client.go:53: Available paths to 1-154:
+#   2025/10/08 07:52:39 client.go:55: 	Hops: [1-157 2>4 1-156 2>2 1-154] MTU: 1500 NextHop: 10.157.0.254:30042
+#   2025/10/08 07:52:39 client.go:60: Selected path to 1-154:
+#   2025/10/08 07:52:44 client.go:138: Switching to Path: 1
+#   2025/10/08 07:52:51 client.go:100: Total Received: 956
+#   2025/10/08 07:52:51 client.go:101: RTT Average: 2.120244ms
+#   2025/10/08 07:52:51 client.go:102: ReconnectTimes: [475.908058ms]
+#
+# Lines are fed one at a time and typed records are returned as soon as they
+# are complete, so logs can be parsed while the experiment is running.
+
+LOG_LINE = re.compile(r"^(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?) (?:\S+\.go:\d+: )?(.*)$")
+PATHS_HEADER = re.compile(r"^(Available|Selected) paths? to (\S+):$")
+HOPS = re.compile(r"^Hops: \[([^\]]*)\](?: MTU: (\d+))?(?: NextHop: (\S+))?")
+SWITCH = re.compile(r"^Switching to Path: (\d+)")
+TOTAL_RECEIVED = re.compile(r"^Total Received: (\d+)")
+RTT_AVERAGE = re.compile(r"^RTT Average: (\S+)")
+RECONNECT_TIMES = re.compile(r"^ReconnectTimes: \[([^\]]*)\]")
+DURATION_PART = re.compile(r"([\d.]+)(ns|us|µs|μs|ms|s|m|h)")
+
+DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "μs": 1e-6, "ms": 1e-3, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(text):
+    # Go time.Duration string (e.g. "1m2.5s", "475.908058ms") in seconds
+    parts = DURATION_PART.findall(text)
+    if not parts or "".join(v + u for v, u in parts) != text.lstrip("-"):
+        raise ValueError(f"Invalid duration {text}")
+    seconds = sum(float(v) * DURATION_UNITS[u] for v, u in parts)
+    return -seconds if text.startswith("-") else seconds
+
+
+def parse_hops(hops):
+    # "1-157 2>4 1-156" -> [("1-157", None, 2), ("1-156", 4, None)]
+    tokens = hops.split()
+    result = []
+    ingress = None
+    for i in range(0, len(tokens), 2):
+        egress = None
+        if i + 1 < len(tokens):
+            egress, next_ingress = (int(x) for x in tokens[i + 1].split(">"))
+        result.append((tokens[i], ingress, egress))
+        if i + 1 < len(tokens):
+            ingress = next_ingress
+    return result
+
+
+class Path:
+    # text: hops as logged, hops: parsed with parse_hops
+    def __init__(self, text, mtu=None, next_hop=None):
+        self.text = text
+        self.hops = parse_hops(text)
+        self.mtu = mtu
+        self.next_hop = next_hop
+
+
+class PathSet:
+    # kind is "available" or "selected"
+    def __init__(self, time, kind, dst, paths):
+        self.time = time
+        self.kind = kind
+        self.dst = dst
+        self.paths = paths
+
+
+class PathSwitch:
+    def __init__(self, time, index):
+        self.time = time
+        self.index = index
+
+
+class Stats:
+    def __init__(self, time, total_received=None, rtt_average=None, reconnect_times=None):
+        self.time = time
+        self.total_received = total_received
+        self.rtt_average = rtt_average
+        self.reconnect_times = reconnect_times or []
+
+
+class FailoverLogParser:
+    def __init__(self):
+        self.paths = None
+        self.stats = None
+
+    def _flush_paths(self):
+        paths, self.paths = self.paths, None
+        return [paths] if paths is not None else []
+
+    def feed(self, line):
+        m = LOG_LINE.match(line.rstrip("\n"))
+        if m is None:
+            return []
+        time = datetime.strptime(m.group(1).split(".")[0], "%Y/%m/%d %H:%M:%S")
+        message = m.group(2).strip()
+
+        hops = HOPS.match(message)
+        if hops and self.paths is not None:
+            mtu = int(hops.group(2)) if hops.group(2) else None
+            self.paths.paths.append(Path(hops.group(1), mtu, hops.group(3)))
+            return []
+        records = self._flush_paths()
+
+        m = PATHS_HEADER.match(message)
+        if m:
+            self.paths = PathSet(time, m.group(1).lower(), m.group(2), [])
+            return records
+        m = SWITCH.match(message)
+        if m:
+            return records + [PathSwitch(time, int(m.group(1)))]
+        m = TOTAL_RECEIVED.match(message)
+        if m:
+            self.stats = Stats(time, total_received=int(m.group(1)))
+            return records
+        m = RTT_AVERAGE.match(message)
+        if m:
+            if self.stats is None:
+                self.stats = Stats(time)
+            self.stats.rtt_average = parse_duration(m.group(1))
+            return records
+        m = RECONNECT_TIMES.match(message)
+        if m:
+            stats, self.stats = self.stats or Stats(time), None
+            stats.reconnect_times = [parse_duration(d) for d in m.group(1).split()]
+            return records + [stats]
+        return records
+
+    def close(self):
+        stats, self.stats = self.stats, None
+        return self._flush_paths() + ([stats] if stats is not None else [])
+
+
+def parse_lines(lines):
+    parser = FailoverLogParser()
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+def iter_lines(chunks):
+    # Split a stream of byte chunks into lines
+    rest = b""
+    for chunk in chunks:
+        rest += chunk
+        *lines, rest = rest.split(b"\n")
+        for line in lines:
+            yield line.decode("utf8", errors="replace")
+    if rest:
+        yield rest.decode("utf8", errors="replace")
+
+
+def follow(ctr, path, until=None, timeout=None):
+    # Lines of a file in a container as they are written. Stops after a line
+    # matching `until` or `timeout` seconds after the start, whichever is
+    # first; tail runs under timeout(1), so the stream also ends when no more
+    # lines come.
+    until = re.compile(until) if until else None
+    command = ["tail", "-n", "+1", "-F", path]
+    if timeout is not None:
+        command = ["timeout", str(int(timeout) + 1)] + command
+        deadline = time.monotonic() + timeout
+    _, stream = ctr.exec_run(command, stream=True)
+    try:
+        for line in iter_lines(stream):
+            yield line
+            if until is not None and until.search(line):
+                break
+            if timeout is not None and time.monotonic() > deadline:
+                break
+    finally:
+        ctr.exec_run(["pkill", "-f", f"tail -n \\+1 -F {path}"])
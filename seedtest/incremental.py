@@ -0,0 +1,176 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import yaml
+
+
+# Incremental compilation: the emulation is compiled into a staging directory,
+# every top-level entry (brdnode_*, csnode_*, hnode_*, ...) is hashed and only
+# entries whose hash differs from the manifest of the previous run are copied
+# into the output directory. The compose services built from changed entries
+# are rebuilt, services whose compose definition changed are recreated.
+
+MANIFEST = ".seedtest-manifest.json"
+COMPOSE_FILE = "docker-compose.yml"
+
+
+def hash_tree(path):
+    h = hashlib.sha256()
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            h.update(f.read())
+        return h.hexdigest()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file = os.path.join(root, name)
+            h.update(os.path.relpath(file, path).encode())
+            h.update(b"\0")
+            h.update(str(os.stat(file).st_mode & 0o111).encode())
+            with open(file, "rb") as f:
+                h.update(f.read())
+            h.update(b"\0")
+    return h.hexdigest()
+
+
+def hash_inputs(*paths, keys=()):
+    # Hash of the files that determine the compiled output (config, scripts,
+    # address plan) and of `keys` that are not files, e.g. the bundle keys of
+    # BundleCache.built, which change with the resolved commits
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(path.encode())
+        h.update(b"\0")
+        h.update(hash_tree(path).encode())
+    for key in sorted(keys):
+        h.update(key.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def source_inputs(*paths):
+    # The given files plus the sources of this package
+    package = os.path.dirname(os.path.abspath(__file__))
+    return list(paths) + sorted(glob.glob(os.path.join(package, "*.py")))
+
+
+def _build_entry(service):
+    # Top-level output entry a compose service is built from
+    build = service.get("build")
+    if build is None:
+        return None
+    if isinstance(build, str):
+        context, dockerfile = build, None
+    else:
+        context, dockerfile = build.get("context", "."), build.get("dockerfile")
+    entry = os.path.normpath(context).split(os.sep)[0]
+    if entry == "." and dockerfile:
+        entry = os.path.normpath(dockerfile).split(os.sep)[0]
+    return entry
+
+
+class IncrementalCompiler:
+    def __init__(self, output):
+        self.output = os.path.abspath(output)
+        self.staging = self.output + ".staging"
+        self.manifest_path = os.path.join(self.output, MANIFEST)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+
+    def up_to_date(self, inputs):
+        # True if the last compile used the same inputs and has been built
+        return (self.manifest.get("inputs") == inputs and self.manifest.get("built", False)
+                and os.path.exists(os.path.join(self.output, COMPOSE_FILE)))
+
+    def compile(self, emu, compiler, inputs=None, postprocess=None):
+        # Returns (services to rebuild, services to recreate), or None if
+        # every service has to be built
+        emu.compile(compiler, self.staging, override=True)
+        if postprocess is not None:
+            postprocess(self.staging)
+
+        entries = {name: hash_tree(os.path.join(self.staging, name))
+                   for name in os.listdir(self.staging)}
+        with open(os.path.join(self.staging, COMPOSE_FILE), "r") as f:
+            services = yaml.safe_load(f).get("services", {})
+        definitions = {name: hashlib.sha256(json.dumps(service, sort_keys=True).encode()).hexdigest()
+                       for name, service in services.items()}
+
+        previous = self.manifest.get("entries")
+        full = previous is None or not os.path.isdir(self.output)
+        if full:
+            shutil.rmtree(self.output, ignore_errors=True)
+            os.replace(self.staging, self.output)
+            changed = set(entries)
+        else:
+            changed = {name for name, h in entries.items() if previous.get(name) != h}
+            for name in set(previous) - set(entries):
+                path = os.path.join(self.output, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            for name in changed:
+                path = os.path.join(self.output, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+                os.replace(os.path.join(self.staging, name), path)
+            shutil.rmtree(self.staging)
+
+        old_definitions = self.manifest.get("services", {})
+        self.manifest = {"inputs": inputs, "entries": entries, "services": definitions, "built": False}
+        self._save()
+        if full:
+            return None
+
+        node_entries = {_build_entry(service) for service in services.values()} - {None}
+        if any(name not in node_entries and name != COMPOSE_FILE for name in changed):
+            # A shared entry (e.g. base image Dockerfiles) changed
+            return None
+        rebuild = {name for name, service in services.items() if _build_entry(service) in changed}
+        recreate = {name for name, h in definitions.items() if old_definitions.get(name) != h}
+        return rebuild, recreate | rebuild
+
+    def mark_built(self):
+        self.manifest["built"] = True
+        self._save()
+
+    def _save(self):
+        with open(self.manifest_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+
+
+def compile_and_build(emu, compiler, output, whales, inputs=None, postprocess=None, builder=None):
+    # Compile and build only what changed since the last run. With `inputs`
+    # (see hash_inputs) unchanged, compile and build are skipped entirely.
+    # `builder(output)` replaces compose build, e.g. seedtest.buildsched.build.
+    # Nothing is started here: returns the services the caller's compose up
+    # has to recreate (see Session.up).
+    incremental = IncrementalCompiler(output)
+    if inputs is not None and incremental.up_to_date(inputs):
+        print("Topology unchanged, skipping compile and build")
+        return set()
+    changes = incremental.compile(emu, compiler, inputs, postprocess)
+    if changes is None:
+        recreate = set()
+        if builder is not None:
+            builder(output)
+        else:
+            whales.compose.build()
+    else:
+        rebuild, recreate = changes
+        print(f"Rebuilding {len(rebuild)} and recreating {len(recreate)} services")
+        if builder is not None:
+            # Content-addressed images, only the changed ones are built
+            builder(output)
+        elif rebuild:
+            whales.compose.build(sorted(rebuild))
+    incremental.mark_built()
+    return recreate
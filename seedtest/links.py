@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from seedtest.faults import parse_link, shaping_command
+
+
+# Link parameters from config.yaml. CONNECTIONS entries and the IX membership
+# of core ASes accept
+#
+#   LATENCY: 5       # one-way delay in ms
+#   JITTER: 1        # ms
+#   BANDWIDTH: 100   # Mbit/s
+#   LOSS: 0.1        # percent
+#
+# e.g. {AS: 150, BR: "br0", RELATION: "PROVIDER", LATENCY: 10} or, for the IX
+# interface of a core AS, IX: {LATENCY: 2}. MAIN: LINK_DEFAULTS applies to
+# every link without own values. The parameters are applied with netem on the
+# egress of both link ends, by a start command at compile time and with
+# LinkShaper on a running network. All IX links of a router share its IX
+# interface, so shaping one of them shapes all.
+
+PARAMS = ("LATENCY", "JITTER", "BANDWIDTH", "LOSS")
+
+
+def link_params(entry, defaults=None):
+    # netem parameters (delay, jitter, loss, rate) of a config entry
+    values = dict(defaults or {})
+    values.update({key: entry[key] for key in PARAMS if key in entry})
+    params = {}
+    if values.get("LATENCY") is not None:
+        params["delay"] = values["LATENCY"]
+    if values.get("JITTER") is not None:
+        params["jitter"] = values["JITTER"]
+    if values.get("LOSS") is not None:
+        params["loss"] = values["LOSS"]
+    if values.get("BANDWIDTH") is not None:
+        params["rate"] = int(values["BANDWIDTH"] * 1000)
+    return params
+
+
+def configure_links(config, index):
+    # Store the parameters of config.yaml in the link ends of the index
+    defaults = config["MAIN"].get("LINK_DEFAULTS")
+    for end in index.links.values():
+        end["shaping"] = link_params({}, defaults)
+    for _isd in range(1, config["MAIN"]["ISDs"] + 1):
+        isd_config = config[f"ISD{_isd}"]
+        isd = isd_config["ISDN"]
+        for _, as_data in isd_config["ASes"]["CORE"].items():
+            if "IX" not in as_data:
+                continue
+            params = link_params(as_data["IX"], defaults)
+            for (end_isd, asn, _, _), end in index.links.items():
+                if (end_isd, asn) == (isd, as_data["ASN"]) and end["ix"] is not None:
+                    end["shaping"] = params
+        for level in range(1, isd_config["LEVELS"] + 1):
+            for _, as_data in isd_config["ASes"][f"LEVEL{level}"].items():
+                for connection in as_data["CONNECTIONS"]:
+                    params = link_params(connection, defaults)
+                    for key in ((isd, as_data["ASN"], isd, connection["AS"]), (isd, connection["AS"], isd, as_data["ASN"])):
+                        if key in index.links:
+                            index.links[key]["shaping"] = params
+
+
+def apply_links(base, index):
+    # Start commands that shape every link end with parameters; call after
+    # index.resolve(), before compiling
+    done = set()
+    for (isd, asn, _, _), end in index.links.items():
+        if not end.get("shaping") or (asn, end["router"], end["iface"]) in done:
+            continue
+        done.add((asn, end["router"], end["iface"]))
+        router = base.getAutonomousSystem(asn).getRouter(end["router"])
+        router.appendStartCommand(shaping_command(end["iface"], end["shaping"]))
+
+
+class LinkShaper:
+    # Changes link parameters of a running network:
+    #
+    #   shaper = LinkShaper(index)
+    #   shaper.set("(1,156)-(1,154)", delay=20, jitter=2)
+    #   shaper.set("(1,156)-(1,154)", side="a", loss=1)
+    #   shaper.reset("(1,156)-(1,154)")   # back to the config.yaml values
+    #
+    # set() only changes the given parameters, the others keep their current
+    # (initially the configured) values.
+    def __init__(self, index, workers=16):
+        self.index = index
+        self.workers = workers
+        self.current = {}  # link end key -> parameters applied by this shaper
+
+    def _ends(self, link, side):
+        a_isd, a_asn, b_isd, b_asn = parse_link(link) if isinstance(link, str) else link
+        keys = []
+        if side in ("a", "both"):
+            keys.append((a_isd, a_asn, b_isd, b_asn))
+        if side in ("b", "both"):
+            keys.append((b_isd, b_asn, a_isd, a_asn))
+        if not keys:
+            raise Exception(f"Invalid side {side}")
+        return keys
+
+    def _apply(self, settings):
+        # settings: [(link end key, params)]
+        def run(item):
+            key, params = item
+            ctr, iface = self.index.link_end(*key)
+            ec, output = ctr.exec_run(["sh", "-c", shaping_command(iface, params)])
+            if ec != 0:
+                raise Exception(f"Shaping {iface} on {ctr.name} failed: {output.decode('utf8')}")
+            return ctr.name, iface, params
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            applied = list(pool.map(run, settings))
+        for key, params in settings:
+            self.current[key] = params
+        return applied
+
+    def _params(self, key):
+        return dict(self.current.get(key, self.index.links[key].get("shaping") or {}))
+
+    def set(self, link, side="both", delay=None, jitter=None, loss=None, rate=None):
+        params = {k: v for k, v in [("delay", delay), ("jitter", jitter), ("loss", loss), ("rate", rate)]
+                  if v is not None}
+        return self._apply([(key, dict(self._params(key), **params)) for key in self._ends(link, side)])
+
+    def reset(self, link=None, side="both"):
+        # Configured parameters of one link, or of all links
+        keys = self._ends(link, side) if link is not None else list(self.index.links)
+        return self._apply([(key, self.index.links[key].get("shaping") or {}) for key in keys])
@@ -0,0 +1,293 @@
+import argparse
+import sys
+from collections import defaultdict, deque
+
+import yaml
+
+from seedtest.topology import TopologyModel
+
+
+# Offline SCION path prediction for the config.yaml topologies of
+# configurator.py. Beaconing is modelled on the AS graph:
+#
+#  - up segments follow PROVIDER links from an AS to every core AS above it,
+#    down segments are up segments of the destination, reversed,
+#  - core segments are loop-free paths over the core links (the addIxLink mesh,
+#    limited by CORE_DEGREE),
+#  - paths combine up, core and down segments; if an up and a down segment
+#    share a non-core AS, the shortcut over that AS is used instead, and PEER
+#    links between an AS of the up and one of the down segment add peering
+#    shortcuts.
+#
+# Interface IDs are assigned per AS in the order seedemu adds the links: IX
+# links first, then cross-connects, each in the order configurator.py adds
+# them. Paths are printed like scion showpaths and the fast-failover client:
+#
+#   1-157 2>4 1-156 2>2 1-154
+#
+# Segments are memoized per AS and core pair, so prediction for one AS pair
+# only touches the ASes above the two ends.
+
+# Beacon store limits: segments per (AS, core AS), core segments per core pair
+MAX_SEGMENTS = 20
+# Core segments are at most this many hops longer than the shortest one
+CORE_SLACK = 1
+
+
+class Topology:
+    def __init__(self):
+        self.isd = {}                       # asn -> isd
+        self.cores = set()
+        self.providers = defaultdict(list)  # asn -> provider asns
+        self.peers = defaultdict(list)
+        self.core_links = defaultdict(list)
+        self.ix_links = []                  # (a, b) in order of addition
+        self.xc_links = []
+        self._ifids = None
+
+    def add_as(self, isd, asn, core=False):
+        self.isd[asn] = isd
+        if core:
+            self.cores.add(asn)
+
+    def add_core_link(self, a, b):
+        self.core_links[a].append(b)
+        self.core_links[b].append(a)
+        self.ix_links.append((a, b))
+        self._ifids = None
+
+    def add_link(self, a, b, relation):
+        # relation "PROVIDER": a is the provider of b, "PEER": a and b peer
+        if relation == "PROVIDER":
+            self.providers[b].append(a)
+        elif relation == "PEER":
+            self.peers[a].append(b)
+            self.peers[b].append(a)
+        else:
+            raise Exception(f"Unknown Connection Relation: {relation}")
+        self.xc_links.append((a, b))
+        self._ifids = None
+
+    @classmethod
+    def from_model(cls, model):
+        # seedtest.topology.TopologyModel
+        topology = cls()
+        for spec in model.ases.values():
+            topology.add_as(spec.isd, spec.asn, core=spec.core)
+        for link in model.links:
+            if link.relation == "core":
+                topology.add_core_link(link.a, link.b)
+            else:
+                topology.add_link(link.a, link.b, "PROVIDER" if link.relation == "transit" else "PEER")
+        return topology
+
+    @classmethod
+    def from_config(cls, config):
+        return cls.from_model(TopologyModel.from_config(config))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_config(yaml.safe_load(f))
+
+    @property
+    def ifids(self):
+        # (asn, neighbour asn) -> interface ID of asn towards the neighbour
+        if self._ifids is None:
+            ifids = {}
+            counters = defaultdict(int)
+            for a, b in self.ix_links + self.xc_links:
+                for x, y in ((a, b), (b, a)):
+                    counters[x] += 1
+                    ifids[(x, y)] = counters[x]
+            self._ifids = ifids
+        return self._ifids
+
+    def ia(self, asn):
+        return f"{self.isd[asn]}-{asn}"
+
+
+def format_path(topology, ases):
+    ifids = topology.ifids
+    parts = [topology.ia(ases[0])]
+    for a, b in zip(ases, ases[1:]):
+        parts.append(f"{ifids[(a, b)]}>{ifids[(b, a)]}")
+        parts.append(topology.ia(b))
+    return " ".join(parts)
+
+
+def parse_path(hops):
+    # "1-157 2>4 1-156" -> (157, 156)
+    return tuple(int(token.split("-")[1]) for token in hops.split()[::2])
+
+
+class PathPredictor:
+    def __init__(self, topology, max_segments=MAX_SEGMENTS, core_slack=CORE_SLACK, max_paths=None):
+        self.topology = topology
+        self.max_segments = max_segments
+        # Shortest paths returned per AS pair, all by default
+        self.max_paths = max_paths
+        self.core_slack = core_slack
+        self._up = {}
+        self._core = {}
+
+    def up_segments(self, asn):
+        # AS sequences from asn up to a core AS, at most max_segments per core
+        if asn not in self._up:
+            if asn in self.topology.cores:
+                segments = [(asn,)]
+            else:
+                by_core = defaultdict(list)
+                for provider in self.topology.providers[asn]:
+                    for segment in self.up_segments(provider):
+                        if asn not in segment:
+                            by_core[segment[-1]].append((asn,) + segment)
+                segments = []
+                for core in sorted(by_core):
+                    segments += sorted(by_core[core], key=len)[:self.max_segments]
+            self._up[asn] = segments
+        return self._up[asn]
+
+    def core_segments(self, a, b):
+        # Loop-free paths from core AS a to core AS b over core links
+        if (a, b) not in self._core:
+            if (b, a) in self._core:
+                self._core[(a, b)] = [tuple(reversed(s)) for s in self._core[(b, a)]]
+                return self._core[(a, b)]
+            dist = self._core_distances(b)
+            if a not in dist:
+                self._core[(a, b)] = []
+                return []
+            limit = dist[a] + self.core_slack
+            segments = []
+            stack = [(a,)]
+            while stack and len(segments) < self.max_segments * 4:
+                path = stack.pop()
+                last = path[-1]
+                if last == b:
+                    segments.append(path)
+                    continue
+                for nxt in sorted(self.topology.core_links[last], reverse=True):
+                    if nxt not in path and nxt in dist and len(path) + dist[nxt] <= limit:
+                        stack.append(path + (nxt,))
+            self._core[(a, b)] = sorted(segments, key=lambda s: (len(s), s))[:self.max_segments]
+        return self._core[(a, b)]
+
+    def _core_distances(self, b):
+        dist = {b: 0}
+        queue = deque([b])
+        while queue:
+            x = queue.popleft()
+            for y in self.topology.core_links[x]:
+                if y not in dist:
+                    dist[y] = dist[x] + 1
+                    queue.append(y)
+        return dist
+
+    def predict(self, src, dst):
+        # Sorted AS sequences of the paths from src to dst
+        cores = self.topology.cores
+        paths = set()
+        ups = self.up_segments(src)
+        downs = [tuple(reversed(s)) for s in self.up_segments(dst)]
+        for up in ups:
+            for down in downs:
+                shortcut = self._shortcut(up, down)
+                if shortcut is not None:
+                    paths.add(shortcut)
+                elif up[-1] == down[0]:
+                    paths.add(up + down[1:])
+                else:
+                    for core in self.core_segments(up[-1], down[0]):
+                        paths.add(up + core[1:-1] + down)
+                for i, x in enumerate(up):
+                    if x in cores:
+                        break
+                    for j, y in enumerate(down):
+                        if y not in cores and y in self.topology.peers[x]:
+                            paths.add(up[:i + 1] + down[j:])
+        paths = sorted((p for p in paths if len(set(p)) == len(p)), key=lambda p: (len(p), p))
+        return paths[:self.max_paths] if self.max_paths else paths
+
+    def _shortcut(self, up, down):
+        # Path over the first non-core AS of `up` that is also on `down`
+        positions = {asn: j for j, asn in enumerate(down)}
+        for i, asn in enumerate(up):
+            if asn in self.topology.cores:
+                return None
+            if asn in positions:
+                return up[:i + 1] + down[positions[asn] + 1:]
+        return None
+
+    def paths(self, src, dst):
+        return [format_path(self.topology, p) for p in self.predict(src, dst)]
+
+
+def links_of(path):
+    return {frozenset(pair) for pair in zip(path, path[1:])}
+
+
+def failover_candidates(paths, failed):
+    # Paths that avoid the failed link (a, b), fewest hops first
+    failed = frozenset(failed)
+    return [p for p in paths if failed not in links_of(p)]
+
+
+def best_backup(paths, primary):
+    # Path that shares the fewest links with `primary`, then the shortest
+    primary_links = links_of(primary)
+    candidates = [p for p in paths if p != primary]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda p: (len(links_of(p) & primary_links), len(p)))
+
+
+def diff(predicted, observed):
+    # Compare predicted and observed hop strings
+    predicted, observed = set(predicted), set(observed)
+    return {
+        "matched": sorted(predicted & observed),
+        "missing": sorted(predicted - observed),
+        "unexpected": sorted(observed - predicted),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict SCION paths of a configurator.py topology")
+    parser.add_argument("config")
+    parser.add_argument("src", help="source ISD-AS, e.g. 1-157")
+    parser.add_argument("dst", help="destination ISD-AS, e.g. 1-154")
+    parser.add_argument("--observed", help="fast-failover client log to compare with")
+    parser.add_argument("--max-segments", type=int, default=MAX_SEGMENTS)
+    parser.add_argument("--max-paths", type=int)
+    args = parser.parse_args()
+
+    topology = Topology.load(args.config)
+    predictor = PathPredictor(topology, max_segments=args.max_segments, max_paths=args.max_paths)
+    src, dst = int(args.src.split("-")[1]), int(args.dst.split("-")[1])
+    predicted = predictor.predict(src, dst)
+    for path in predicted:
+        print(format_path(topology, path))
+    if predicted:
+        backup = best_backup(predicted, predicted[0])
+        if backup is not None:
+            print(f"Best failover path for {format_path(topology, predicted[0])}: {format_path(topology, backup)}")
+
+    if args.observed:
+        from seedtest.fflog import PathSet, parse_lines
+        with open(args.observed, "r") as f:
+            observed = set()
+            for record in parse_lines(f):
+                if isinstance(record, PathSet) and record.kind == "available" and record.dst == args.dst:
+                    observed.update(p.text for p in record.paths)
+        result = diff([format_path(topology, p) for p in predicted], observed)
+        for key in ("missing", "unexpected"):
+            for hops in result[key]:
+                print(f"{key}: {hops}")
+        print(f"{len(result['matched'])} of {len(predicted)} predicted paths observed")
+        if result["missing"] or result["unexpected"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import cProfile
+import json
+import os
+import resource
+import time
+
+from contextlib import contextmanager
+
+
+# Timing of the phases of a run (render, compile, build, up) and of every
+# seedemu layer within render:
+#
+#   profiler = Profiler(cprofile_dir="profiles")
+#   emu, base, index = build_scion(model, plan, bundles, profiler=profiler)
+#   with profiler.phase("compile"):
+#       emu.compile(Docker(), "./output", override=True)
+#   profiler.save("profile.json")
+#
+# Layers are timed by wrapping the configure and render methods of the layer
+# objects before they are added to the emulator, seedemu itself is not
+# changed. With cprofile_dir every phase is also profiled with cProfile and
+# written to <cprofile_dir>/<phase>.prof (view with python -m pstats or
+# snakeviz). Peak memory is the peak RSS of the process at the end of each
+# phase.
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Profiler:
+    def __init__(self, cprofile_dir=None):
+        self.cprofile_dir = cprofile_dir
+        self.phases = []
+        self.layers = []
+        self._profile = None
+
+    @contextmanager
+    def phase(self, name):
+        profile = None
+        if self.cprofile_dir and self._profile is None:
+            os.makedirs(self.cprofile_dir, exist_ok=True)
+            profile = self._profile = cProfile.Profile()
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(os.path.join(self.cprofile_dir, f"{name}.prof"))
+                self._profile = None
+            self.phases.append({"phase": name, "seconds": seconds, "peak_rss": peak_rss()})
+
+    def wrap(self, layer):
+        # Times configure and render of a layer, returns the layer
+        name = layer.getName()
+        for step in ("configure", "render"):
+            method = getattr(layer, step)
+
+            def timed(*args, _method=method, _step=step, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    self.layers.append({"layer": name, "step": _step, "seconds": time.perf_counter() - start})
+            setattr(layer, step, timed)
+        return layer
+
+    def layer_times(self):
+        # Seconds per layer, configure and render summed
+        times = {}
+        for entry in self.layers:
+            times[entry["layer"]] = times.get(entry["layer"], 0.0) + entry["seconds"]
+        return times
+
+    def report(self):
+        return {
+            "phases": {p["phase"]: p["seconds"] for p in self.phases},
+            "layers": self.layer_times(),
+            "peak_rss": peak_rss(),
+            "steps": self.phases,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def print_report(self):
+        for p in self.phases:
+            print(f"{p['phase']:12} {p['seconds']:9.2f} s  peak {p['peak_rss'] / (1 << 20):8.1f} MiB")
+        for name, seconds in sorted(self.layer_times().items(), key=lambda item: -item[1]):
+            print(f"  {name:22} {seconds:9.2f} s")
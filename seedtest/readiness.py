@@ -0,0 +1,207 @@
+import json
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# seedemu names containers as{asn}{role}-{name}-{ip}
+CONTAINER_NAME = re.compile(r"^as(\d+)(brd|cs|rs|h|r)-([^-]+)")
+
+BR_METRICS_PORT = 30442
+CS_METRICS_PORT = 30452
+
+
+def parse_container_name(name):
+    m = CONTAINER_NAME.match(name)
+    if m is None:
+        return None
+    return int(m.group(1)), m.group(2), m.group(3)
+
+
+def _metrics(ctr, port):
+    # Prometheus metrics of the SCION service listening in the container
+    ec, output = ctr.exec_run(["sh", "-c", f"for ip in $(hostname -I); do curl -sf http://$ip:{port}/metrics && break; done"])
+    if ec != 0:
+        return None
+    return output.decode("utf8")
+
+
+def _metric_values(metrics, name):
+    values = []
+    for line in metrics.splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            values.append(float(line.rsplit(" ", 1)[1]))
+    return values
+
+
+def control_service_up(ctr):
+    ec, _ = ctr.exec_run("pgrep -f control")
+    return ec == 0
+
+
+def border_router_up(ctr, port=BR_METRICS_PORT):
+    # Every SCION interface of the router reports up, i.e. BFD is established
+    metrics = _metrics(ctr, port)
+    if metrics is None:
+        return False
+    values = _metric_values(metrics, "router_interface_up")
+    return len(values) > 0 and all(v == 1 for v in values)
+
+
+def beacons_received(ctr, port=CS_METRICS_PORT):
+    metrics = _metrics(ctr, port)
+    if metrics is None:
+        return 0
+    return int(sum(_metric_values(metrics, "control_beaconing_received_beacons_total")))
+
+
+def count_paths(ctr, dst):
+    ec, output = ctr.exec_run(f"scion showpaths {dst} --no-probe --format json")
+    if ec != 0:
+        return 0
+    try:
+        return len(json.loads(output.decode("utf8")).get("paths") or [])
+    except ValueError:
+        return 0
+
+
+def ip_route(ctr, address):
+    # "via <next hop> dev <iface>" of the route towards address, None if there is none
+    ec, output = ctr.exec_run(["ip", "-o", "route", "get", address])
+    if ec != 0:
+        return None
+    tokens = output.decode("utf8").split()
+    return " ".join(f"{key} {tokens[tokens.index(key) + 1]}" for key in ("via", "dev") if key in tokens[:-1])
+
+
+def _timed(check):
+    try:
+        ok = check()
+    except Exception:
+        ok = False
+    return ok, time.monotonic()
+
+
+class Timeline:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.events = []
+
+    def record(self, asn, event, node=None, at=None, **detail):
+        at = time.monotonic() if at is None else at
+        self.events.append({"t": at - self.start, "as": asn, "event": event, "node": node, **detail})
+
+    def first(self, event, asn=None):
+        for e in self.events:
+            if e["event"] == event and (asn is None or e["as"] == asn):
+                return e["t"]
+        return None
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.events, f, indent=2)
+
+
+class Readiness:
+    # Polls all containers concurrently until
+    #  - every control service process is running,
+    #  - every border router reports all interfaces up (BFD established),
+    #  - every (src, dst) pair in `paths` has at least `min_paths` paths.
+    # `paths` holds (src ISD-AS, dst ISD-AS) strings like ("1-157", "1-154"),
+    # the check runs in a host container of the source AS.
+    #
+    # Alongside, the first beacon reception of every control service is
+    # recorded, so the timeline shows beacon and path convergence per AS.
+    def __init__(self, ctrs, paths=(), min_paths=1, workers=32, interval=0.5,
+                 br_metrics_port=BR_METRICS_PORT, cs_metrics_port=CS_METRICS_PORT):
+        self.ctrs = ctrs
+        self.paths = list(paths)
+        self.min_paths = min_paths
+        self.workers = workers
+        self.interval = interval
+        self.br_metrics_port = br_metrics_port
+        self.cs_metrics_port = cs_metrics_port
+        self.timeline = Timeline()
+
+    def _checks(self):
+        checks = {}
+        hosts = {}
+        for name, ctr in self.ctrs.items():
+            parsed = parse_container_name(name)
+            if parsed is None:
+                continue
+            asn, role, node = parsed
+            if role == "cs":
+                checks[("cs_up", asn, node)] = (True, lambda c=ctr: control_service_up(c))
+                checks[("beacons", asn, node)] = (False, lambda c=ctr: beacons_received(c, self.cs_metrics_port) > 0)
+            elif role == "brd":
+                checks[("br_up", asn, node)] = (True, lambda c=ctr: border_router_up(c, self.br_metrics_port))
+            elif role == "h":
+                hosts.setdefault(asn, ctr)
+        for src, dst in self.paths:
+            src_asn = int(src.split("-")[1])
+            if src_asn not in hosts:
+                raise Exception(f"No host container in AS {src} to look up paths")
+            ctr = hosts[src_asn]
+            checks[("paths", src_asn, dst)] = (True, lambda c=ctr, d=dst: count_paths(c, d) >= self.min_paths)
+        return checks
+
+    def wait(self, timeout=300):
+        # Returns True as soon as all required checks passed, False on timeout
+        pending = self._checks()
+        deadline = time.monotonic() + timeout
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                futures = {key: pool.submit(_timed, check) for key, (_, check) in pending.items()}
+                for (event, asn, node), future in futures.items():
+                    ok, at = future.result()
+                    if ok:
+                        self.timeline.record(asn, event, node, at=at)
+                        del pending[(event, asn, node)]
+                if not any(required for required, _ in pending.values()):
+                    return True
+                if time.monotonic() >= deadline:
+                    for (event, asn, node), (required, _) in pending.items():
+                        if required:
+                            self.timeline.record(asn, f"{event}_timeout", node)
+                    return False
+                time.sleep(min(self.interval, max(0, deadline - time.monotonic())))
+
+
+class BgpReadiness(Readiness):
+    # Readiness of the BGP variant: every router has a route to each of
+    # `addresses`. Routers still without one at the timeout are recorded as
+    # br_up_timeout.
+    def __init__(self, ctrs, addresses=(), workers=32, interval=0.5):
+        super().__init__(ctrs, workers=workers, interval=interval)
+        self.addresses = list(addresses)
+
+    def _checks(self):
+        checks = {}
+        for name, ctr in self.ctrs.items():
+            parsed = parse_container_name(name)
+            if parsed is None or parsed[1] not in ("brd", "r"):
+                continue
+            asn, _, node = parsed
+            checks[("br_up", asn, node)] = (True, lambda c=ctr: all(ip_route(c, a) for a in self.addresses))
+        return checks
+
+
+def wait_until_ready(ctrs, paths=(), timeout=300, **kwargs):
+    readiness = Readiness(ctrs, paths=paths, **kwargs)
+    if not readiness.wait(timeout):
+        missing = [e for e in readiness.timeline.events if e["event"].endswith("_timeout")]
+        raise TimeoutError(f"Network not ready after {timeout}s: {missing}")
+    return readiness.timeline
+
+
+def wait_for_log(ctr, path, pattern, timeout=60, interval=0.2):
+    # Wait until a line matching `pattern` appears in a file of the container
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ec, _ = ctr.exec_run(["grep", "-qE", pattern, path])
+        if ec == 0:
+            return True
+        time.sleep(interval)
+    return False
@@ -0,0 +1,150 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from seedtest.fflog import PathSet, PathSwitch, Stats, parse_lines
+
+
+# SQLite store for parsed experiment results. Every table is indexed by run
+# and AS pair, runs are indexed by topology hash, so aggregating many runs is
+# a single query, e.g.
+#
+#   SELECT r.topology_hash, avg(c.duration_s) FROM reconnects c
+#   JOIN runs r USING (run_id) WHERE c.src = '1-157' GROUP BY r.topology_hash
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    topology_hash TEXT,
+    started REAL,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_topology ON runs (topology_hash);
+
+CREATE TABLE IF NOT EXISTS paths (
+    run_id TEXT, src TEXT, dst TEXT, time TEXT, kind TEXT,
+    idx INTEGER, hops TEXT, hop_count INTEGER, mtu INTEGER, next_hop TEXT
+);
+CREATE INDEX IF NOT EXISTS paths_run ON paths (run_id, src, dst);
+
+CREATE TABLE IF NOT EXISTS switches (
+    run_id TEXT, src TEXT, dst TEXT, time TEXT, path_index INTEGER
+);
+CREATE INDEX IF NOT EXISTS switches_run ON switches (run_id, src, dst);
+
+CREATE TABLE IF NOT EXISTS stats (
+    run_id TEXT, src TEXT, dst TEXT, time TEXT, total_received INTEGER, rtt_average_s REAL
+);
+CREATE INDEX IF NOT EXISTS stats_run ON stats (run_id, src, dst);
+
+CREATE TABLE IF NOT EXISTS reconnects (
+    run_id TEXT, src TEXT, dst TEXT, time TEXT, idx INTEGER, duration_s REAL
+);
+CREATE INDEX IF NOT EXISTS reconnects_run ON reconnects (run_id, src, dst);
+CREATE INDEX IF NOT EXISTS reconnects_pair ON reconnects (src, dst);
+
+CREATE TABLE IF NOT EXISTS faults (
+    run_id TEXT, fault INTEGER, action TEXT, container TEXT, interface TEXT,
+    scheduled_s REAL, start_ns INTEGER, end_ns INTEGER, wall_ns INTEGER, exit_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS faults_run ON faults (run_id);
+
+CREATE TABLE IF NOT EXISTS telemetry (
+    run_id TEXT PRIMARY KEY, containers INTEGER, psi_max REAL, cpu_peak REAL, cpus INTEGER,
+    memory_peak_bytes INTEGER, throttled TEXT, saturated INTEGER, path TEXT
+);
+"""
+
+
+class ResultStore:
+    def __init__(self, path="results.db"):
+        # The connection is shared with the thread running ingest, every use
+        # of it holds the lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.executescript(SCHEMA)
+
+    def start_run(self, topology_hash=None, **meta):
+        run_id = uuid.uuid4().hex
+        with self.lock:
+            self.db.execute("INSERT INTO runs VALUES (?, ?, ?, ?)",
+                            (run_id, topology_hash, time.time(), json.dumps(meta)))
+            self.db.commit()
+        return run_id
+
+    def fail_run(self, run_id, reason):
+        # Failed runs stay in the store with the reason in their meta and are
+        # left out of the summaries
+        with self.lock:
+            (meta,), = self.db.execute("SELECT meta FROM runs WHERE run_id = ?", (run_id,)).fetchall()
+            meta = dict(json.loads(meta), failed=reason)
+            self.db.execute("UPDATE runs SET meta = ? WHERE run_id = ?", (json.dumps(meta), run_id))
+            self.db.commit()
+
+    def add(self, run_id, src, dst, record):
+        # Callers hold the lock and commit
+        t = record.time.isoformat()
+        if isinstance(record, PathSet):
+            self.db.executemany("INSERT INTO paths VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (run_id, src, record.dst, t, record.kind, i, p.text, len(p.hops), p.mtu, p.next_hop)
+                for i, p in enumerate(record.paths)])
+        elif isinstance(record, PathSwitch):
+            self.db.execute("INSERT INTO switches VALUES (?, ?, ?, ?, ?)", (run_id, src, dst, t, record.index))
+        elif isinstance(record, Stats):
+            self.db.execute("INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?)",
+                            (run_id, src, dst, t, record.total_received, record.rtt_average))
+            self.db.executemany("INSERT INTO reconnects VALUES (?, ?, ?, ?, ?, ?)", [
+                (run_id, src, dst, t, i, d) for i, d in enumerate(record.reconnect_times)])
+
+    def add_faults(self, run_id, records):
+        # Records of seedtest.faults.FaultScheduler
+        with self.lock:
+            self.db.executemany("INSERT INTO faults VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (run_id, r["fault"], r["action"], r["container"], r["interface"], r["scheduled_s"],
+                 r["start_ns"], r["end_ns"], r["wall_ns"], r["exit_code"]) for r in records])
+            self.db.commit()
+
+    def add_telemetry(self, run_id, summary, path=None):
+        # Summary of seedtest.telemetry.summarize
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO telemetry VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                run_id, summary["containers"], summary["psi_max"], summary["cpu_peak"], summary["cpus"],
+                summary["memory_peak_bytes"], json.dumps(summary["throttled"]), int(summary["saturated"]), path))
+            self.db.commit()
+
+    def ingest(self, run_id, src, lines, dst=None):
+        # Parse a client log line by line and store each record as it completes.
+        # The destination is taken from the path lists unless given.
+        count = 0
+        for record in parse_lines(lines):
+            if isinstance(record, PathSet):
+                dst = record.dst
+            with self.lock:
+                self.add(run_id, src, dst, record)
+                self.db.commit()
+            count += 1
+        return count
+
+    def query(self, sql, *params):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def reconnect_summary(self, topology_hash=None, exclude_saturated=False):
+        # (src, dst, runs, reconnects, mean, max) per AS pair
+        sql = """
+            SELECT c.src, c.dst, count(DISTINCT c.run_id), count(*), avg(c.duration_s), max(c.duration_s)
+            FROM reconnects c JOIN runs r USING (run_id) LEFT JOIN telemetry t USING (run_id)
+            WHERE (? IS NULL OR r.topology_hash = ?) AND NOT (? AND coalesce(t.saturated, 0))
+              AND json_extract(r.meta, '$.failed') IS NULL
+            GROUP BY c.src, c.dst
+        """
+        return self.query(sql, topology_hash, topology_hash, int(exclude_saturated))
+
+    def saturated_runs(self):
+        return self.query("SELECT run_id, psi_max, cpu_peak, throttled FROM telemetry WHERE saturated")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,195 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from seedtest.addressing import AddressPlan
+from seedtest.bundles import IP_FAILOVER, SCION_FAST_FAILOVER, BundleCache, PlaceholderBundles
+from seedtest.profiling import Profiler
+from seedtest.topogen import generate
+from seedtest.topology import TopologyModel, build_bgp, build_scion
+
+
+# Topology-size scaling benchmark. Generates topologies of increasing size
+# with seedtest.topogen, renders and compiles each one with the builders the
+# configurators use and records the time of every phase and layer and the
+# peak memory into a JSON report:
+#
+#   python -m seedtest.scaling --fanouts 2 3 4 6 -o scaling.json
+#   python -m seedtest.scaling --fanouts 2 3 4 6 -o scaling-new.json --baseline scaling.json
+#
+# Render and compile need no Docker daemon and no network: the hosts get
+# placeholders instead of the failover programs (seedtest.bundles). --docker
+# builds the real programs, timed as a phase of their own, and adds image
+# build, compose up and compose down. Every size runs in its own Python process, so
+# peak memory is that of one size and no seedemu state is shared. With
+# --baseline, phases, layers and peak memory that got slower (or bigger) than
+# the baseline at the same size by more than the tolerance are reported as
+# regressions and the exit code is 1.
+
+BUILDERS = {"scion": build_scion, "bgp": build_bgp}
+BUNDLES = {"scion": SCION_FAST_FAILOVER, "bgp": IP_FAILOVER}
+
+# Regressions below this many seconds are noise
+MIN_DELTA = 0.5
+
+
+def run_one(config, variant, workdir, docker=False, cprofile=None):
+    # Render and compile one topology, returns its measurements
+    from seedemu.compiler import Docker
+
+    model = TopologyModel.load(config)
+    output = os.path.join(workdir, f"output-{variant}")
+    profiler = Profiler(cprofile)
+    if docker:
+        bundles = BundleCache(mirror=os.environ.get("SEED_TEST_MIRROR"))
+        with profiler.phase("bundles"):
+            bundles.build(BUNDLES[variant])
+    else:
+        bundles = PlaceholderBundles(os.path.join(workdir, "bundles"))
+    emu, base, index = BUILDERS[variant](model, AddressPlan(), bundles, profiler=profiler)
+    with profiler.phase("compile"):
+        emu.compile(Docker(internetMapPort=5000), output, override=True)
+    if docker:
+        import python_on_whales
+        from seedtest.buildsched import build
+        whales = python_on_whales.DockerClient(compose_files=[os.path.join(output, "docker-compose.yml")])
+        with profiler.phase("build"):
+            build(output)
+        with profiler.phase("up"):
+            whales.compose.up(detach=True)
+        with profiler.phase("down"):
+            whales.compose.down()
+    result = profiler.report()
+    result["ases"] = len(model.ases)
+    result["links"] = len(model.links)
+    result["files"] = sum(len(files) for _, _, files in os.walk(output))
+    return result
+
+
+def _measure(config, variant, workdir, docker, cprofile):
+    # run_one in a fresh interpreter
+    result_file = os.path.join(workdir, f"result-{variant}.json")
+    command = [sys.executable, "-m", "seedtest.scaling", "--run", config, "--variant", variant,
+               "--workdir", workdir, "--result", result_file]
+    if docker:
+        command.append("--docker")
+    if cprofile:
+        command += ["--cprofile", cprofile]
+    start = time.perf_counter()
+    process = subprocess.run(command, capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if process.returncode != 0:
+        return {"error": (process.stdout + process.stderr)[-2000:], "seconds": time.perf_counter() - start}
+    with open(result_file, "r") as f:
+        return json.load(f)
+
+
+def growth(runs, phase):
+    # Exponent k of time ~ ases^k between the two largest sizes
+    points = [(r["ases"], r["phases"][phase]) for r in runs if phase in r.get("phases", {})]
+    points = sorted(p for p in points if p[1] > 0)
+    if len(points) < 2 or points[-1][0] == points[-2][0]:
+        return None
+    (n1, t1), (n2, t2) = points[-2], points[-1]
+    return round(math.log(t2 / t1) / math.log(n2 / n1), 2)
+
+
+def regressions(runs, baseline, tolerance=0.2, min_delta=MIN_DELTA):
+    # Phases, layers and peak memory that grew by more than `tolerance` over
+    # the baseline run of the same variant and size
+    previous = {(r["variant"], r["ases"]): r for r in baseline.get("runs", []) if "error" not in r}
+    found = []
+    for run in runs:
+        old = previous.get((run["variant"], run.get("ases")))
+        if old is None or "error" in run:
+            continue
+        for kind in ("phases", "layers"):
+            for name, seconds in run[kind].items():
+                before = old[kind].get(name)
+                if before is not None and seconds > before * (1 + tolerance) and seconds - before > min_delta:
+                    found.append({"variant": run["variant"], "ases": run["ases"], "kind": kind, "name": name,
+                                  "baseline": before, "current": seconds})
+        if run["peak_rss"] > old["peak_rss"] * (1 + tolerance):
+            found.append({"variant": run["variant"], "ases": run["ases"], "kind": "memory", "name": "peak_rss",
+                          "baseline": old["peak_rss"], "current": run["peak_rss"]})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render/compile scaling benchmark of generated topologies")
+    parser.add_argument("-o", "--output", default="scaling.json", help="report file")
+    parser.add_argument("--workdir", default="scaling", help="generated configs and compiled outputs")
+    parser.add_argument("--variants", nargs="+", choices=sorted(BUILDERS), default=["scion"])
+    parser.add_argument("--fanouts", type=int, nargs="+", default=[2, 3, 4, 6],
+                        help="one topology per fan-out, from small to large")
+    parser.add_argument("--cores", type=int, default=2)
+    parser.add_argument("--levels", type=int, default=3)
+    parser.add_argument("--multihoming", type=int, default=2)
+    parser.add_argument("--peering", type=float, default=0.1)
+    parser.add_argument("--brs", type=int, default=2)
+    parser.add_argument("--docker", action="store_true", help="also build, start and stop every topology")
+    parser.add_argument("--cprofile", metavar="DIR", help="write a cProfile of every phase and size to DIR")
+    parser.add_argument("--baseline", help="earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    # Internal: measure a single topology
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--variant", default="scion", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        result = run_one(args.run, args.variant, args.workdir, args.docker, args.cprofile)
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        return
+
+    runs = []
+    for fanout in args.fanouts:
+        workdir = os.path.abspath(os.path.join(args.workdir, f"fanout{fanout}"))
+        os.makedirs(workdir, exist_ok=True)
+        config = os.path.join(workdir, "config.yaml")
+        with open(config, "w") as f:
+            f.writelines(generate(cores=args.cores, levels=args.levels, fanout=fanout, multihoming=args.multihoming,
+                                  peering=args.peering, brs=args.brs))
+        for variant in args.variants:
+            cprofile = os.path.join(os.path.abspath(args.cprofile), f"{variant}-fanout{fanout}") if args.cprofile else None
+            result = _measure(config, variant, workdir, args.docker, cprofile)
+            result.update({"variant": variant, "fanout": fanout})
+            runs.append(result)
+            if "error" in result:
+                print(f"{variant} fanout {fanout}: failed\n{result['error']}")
+                continue
+            phases = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in result["phases"].items())
+            print(f"{variant} fanout {fanout}: {result['ases']} ASes, {result['files']} files, {phases}, "
+                  f"peak {result['peak_rss'] / (1 << 20):.0f} MiB")
+
+    report = {
+        "created": time.time(),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("run", "variant", "result")},
+        "runs": runs,
+        "growth": {variant: {phase: growth([r for r in runs if r["variant"] == variant and "error" not in r], phase)
+                             for phase in ("setup", "render", "compile", "build", "up")}
+                   for variant in args.variants},
+        "regressions": [],
+    }
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            report["regressions"] = regressions(runs, json.load(f), args.tolerance)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for r in report["regressions"]:
+        print(f"Regression: {r['variant']} {r['ases']} ASes {r['kind']} {r['name']}: "
+              f"{r['baseline']:.2f} -> {r['current']:.2f}")
+    if report["regressions"] or any("error" in r for r in runs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
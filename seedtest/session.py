@@ -0,0 +1,181 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from seedtest.links import shaping_command
+from seedtest.readiness import (BR_METRICS_PORT, BgpReadiness, Readiness, _metrics, control_service_up,
+                                parse_container_name)
+
+
+# Warm network session: the network is brought up once and reset between
+# experiment iterations instead of being torn down and rebuilt.
+#
+#   session = Session(whales, client, index, paths=[("1-157", "1-154")])
+#   session.up()
+#   session.add_app(index.host(154), "fast-failover server ...", "fast-failover server")
+#   for i in range(iterations):
+#       session.reset()
+#       ... run the experiment ...
+#   session.down()
+#
+# reset() stops the test applications, restores every link (interfaces up,
+# configured link parameters, containers unpaused), clears the application logs, restarts
+# containers whose state drifted (stopped, or SCION service gone) and starts
+# the applications again once the network is ready.
+
+
+class App:
+    def __init__(self, ctr, command, pattern, logs=()):
+        self.ctr = ctr
+        self.command = command
+        # pkill -f pattern of the running application
+        self.pattern = pattern
+        self.logs = list(logs)
+
+    def start(self):
+        ec, output = self.ctr.exec_run(self.command, detach=True)
+        return ec
+
+    def stop(self):
+        self.ctr.exec_run(["pkill", "-f", self.pattern])
+
+    def clear_logs(self):
+        if self.logs:
+            self.ctr.exec_run(["rm", "-f"] + self.logs)
+
+
+class Session:
+    def __init__(self, whales, client, index, paths=(), timeout=300, recover_timeout=60, workers=32):
+        self.whales = whales
+        self.client = client
+        self.index = index
+        self.paths = list(paths)
+        self.timeout = timeout
+        # How long reset() waits before restarting services that did not converge
+        self.recover_timeout = recover_timeout
+        self.workers = workers
+        self.ctrs = {}
+        self.apps = []
+        self.iteration = 0
+        self.log = []
+
+    def up(self, recreate=()):
+        # recreate: services whose containers are stale (see compile_and_build)
+        if recreate:
+            self.whales.compose.up(sorted(recreate), detach=True, force_recreate=True)
+        self.whales.compose.up(detach=True)
+        self.ctrs = {ctr.name: self.client.containers.get(ctr.id) for ctr in self.whales.compose.ps()}
+        self.index.attach(self.ctrs)
+        return self.wait_ready()
+
+    def down(self):
+        for app in self.apps:
+            app.stop()
+        self.whales.compose.down()
+
+    def add_app(self, ctr, command, pattern, logs=()):
+        # Applications are started in the order they are added
+        app = App(ctr, command, pattern, logs)
+        self.apps.append(app)
+        return app
+
+    def _wait(self, timeout=None):
+        readiness = Readiness(self.ctrs, paths=self.paths, workers=self.workers)
+        return readiness.wait(timeout or self.timeout), readiness.timeline
+
+    def wait_ready(self, timeout=None):
+        # Returns the readiness timeline, raises TimeoutError if the network
+        # did not become ready
+        ok, timeline = self._wait(timeout)
+        if not ok:
+            missing = [e for e in timeline.events if e["event"].endswith("_timeout")]
+            raise TimeoutError(f"Network not ready: {missing}")
+        return timeline
+
+    def _map(self, fn, items):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(fn, items))
+
+    def restore_links(self):
+        # Undo link faults and shaping on every link end of the index
+        ifaces = {}
+        for (isd, asn, peer_isd, peer_asn), end in self.index.links.items():
+            ctr = self.index.router(asn, end["router"], isd)
+            ifaces.setdefault(ctr.name, (ctr, {}))[1][end["iface"]] = end.get("shaping") or {}
+
+        def restore(item):
+            ctr, shaping = item
+            script = "; ".join(f"ip link set {iface} up; {shaping_command(iface, params)}"
+                               for iface, params in sorted(shaping.items()))
+            ctr.exec_run(["sh", "-c", script + "; true"])
+        self._map(restore, ifaces.values())
+
+    def _drifted(self, ctr):
+        # True if the container or its SCION service is no longer running
+        ctr.reload()
+        if ctr.status == "paused":
+            ctr.unpause()
+            ctr.reload()
+        if ctr.status != "running":
+            return True
+        parsed = parse_container_name(ctr.name)
+        if parsed is None:
+            return False
+        return self._service_down(ctr, parsed[1])
+
+    def _service_down(self, ctr, role):
+        if role == "cs":
+            return not control_service_up(ctr)
+        if role == "brd":
+            return _metrics(ctr, BR_METRICS_PORT) is None
+        return False
+
+    def recover(self):
+        # Restart the containers whose state drifted, returns their names
+        ctrs = list(self.ctrs.values())
+        drifted = [ctr for ctr, bad in zip(ctrs, self._map(self._drifted, ctrs)) if bad]
+        self._map(lambda ctr: ctr.restart(), drifted)
+        return [ctr.name for ctr in drifted]
+
+    def reset(self):
+        start = time.monotonic()
+        self.iteration += 1
+        for app in reversed(self.apps):
+            app.stop()
+        self._map(lambda app: app.clear_logs(), self.apps)
+        recovered = self.recover()
+        self.restore_links()
+        ok, timeline = self._wait(self.recover_timeout)
+        if not ok:
+            # Services that did not converge after the links came back, e.g. a
+            # router stuck with BFD down, are restarted as well
+            stuck = []
+            for e in timeline.events:
+                if e["event"] == "br_up_timeout":
+                    stuck.append(self.index.router(e["as"], e["node"]))
+                elif e["event"] == "cs_up_timeout":
+                    stuck.append(self.index.container(e["as"], "cs", e["node"]))
+            self._map(lambda ctr: ctr.restart(), stuck)
+            recovered += [ctr.name for ctr in stuck]
+            self.wait_ready()
+        for app in self.apps:
+            app.start()
+        entry = {"iteration": self.iteration, "recovered": recovered, "reset_s": time.monotonic() - start}
+        self.log.append(entry)
+        return entry
+
+
+class BgpSession(Session):
+    # Session of the BGP variant of a topology: ready once every router has a
+    # route to the hosts of the destination ASes in `paths`, drifted if a
+    # router's bird is gone
+    def _wait(self, timeout=None):
+        addresses = [self.index.host(int(dst.split("-")[1])).name.rsplit("-", 1)[1] for _, dst in self.paths]
+        readiness = BgpReadiness(self.ctrs, addresses, workers=self.workers)
+        return readiness.wait(timeout or self.timeout), readiness.timeline
+
+    def _service_down(self, ctr, role):
+        if role in ("brd", "r", "rs"):
+            ec, _ = ctr.exec_run("pgrep bird")
+            return ec != 0
+        return False
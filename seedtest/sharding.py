@@ -0,0 +1,382 @@
+import argparse
+import os
+import subprocess
+import sys
+
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from seedtest.buildsched import BuildScheduler
+from seedtest.incremental import COMPOSE_FILE
+from seedtest.readiness import parse_container_name
+from seedtest.transforms import NODE_DIR
+
+
+# One emulation across several Docker engines. The AS graph of a topology
+# model is partitioned into one shard per engine (few cut links, container
+# count and expected load balanced by engine capacity), the compose file of
+# the single compile is split into one compose file per shard, and every
+# network with services on more than one shard (cut cross-connects, the IX
+# of core ASes on different shards) is stitched across the engines with
+# VXLAN. The shards are described in a YAML file:
+#
+#   shards:
+#   - {name: shard0, host: "tcp://172.30.0.10:2375", address: 172.30.0.10, container: seedtest-shard0}
+#   - {name: shard1, host: "tcp://172.30.0.11:2375", address: 172.30.0.11, capacity: 2}
+#
+# `address` is where the other shards reach the engine's host for VXLAN
+# (UDP 4789), `capacity` its relative size. Host commands (ip link, bridge)
+# run in `container` on the local engine if given (Docker-in-Docker shards),
+# otherwise in a privileged helper container with the host network of the
+# shard's engine.
+#
+#   sharded = ShardedNetwork("./output", shards, assignment)
+#   sharded.split()
+#   sharded.build()
+#   session = Session(sharded, sharded.client, index)
+#
+# ShardedNetwork provides the compose.up/ps/down and containers.get calls of
+# python_on_whales and the Docker SDK that Session uses, so the rest of the
+# tooling drives all shards as one network. Telemetry and packet capture read
+# the local host and only cover a shard on the local engine.
+#
+# For local tests, `python -m seedtest.sharding dind up 3 -o shards.yaml`
+# starts three docker:dind engines on one machine.
+
+HELPER_IMAGE = "nicolaka/netshoot"
+VXLAN_PORT = 4789
+FIRST_VNI = 4200
+# Underlay MTU minus the VXLAN overhead
+STITCHED_MTU = 1450
+
+DIND_IMAGE = "docker:27-dind"
+DIND_NETWORK = "seedtest-shards"
+DIND_SUBNET = "172.30.0.0/24"
+
+
+def load_shards(path):
+    with open(path, "r") as f:
+        shards = yaml.safe_load(f)["shards"]
+    for shard in shards:
+        shard.setdefault("capacity", 1.0)
+    return shards
+
+
+def as_weight(spec, degree):
+    # Expected load of an AS: its containers (routers, control services,
+    # host) plus its links, which carry BFD, beacons and transit traffic
+    containers = spec.brs + len(spec.control_services) + (1 if spec.host else 0)
+    return containers + 0.5 * degree
+
+
+def partition(model, shards, imbalance=0.1, passes=20):
+    # asn -> shard index. ASes are assigned in breadth-first order from the
+    # core ASes, filling one shard after the other up to its share of the
+    # total weight, then single ASes are moved to the shard most of their
+    # links lead to as long as that reduces the cut and keeps the balance.
+    neighbours = defaultdict(list)
+    for link in model.links:
+        neighbours[link.a].append(link.b)
+        neighbours[link.b].append(link.a)
+    weights = {asn: as_weight(spec, len(neighbours[asn])) for asn, spec in model.ases.items()}
+    total = sum(weights.values())
+    capacity = sum(s["capacity"] for s in shards)
+    targets = [total * s["capacity"] / capacity for s in shards]
+    limits = [t * (1 + imbalance) for t in targets]
+
+    order = []
+    seen = set()
+    cores = [asn for asn, spec in model.ases.items() if spec.core]
+    for asn in cores + list(model.ases):
+        if asn in seen:
+            continue
+        queue = deque([asn])
+        seen.add(asn)
+        while queue:
+            x = queue.popleft()
+            order.append(x)
+            for y in neighbours[x]:
+                if y not in seen:
+                    seen.add(y)
+                    queue.append(y)
+    assignment = {}
+    loads = [0.0] * len(shards)
+    shard = 0
+    for asn in order:
+        while shard < len(shards) - 1 and loads[shard] + weights[asn] / 2 > targets[shard]:
+            shard += 1
+        assignment[asn] = shard
+        loads[shard] += weights[asn]
+
+    for _ in range(passes):
+        moved = False
+        for asn in order:
+            own = assignment[asn]
+            counts = defaultdict(int)
+            for y in neighbours[asn]:
+                counts[assignment[y]] += 1
+            best, gain, inside = own, 0, counts[own]
+            for other, count in list(counts.items()):
+                if other != own and count - inside > gain and loads[other] + weights[asn] <= limits[other]:
+                    best, gain = other, count - inside
+            if best != own:
+                assignment[asn] = best
+                loads[own] -= weights[asn]
+                loads[best] += weights[asn]
+                moved = True
+        if not moved:
+            break
+    return assignment
+
+
+def cut_links(model, assignment):
+    return [link for link in model.links if assignment[link.a] != assignment[link.b]]
+
+
+def _service_asn(name, service):
+    parsed = parse_container_name(service.get("container_name", ""))
+    if parsed is not None:
+        return parsed[0]
+    m = NODE_DIR.match(name)
+    return int(m.group(2)) if m else None
+
+
+def _service_networks(service):
+    networks = service.get("networks") or []
+    return list(networks) if isinstance(networks, (list, dict)) else []
+
+
+class ShardedNetwork:
+    def __init__(self, output, shards, assignment, project="seedtest", helper_image=HELPER_IMAGE):
+        self.output = os.path.abspath(output)
+        self.shards = shards
+        self.assignment = assignment
+        self.project = project
+        self.helper_image = helper_image
+        self.stitched = {}   # network -> (vni, bridge, [shard index])
+        self.compose = self
+        self.client = _Clients(self)
+        self.whales = []
+        self.dockers = []
+
+    def compose_file(self, i):
+        return f"docker-compose.{self.shards[i]['name']}.yml"
+
+    def split(self):
+        # One compose file per shard next to the compiled docker-compose.yml,
+        # returns the stitched networks
+        with open(os.path.join(self.output, COMPOSE_FILE), "r") as f:
+            compose = yaml.safe_load(f)
+        services = [dict() for _ in self.shards]
+        users = defaultdict(set)
+        for name, service in compose.get("services", {}).items():
+            asn = _service_asn(name, service)
+            networks = _service_networks(service)
+            if asn is not None and asn in self.assignment:
+                targets = [self.assignment[asn]]
+            elif not networks:
+                # Base images other images are built FROM, needed on every shard
+                targets = range(len(self.shards))
+            else:
+                targets = [0]
+            for i in targets:
+                services[i][name] = service
+                for network in networks:
+                    users[network].add(i)
+
+        self.stitched = {}
+        for n, network in enumerate(sorted(net for net, shards in users.items() if len(shards) > 1)):
+            self.stitched[network] = (FIRST_VNI + n, f"sx{FIRST_VNI + n}", sorted(users[network]))
+
+        for i, shard_services in enumerate(services):
+            networks = {}
+            for network, definition in (compose.get("networks") or {}).items():
+                if i not in users[network]:
+                    continue
+                definition = dict(definition or {})
+                if network in self.stitched:
+                    # Fixed bridge name, so the VXLAN device can be attached to it
+                    opts = dict(definition.get("driver_opts") or {})
+                    opts["com.docker.network.bridge.name"] = self.stitched[network][1]
+                    opts["com.docker.network.driver.mtu"] = str(STITCHED_MTU)
+                    definition["driver_opts"] = opts
+                networks[network] = definition
+            shard_compose = dict(compose, services=shard_services, networks=networks)
+            with open(os.path.join(self.output, self.compose_file(i)), "w") as f:
+                yaml.safe_dump(shard_compose, f, default_flow_style=False, sort_keys=False)
+        return self.stitched
+
+    def _map(self, fn, items):
+        with ThreadPoolExecutor(max_workers=len(self.shards)) as pool:
+            return list(pool.map(fn, items))
+
+    def build(self, rebuild=False, **kwargs):
+        # Images of every shard built on its engine, in parallel
+        def build(i):
+            scheduler = BuildScheduler(self.output, host=self.shards[i]["host"], compose_file=self.compose_file(i),
+                                       **kwargs)
+            scheduler.run(rebuild)
+            return scheduler
+        schedulers = self._map(build, range(len(self.shards)))
+        for shard, scheduler in zip(self.shards, schedulers):
+            print(f"{shard['name']}:")
+            scheduler.print_report()
+        return schedulers
+
+    def _connect(self):
+        import docker
+        import python_on_whales
+        if not self.whales:
+            self.whales = [python_on_whales.DockerClient(
+                host=shard["host"], compose_files=[os.path.join(self.output, self.compose_file(i))],
+                compose_project_name=f"{self.project}-{shard['name']}") for i, shard in enumerate(self.shards)]
+            self.dockers = [docker.DockerClient(base_url=shard["host"]) for shard in self.shards]
+
+    def host_exec(self, i, script):
+        # Run a shell script in the network namespace of the shard's host
+        shard = self.shards[i]
+        if shard.get("container"):
+            command = ["docker", "exec", shard["container"], "sh", "-c",
+                       f"command -v bridge >/dev/null || apk add -q iproute2 >/dev/null; {script}"]
+        else:
+            command = ["docker", "-H", shard["host"], "run", "--rm", "--privileged", "--net", "host",
+                       self.helper_image, "sh", "-c", script]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Host command on {shard['name']} failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def stitch(self):
+        # VXLAN device per stitched network and shard, attached to the
+        # network's bridge, flooding to the other shards of the network
+        def stitch(i):
+            local = self.shards[i]["address"]
+            script = []
+            for network, (vni, bridge, shards) in sorted(self.stitched.items()):
+                if i not in shards:
+                    continue
+                dev = f"vx{vni}"
+                script.append(f"ip link del {dev} 2>/dev/null; "
+                              f"ip link add {dev} type vxlan id {vni} local {local} dstport {VXLAN_PORT} && "
+                              f"ip link set {dev} mtu {STITCHED_MTU} master {bridge} up")
+                for j in shards:
+                    if j != i:
+                        script.append(f"bridge fdb append 00:00:00:00:00:00 dev {dev} dst {self.shards[j]['address']}")
+            if script:
+                self.host_exec(i, " && ".join(script))
+        self._map(stitch, range(len(self.shards)))
+
+    def unstitch(self):
+        def unstitch(i):
+            devs = [f"vx{vni}" for vni, _, shards in self.stitched.values() if i in shards]
+            if devs:
+                self.host_exec(i, "; ".join(f"ip link del {dev} 2>/dev/null" for dev in devs) + "; true")
+        self._map(unstitch, range(len(self.shards)))
+
+    # python_on_whales compose interface, so Session can drive all shards
+
+    def up(self, detach=True):
+        self._connect()
+        self._map(lambda whales: whales.compose.up(detach=detach), self.whales)
+        self.stitch()
+
+    def ps(self):
+        self._connect()
+        return [ctr for containers in self._map(lambda whales: whales.compose.ps(), self.whales)
+                for ctr in containers]
+
+    def down(self):
+        self._connect()
+        self.unstitch()
+        self._map(lambda whales: whales.compose.down(), self.whales)
+
+
+class _Clients:
+    # Docker SDK containers.get over all shard engines
+    def __init__(self, network):
+        self.network = network
+        self.containers = self
+
+    def get(self, id):
+        import docker
+        self.network._connect()
+        for client in self.network.dockers:
+            try:
+                return client.containers.get(id)
+            except docker.errors.NotFound:
+                continue
+        raise Exception(f"No container {id} on any shard")
+
+    def list(self, **kwargs):
+        self.network._connect()
+        return [ctr for client in self.network.dockers for ctr in client.containers.list(**kwargs)]
+
+
+def dind_up(count, network=DIND_NETWORK, subnet=DIND_SUBNET, image=DIND_IMAGE, prefix="seedtest-shard"):
+    # Start `count` Docker-in-Docker engines on one user-defined network of
+    # the local engine, returns their shard descriptions
+    base = subnet.rsplit(".", 1)[0]
+    subprocess.run(["docker", "network", "create", "--subnet", subnet, network], capture_output=True)
+    shards = []
+    for i in range(count):
+        name = f"{prefix}{i}"
+        address = f"{base}.{10 + i}"
+        subprocess.run(["docker", "rm", "-f", name], capture_output=True)
+        result = subprocess.run(["docker", "run", "-d", "--privileged", "--name", name, "--network", network,
+                                 "--ip", address, "-e", "DOCKER_TLS_CERTDIR=", image,
+                                 "dockerd", "--host=tcp://0.0.0.0:2375", "--host=unix:///var/run/docker.sock"],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Starting {name} failed: {result.stderr.strip()}")
+        shards.append({"name": f"shard{i}", "host": f"tcp://{address}:2375", "address": address,
+                       "container": name, "capacity": 1.0})
+    return shards
+
+
+def dind_down(shards, network=DIND_NETWORK):
+    for shard in shards:
+        if shard.get("container"):
+            subprocess.run(["docker", "rm", "-f", "-v", shard["container"]], capture_output=True)
+    subprocess.run(["docker", "network", "rm", network], capture_output=True)
+
+
+def main():
+    from seedtest.topology import TopologyModel
+
+    parser = argparse.ArgumentParser(description="Shard a topology across Docker engines")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("partition", help="print the shard of every AS and the cut links")
+    p.add_argument("config")
+    p.add_argument("--shards", required=True, help="shards file, or a number of equal shards")
+    p.add_argument("--imbalance", type=float, default=0.1)
+    p = sub.add_parser("dind", help="start or stop local Docker-in-Docker shards")
+    p.add_argument("action", choices=["up", "down"])
+    p.add_argument("count", type=int, nargs="?", default=2)
+    p.add_argument("-o", "--output", default="shards.yaml")
+    args = parser.parse_args()
+
+    if args.command == "partition":
+        if args.shards.isdigit():
+            shards = [{"name": f"shard{i}", "capacity": 1.0} for i in range(int(args.shards))]
+        else:
+            shards = load_shards(args.shards)
+        model = TopologyModel.load(args.config)
+        assignment = partition(model, shards, args.imbalance)
+        for i, shard in enumerate(shards):
+            ases = [asn for asn, s in assignment.items() if s == i]
+            print(f"{shard['name']}: {len(ases)} ASes: {' '.join(str(a) for a in ases)}")
+        cut = cut_links(model, assignment)
+        print(f"{len(cut)} of {len(model.links)} links cut: {' '.join(link.name for link in cut)}")
+    elif args.action == "up":
+        shards = dind_up(args.count)
+        with open(args.output, "w") as f:
+            yaml.safe_dump({"shards": shards}, f, sort_keys=False)
+        print(f"{len(shards)} shards written to {args.output}")
+    else:
+        dind_down(load_shards(args.output))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
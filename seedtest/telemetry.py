@@ -0,0 +1,205 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+
+# Resource telemetry of all containers, read from one thread straight from the
+# host: cgroup v2 files for CPU, memory and throttling, /proc/<pid>/net/dev
+# for the interface counters of the container's network namespace and
+# /proc/pressure/cpu for host CPU pressure. No Docker API calls per tick.
+#
+# Samples go to a gzip'd JSON lines file. The first line is a header with the
+# wall-clock start (the fault records use the same clock), the containers and
+# their interfaces; every following line is one tick with counter deltas:
+#
+#   {"start_wall_ns": ..., "interval": 1.0, "containers": [{"name": ..., "ifaces": ["net0", ...]}]}
+#   {"t": 1.0, "psi": 2.1, "c": [[cpu_us, mem_bytes, throttled_us, rx_bytes, tx_bytes, ...], ...]}
+#
+# psi is the share of the interval in which at least one task on the host
+# waited for a CPU. A run counts as saturated if CPU pressure or throttling
+# exceeded the thresholds of summarize().
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PRESSURE_CPU = "/proc/pressure/cpu"
+
+
+def _read(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _keyed(path):
+    values = {}
+    for line in _read(path).splitlines():
+        key, _, value = line.partition(" ")
+        values[key] = int(value)
+    return values
+
+
+def cgroup_path(ctr, root=CGROUP_ROOT):
+    pid = ctr.attrs["State"]["Pid"]
+    try:
+        for line in _read(f"/proc/{pid}/cgroup").splitlines():
+            if line.startswith("0::"):
+                path = root + line[3:]
+                if os.path.exists(os.path.join(path, "cpu.stat")):
+                    return path
+    except OSError:
+        pass
+    for candidate in (f"system.slice/docker-{ctr.id}.scope", f"docker/{ctr.id}"):
+        path = os.path.join(root, candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def net_dev(pid):
+    # interface -> (rx bytes, rx packets, rx drops, tx bytes, tx packets, tx drops)
+    counters = {}
+    for line in _read(f"/proc/{pid}/net/dev").splitlines()[2:]:
+        name, _, values = line.partition(":")
+        fields = [int(v) for v in values.split()]
+        counters[name.strip()] = (fields[0], fields[1], fields[3], fields[8], fields[9], fields[11])
+    return counters
+
+
+def cpu_pressure():
+    # Total microseconds some task waited for a CPU
+    for line in _read(PRESSURE_CPU).splitlines():
+        if line.startswith("some "):
+            return int(line.rsplit("total=", 1)[1])
+    return None
+
+
+class _Probe:
+    def __init__(self, ctr):
+        self.name = ctr.name
+        self.pid = ctr.attrs["State"]["Pid"]
+        self.cgroup = cgroup_path(ctr)
+        try:
+            self.ifaces = sorted(i for i in net_dev(self.pid) if i != "lo")
+        except OSError:
+            self.ifaces = []
+
+    def read(self):
+        # Cumulative counters, memory is a gauge
+        row = [None, None, None]
+        if self.cgroup is not None:
+            try:
+                cpu = _keyed(os.path.join(self.cgroup, "cpu.stat"))
+                row = [cpu.get("usage_usec"), int(_read(os.path.join(self.cgroup, "memory.current"))),
+                       cpu.get("throttled_usec")]
+            except (OSError, ValueError):
+                pass
+        try:
+            net = net_dev(self.pid)
+        except OSError:
+            net = {}
+        for iface in self.ifaces:
+            rx_bytes, _, rx_drops, tx_bytes, _, tx_drops = net.get(iface, (None,) * 6)
+            row += [rx_bytes, tx_bytes, rx_drops, tx_drops]
+        return row
+
+
+def _delta(now, before, gauges=(1,)):
+    return [n if i in gauges or n is None or b is None else n - b
+            for i, (n, b) in enumerate(zip(now, before))]
+
+
+class TelemetrySampler:
+    def __init__(self, ctrs, path, interval=1.0):
+        # ctrs: container name -> container
+        self.probes = [_Probe(ctr) for _, ctr in sorted(ctrs.items())]
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        self.start_wall_ns = time.time_ns()
+        start = time.monotonic()
+        try:
+            psi = cpu_pressure()
+        except OSError:
+            psi = None
+        rows = [p.read() for p in self.probes]
+        with gzip.open(self.path, "wt") as out:
+            out.write(json.dumps({
+                "start_wall_ns": self.start_wall_ns, "interval": self.interval, "cpus": os.cpu_count(),
+                "columns": ["cpu_us", "mem_bytes", "throttled_us", "rx_bytes", "tx_bytes", "rx_drops", "tx_drops"],
+                "containers": [{"name": p.name, "ifaces": p.ifaces} for p in self.probes]}) + "\n")
+            tick = start
+            last = start
+            while not self.stop_event.is_set():
+                tick += self.interval
+                self.stop_event.wait(max(0.0, tick - time.monotonic()))
+                now = time.monotonic()
+                try:
+                    psi_now = cpu_pressure()
+                except OSError:
+                    psi_now = None
+                current = [p.read() for p in self.probes]
+                pressure = None
+                if psi is not None and psi_now is not None:
+                    pressure = round((psi_now - psi) / ((now - last) * 1e6) * 100, 2)
+                out.write(json.dumps({"t": round(now - start, 3), "dt": round(now - last, 3), "psi": pressure,
+                                      "c": [_delta(c, r) for c, r in zip(current, rows)]},
+                                     separators=(",", ":")) + "\n")
+                rows, psi, last = current, psi_now, now
+
+
+def load(path):
+    with gzip.open(path, "rt") as f:
+        header = json.loads(f.readline())
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(path, psi_threshold=10.0, throttle_threshold=0.05, cpu_threshold=0.9):
+    # Saturation flags of a telemetry file:
+    #  - host CPU pressure above psi_threshold percent in any tick,
+    #  - a container throttled for more than throttle_threshold of a tick,
+    #  - all containers together using more than cpu_threshold of the host CPUs.
+    header, ticks = load(path)
+    names = [c["name"] for c in header["containers"]]
+    cpus = header.get("cpus") or 1
+    psi_max = max((t["psi"] for t in ticks if t["psi"] is not None), default=None)
+    cpu_peak = 0.0
+    memory_peak = 0
+    throttled = set()
+    for t in ticks:
+        cpu = sum(row[0] or 0 for row in t["c"]) / (t["dt"] * 1e6)
+        cpu_peak = max(cpu_peak, cpu)
+        memory_peak = max(memory_peak, sum(row[1] or 0 for row in t["c"]))
+        for name, row in zip(names, t["c"]):
+            if row[2] and row[2] / (t["dt"] * 1e6) > throttle_threshold:
+                throttled.add(name)
+    saturated = ((psi_max is not None and psi_max > psi_threshold) or bool(throttled)
+                 or cpu_peak > cpu_threshold * cpus)
+    return {
+        "containers": len(names),
+        "duration_s": ticks[-1]["t"] if ticks else 0,
+        "psi_max": psi_max,
+        "cpu_peak": round(cpu_peak, 2),
+        "cpus": cpus,
+        "memory_peak_bytes": memory_peak,
+        "throttled": sorted(throttled),
+        "saturated": saturated,
+    }
@@ -0,0 +1,283 @@
+import json
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from seedtest.faults import netem_command
+from seedtest.links import LinkShaper
+from seedtest.fflog import follow, parse_duration
+
+
+# Clock synchronization benchmark for scion-time. Clients are started on the
+# time hosts, their offset/round-trip measurements are read from the client
+# logs and sampled every `interval_ms` into a JSON lines file:
+#
+#   {"phase": 1, "t_s": 3.5, "process": 0, "client": "1-153", "offset_s": 0.0051,
+#    "rtt_s": 0.0042, "injected_offset_s": 0.005, "fresh": true}
+#   {"phase": 1, "t_s": 3.5, "server_cpu": 1.3}
+#
+# All containers share the kernel clock, so a real clock offset can not be
+# set per container. Offsets are emulated as path asymmetry instead: an
+# additional one-way delay d on the client->server direction shifts the
+# measured offset by d/2, so an offset o is injected as 2*o of netem delay on
+# the client (o > 0) or on the internal interface of the client AS router
+# (o < 0). The expected measured offset is then o.
+#
+# Phase 1 runs one client per time host to measure accuracy; the following
+# phases run an increasing number of concurrent client processes against the
+# server to see how it scales.
+
+DEFAULT_CLIENT_COMMAND = "/scion-time/timeservice tool -periodic -local {local} -remote {remote}"
+
+# offset=1.2ms, "offset": "1.2ms", rtt=..., delay=...
+SAMPLE_FIELD = re.compile(r'"?\b(offset|off|rtt|delay)"?\s*[=:]\s*"?([+-]?[\d.]+(?:e[+-]?\d+)?(?:ns|us|µs|μs|ms|s|m|h)?)\b')
+# 2025-10-08T07:52:39Z,+0.000123456 (offset in seconds)
+CSV_SAMPLE = re.compile(r"^\d{4}-\d{2}-\d{2}T\S+,([+-]?[\d.]+(?:e[+-]?\d+)?)")
+
+
+def _seconds(value):
+    if value[-1].isdigit():
+        return float(value)
+    return parse_duration(value)
+
+
+def parse_sample(line):
+    # {"offset_s": ..., "rtt_s": ...} from a client log line, None if the line
+    # holds no measurement
+    m = CSV_SAMPLE.match(line.strip())
+    if m:
+        return {"offset_s": float(m.group(1)), "rtt_s": None}
+    fields = dict(SAMPLE_FIELD.findall(line))
+    offset = fields.get("offset", fields.get("off"))
+    if offset is None:
+        return None
+    rtt = fields.get("rtt", fields.get("delay"))
+    return {"offset_s": _seconds(offset), "rtt_s": _seconds(rtt) if rtt is not None else None}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class TimeHost:
+    def __init__(self, ctr, ia, address, router=None, iface="net0", router_iface="net0", port=123):
+        self.ctr = ctr
+        self.ia = ia
+        self.address = address
+        self.router = router
+        self.iface = iface
+        self.router_iface = router_iface
+        self.port = port
+
+    @property
+    def local(self):
+        return f"{self.ia},{self.address}"
+
+    @property
+    def remote(self):
+        return f"{self.ia},{self.address}:{self.port}"
+
+
+class _Process:
+    def __init__(self, index, client, log):
+        self.index = index
+        self.client = client
+        self.log = log
+        self.pid = None
+        self.sample = None
+        self.seq = 0
+
+
+class TimeBenchmark:
+    def __init__(self, server, clients, interval_ms=500, duration=60, offsets=None, links=(), scaling=(),
+                 command=DEFAULT_CLIENT_COMMAND, tolerance_ms=1.0, workers=32):
+        self.server = server
+        self.clients = clients
+        self.interval = interval_ms / 1000
+        self.duration = duration
+        # client IA -> emulated offset in ms
+        self.offsets = {ia: float(o) for ia, o in (offsets or {}).items()}
+        # Per-link delay on both ends of cross-connects, e.g.
+        # {link: "(1,150)-(1,153)", delay: 10, jitter: 1}
+        self.links = list(links)
+        self.scaling = list(scaling)
+        self.command = command
+        self.tolerance = tolerance_ms / 1000
+        self.workers = workers
+        # (container, interface) pairs inject_offsets put a netem qdisc on
+        self.shaped = []
+
+    @classmethod
+    def from_file(cls, server, clients, path, **kwargs):
+        with open(path, "r") as f:
+            config = yaml.safe_load(f)
+        for key in ("interval_ms", "duration", "links", "scaling", "command", "tolerance_ms"):
+            if key in config:
+                kwargs.setdefault(key, config[key])
+        offsets = {f"{config.get('isd', 1)}-{asn}": o for asn, o in config.get("offsets", {}).items()}
+        kwargs.setdefault("offsets", offsets)
+        return cls(server, clients, **kwargs)
+
+    def shape_links(self, index):
+        shaper = LinkShaper(index)
+        for link in self.links:
+            shaper.set(link["link"], delay=link.get("delay"), jitter=link.get("jitter"),
+                       loss=link.get("loss"), rate=link.get("rate"))
+
+    def inject_offsets(self):
+        for client in self.clients:
+            offset = self.offsets.get(client.ia, 0.0)
+            if offset > 0:
+                ctr, iface = client.ctr, client.iface
+            elif offset < 0:
+                if client.router is None:
+                    raise Exception(f"Negative offset for {client.ia} needs the client AS router")
+                ctr, iface = client.router, client.router_iface
+            else:
+                continue
+            ec, output = ctr.exec_run(netem_command(iface, delay=2 * abs(offset)))
+            if ec != 0:
+                raise Exception(f"Injecting offset on {ctr.name} failed: {output.decode('utf8')}")
+            self.shaped.append((ctr, iface))
+
+    def clear_offsets(self):
+        # Only the qdiscs inject_offsets added, shaping of other interfaces is kept
+        while self.shaped:
+            ctr, iface = self.shaped.pop()
+            ctr.exec_run(f"tc qdisc del dev {iface} root")
+
+    def _start(self, process):
+        command = self.command.format(local=process.client.local, remote=self.server.remote)
+        ec, output = process.client.ctr.exec_run(
+            ["sh", "-c", f"{command} > {process.log} 2>&1 & echo $!"])
+        if ec != 0:
+            raise Exception(f"Starting client on {process.client.ctr.name} failed: {output.decode('utf8')}")
+        process.pid = int(output.decode("utf8").split()[-1])
+
+    def _follow(self, process):
+        for line in follow(process.client.ctr, process.log):
+            sample = parse_sample(line)
+            if sample is not None:
+                process.sample = sample
+                process.seq += 1
+
+    def _stop(self, process):
+        ctr = process.client.ctr
+        ctr.exec_run(f"kill {process.pid}")
+        # Ends the stream of follow()
+        ctr.exec_run(["pkill", "-f", f"tail -n \\+1 -F {process.log}"])
+
+    def _server_cpu(self):
+        ec, output = self.server.ctr.exec_run("ps -C timeservice -o %cpu=")
+        if ec != 0:
+            return None
+        return sum(float(v) for v in output.decode("utf8").split())
+
+    def run_phase(self, phase, count, out):
+        # Run `count` client processes, spread over the time hosts, for the
+        # configured duration and write samples to `out`
+        processes = [_Process(i, self.clients[i % len(self.clients)], f"/timebench-{phase}-{i}.log")
+                     for i in range(count)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(self._start, processes))
+        followers = [threading.Thread(target=self._follow, args=(p,), daemon=True) for p in processes]
+        for follower in followers:
+            follower.start()
+
+        seen = {}
+        start = time.monotonic()
+        tick = start
+        while tick - start < self.duration:
+            tick += self.interval
+            time.sleep(max(0.0, tick - time.monotonic()))
+            t = round(time.monotonic() - start, 3)
+            for p in processes:
+                if p.sample is None:
+                    continue
+                out.write(json.dumps({
+                    "phase": phase, "t_s": t, "process": p.index, "client": p.client.ia,
+                    "offset_s": p.sample["offset_s"], "rtt_s": p.sample["rtt_s"],
+                    "injected_offset_s": self.offsets.get(p.client.ia, 0.0) / 1000,
+                    "fresh": seen.get(p.index) != p.seq}) + "\n")
+                seen[p.index] = p.seq
+            out.write(json.dumps({"phase": phase, "t_s": t, "server_cpu": self._server_cpu()}) + "\n")
+            out.flush()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(self._stop, processes))
+        for follower in followers:
+            follower.join(timeout=10)
+
+    def run(self, path):
+        self.inject_offsets()
+        try:
+            with open(path, "w") as out:
+                self.run_phase(1, len(self.clients), out)
+                for i, count in enumerate(self.scaling):
+                    self.run_phase(i + 2, count, out)
+        finally:
+            self.clear_offsets()
+        return summarize(load_samples(path), self.tolerance)
+
+
+def load_samples(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _convergence(samples, tolerance):
+    # Time of the first sample after which the error stays within tolerance
+    converged = None
+    for s in samples:
+        if abs(s["offset_s"] - s["injected_offset_s"]) <= tolerance:
+            if converged is None:
+                converged = s["t_s"]
+        else:
+            converged = None
+    return converged
+
+
+def summarize(samples, tolerance=0.001):
+    phases = {}
+    for s in samples:
+        phases.setdefault(s["phase"], []).append(s)
+    summary = []
+    for phase, records in sorted(phases.items()):
+        cpu = [r["server_cpu"] for r in records if r.get("server_cpu") is not None]
+        measurements = [r for r in records if "offset_s" in r and r["fresh"]]
+        processes = {}
+        for r in measurements:
+            processes.setdefault(r["process"], []).append(r)
+        convergence = {}
+        errors = []
+        rtts = []
+        for index, series in sorted(processes.items()):
+            converged = _convergence(series, tolerance)
+            convergence[index] = converged
+            steady = [r for r in series if converged is not None and r["t_s"] >= converged]
+            errors += [abs(r["offset_s"] - r["injected_offset_s"]) for r in steady]
+            rtts += [r["rtt_s"] for r in series if r["rtt_s"] is not None]
+        duration = max((r["t_s"] for r in records), default=0)
+        converged = [c for c in convergence.values() if c is not None]
+        summary.append({
+            "phase": phase,
+            "clients": len(processes),
+            "converged": len(converged),
+            "convergence_s_max": max(converged, default=None),
+            "convergence_s_p50": percentile(converged, 50),
+            "offset_error_s": {f"p{p}": percentile(errors, p) for p in (50, 90, 99)},
+            "rtt_s": {f"p{p}": percentile(rtts, p) for p in (50, 90, 99)},
+            "samples_per_s": len(measurements) / duration if duration else None,
+            "server_cpu_mean": sum(cpu) / len(cpu) if cpu else None,
+        })
+    return summary
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import secrets
+import subprocess
+import tempfile
+
+
+# TLS material generated on the build machine from a single local CA. Keys use
+# ECDSA P-256 (or Ed25519), which is far cheaper to generate than RSA-4096.
+# The CA and every issued certificate are cached, so repeated compiles reuse
+# them and containers start without generating anything. Cached certificates
+# that expire within `renew_days` are issued again.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "seed_test", "tls")
+
+
+def _genkey(path, algorithm):
+    if algorithm == "ec":
+        args = ["-algorithm", "EC", "-pkeyopt", "ec_paramgen_curve:P-256"]
+    elif algorithm == "ed25519":
+        args = ["-algorithm", "ED25519"]
+    else:
+        raise Exception(f"Unsupported key algorithm {algorithm}")
+    subprocess.run(["openssl", "genpkey"] + args + ["-out", path], check=True, capture_output=True)
+
+
+def _expires_within(cert, days):
+    # True if the certificate is no longer valid `days` days from now
+    result = subprocess.run(["openssl", "x509", "-checkend", str(int(days * 86400)), "-noout", "-in", cert],
+                            capture_output=True)
+    return result.returncode != 0
+
+
+def _digest(algorithm):
+    # Ed25519 signatures do not take a separate digest
+    return [] if algorithm == "ed25519" else ["-sha256"]
+
+
+class CertificateAuthority:
+    def __init__(self, cache_dir=None, algorithm="ec", days=365, renew_days=30):
+        self.cache_dir = os.path.abspath(cache_dir or DEFAULT_CACHE_DIR)
+        self.algorithm = algorithm
+        self.days = days
+        self.renew_days = renew_days
+        self.dir = os.path.join(self.cache_dir, f"ca-{algorithm}")
+        self.cert = os.path.join(self.dir, "ca.crt")
+        self.key = os.path.join(self.dir, "ca.key")
+        if not os.path.exists(self.cert) or _expires_within(self.cert, self.renew_days):
+            self._create()
+        with open(self.cert, "r") as f:
+            self.cert_pem = f.read()
+
+    def _create(self):
+        os.makedirs(self.dir, exist_ok=True)
+        _genkey(self.key, self.algorithm)
+        subprocess.run(["openssl", "req", "-x509", "-new", "-key", self.key, "-subj", "/CN=seed_test CA",
+                        "-days", "3650", "-out", self.cert + ".tmp"] + _digest(self.algorithm),
+                       check=True, capture_output=True)
+        os.replace(self.cert + ".tmp", self.cert)
+
+    def issue(self, name, sans=("localhost",)):
+        # Returns (certificate PEM, key PEM) for `name`, issued once and cached
+        key = hashlib.sha256("\0".join([self.cert_pem, name] + list(sans)).encode()).hexdigest()[:16]
+        cert_dir = os.path.join(self.dir, "certs", f"{name}-{key}")
+        cert = os.path.join(cert_dir, "tls.crt")
+        if not os.path.exists(cert) or _expires_within(cert, self.renew_days):
+            os.makedirs(cert_dir, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=cert_dir) as tmp:
+                _genkey(os.path.join(cert_dir, "tls.key"), self.algorithm)
+                csr = os.path.join(tmp, "tls.csr")
+                subprocess.run(["openssl", "req", "-new", "-key", os.path.join(cert_dir, "tls.key"),
+                                "-subj", f"/CN={sans[0]}", "-out", csr], check=True, capture_output=True)
+                ext = os.path.join(tmp, "ext.cnf")
+                with open(ext, "w") as f:
+                    f.write("basicConstraints = CA:FALSE\n")
+                    f.write("keyUsage = digitalSignature\n")
+                    f.write("extendedKeyUsage = serverAuth\n")
+                    f.write("subjectAltName = " + ",".join(f"DNS:{san}" for san in sans) + "\n")
+                subprocess.run(["openssl", "x509", "-req", "-in", csr, "-CA", self.cert, "-CAkey", self.key,
+                                "-set_serial", str(secrets.randbits(63)), "-days", str(self.days),
+                                "-extfile", ext, "-out", cert + ".tmp"] + _digest(self.algorithm),
+                               check=True, capture_output=True)
+                os.replace(cert + ".tmp", cert)
+        with open(cert, "r") as f:
+            cert_pem = f.read()
+        with open(os.path.join(cert_dir, "tls.key"), "r") as f:
+            key_pem = f.read()
+        return cert_pem, key_pem
+
+    def install(self, host, name, sans=("localhost",), cert_path="/tls.crt", key_path="/tls.key",
+                ca_path="/tls-ca.crt"):
+        cert_pem, key_pem = self.issue(name, sans)
+        host.setFile(cert_path, cert_pem)
+        host.setFile(key_path, key_pem)
+        host.setFile(ca_path, self.cert_pem)
+        return host
@@ -0,0 +1,217 @@
+import argparse
+import random
+import sys
+from collections import defaultdict, deque
+
+
+# Generates topologies in the config.yaml schema read by configurator.py:
+#
+#   MAIN: {ISDs}
+#   ISD<n>: {ISDN, AS, LEVELS, ASes: {CORE: ..., LEVEL1: ..., ...}}
+#
+# Output is produced line by line, so the generator only keeps the ASes of
+# the current and the previous level in memory. The same parameters and seed
+# always produce the same file.
+
+FIRST_ASN = 150
+
+
+def _core_lines(asn, brs, inter_br):
+    yield f"      AS{asn}:\n"
+    yield f"        ASN: {asn}\n"
+    yield f"        BRs: {brs}\n"
+    yield f"        INTER_BR: \"{inter_br}\"\n"
+
+
+def _as_lines(asn, host, connections):
+    yield f"      AS{asn}:\n"
+    yield f"        ASN: {asn}\n"
+    if host:
+        yield "        HOST: True\n"
+    yield "        CONNECTIONS:\n"
+    for peer, relation in connections:
+        yield f"        - AS: {peer}\n"
+        yield "          BR: \"br0\"\n"
+        yield f"          RELATION: \"{relation}\"\n"
+
+
+def _level_sizes(cores, fanout, levels):
+    if isinstance(fanout, int):
+        fanout = [fanout] * levels
+    if len(fanout) != levels:
+        raise Exception(f"Expected {levels} fan-out values, got {len(fanout)}")
+    if min(fanout) < 1:
+        raise Exception("Fan-out must be at least 1 on every level")
+    sizes = []
+    prev = cores
+    for f in fanout:
+        prev *= f
+        sizes.append(prev)
+    return sizes
+
+
+def generate(isds=1, cores=2, levels=3, fanout=2, multihoming=1, peering=0.0,
+             hosts=0.0, core_degree=None, brs=3, inter_br="br1", seed=0, first_asn=FIRST_ASN):
+    # fanout:      children per AS of the previous level (int or one value per level)
+    # multihoming: number of providers of every non-core AS
+    # peering:     probability that a new AS peers with an AS of the same level
+    # hosts:       probability that a non-core AS gets a host
+    # core_degree: number of earlier core ASes each core AS links to (default: full mesh)
+    rng = random.Random(seed)
+    sizes = _level_sizes(cores, fanout, levels)
+    next_asn = first_asn
+
+    yield "MAIN:\n"
+    yield f"  ISDs: {isds}\n"
+    for isd in range(1, isds + 1):
+        yield "\n"
+        yield f"ISD{isd}:\n"
+        yield f"  ISDN: {isd}\n"
+        yield f"  AS: {cores + sum(sizes)}\n"
+        yield f"  LEVELS: {levels}\n"
+        if core_degree is not None:
+            yield f"  CORE_DEGREE: {core_degree}\n"
+        yield "  ASes:\n"
+
+        yield "    CORE:\n"
+        previous = []
+        for _ in range(cores):
+            yield from _core_lines(next_asn, brs, inter_br)
+            previous.append(next_asn)
+            next_asn += 1
+
+        for level, size in enumerate(sizes, start=1):
+            yield f"    LEVEL{level}:\n"
+            current = []
+            for i in range(size):
+                asn = next_asn
+                next_asn += 1
+                parent = previous[i * len(previous) // size]
+                providers = [parent]
+                while len(providers) < min(multihoming, len(previous)):
+                    p = previous[rng.randrange(len(previous))]
+                    if p not in providers:
+                        providers.append(p)
+                connections = [(p, "PROVIDER") for p in providers]
+                if current and rng.random() < peering:
+                    connections.append((rng.choice(current), "PEER"))
+                yield from _as_lines(asn, rng.random() < hosts, connections)
+                current.append(asn)
+            previous = current
+
+
+def _read_as_rel(lines):
+    # CAIDA serial-1/serial-2 format: <provider>|<customer>|-1 or <peer>|<peer>|0
+    providers = defaultdict(list)
+    peers = defaultdict(list)
+    ases = set()
+    for line in lines:
+        if not line.strip() or line.startswith("#"):
+            continue
+        a, b, rel = line.strip().split("|")[:3]
+        a, b = int(a), int(b)
+        ases.add(a)
+        ases.add(b)
+        if rel == "-1":
+            providers[b].append(a)
+        elif rel == "0":
+            peers[a].append(b)
+            peers[b].append(a)
+    return ases, providers, peers
+
+
+def from_as_relationships(lines, isd=1, max_ases=None, hosts=0.0, core_degree=None,
+                          brs=3, inter_br="br1", seed=0):
+    # ASes without providers become core ASes, every other AS is placed one
+    # level below its closest provider. Provider links that do not point to a
+    # lower level, peer links to ASes not emitted before and peerings with core
+    # ASes are dropped, since configurator.py creates ASes strictly in file
+    # order and only connects non-core ASes with cross-connects.
+    rng = random.Random(seed)
+    ases, providers, peers = _read_as_rel(lines)
+    customers = defaultdict(list)
+    for customer, provs in providers.items():
+        for p in provs:
+            customers[p].append(customer)
+
+    cores = sorted(a for a in ases if not providers[a])
+    level = {a: 0 for a in cores}
+    order = list(cores)
+    queue = deque(cores)
+    while queue:
+        a = queue.popleft()
+        for c in sorted(customers[a]):
+            if c not in level:
+                level[c] = level[a] + 1
+                order.append(c)
+                queue.append(c)
+    if max_ases is not None:
+        order = order[:max_ases]
+    emitted = {}
+    for i, a in enumerate(order):
+        emitted[a] = i
+    levels = max(level[a] for a in order) if order else 0
+
+    yield "MAIN:\n"
+    yield "  ISDs: 1\n"
+    yield "\n"
+    yield f"ISD{isd}:\n"
+    yield f"  ISDN: {isd}\n"
+    yield f"  AS: {len(order)}\n"
+    yield f"  LEVELS: {levels}\n"
+    if core_degree is not None:
+        yield f"  CORE_DEGREE: {core_degree}\n"
+    yield "  ASes:\n"
+    yield "    CORE:\n"
+    current_level = 0
+    for a in order:
+        if level[a] == 0:
+            yield from _core_lines(a, brs, inter_br)
+            continue
+        if level[a] != current_level:
+            current_level = level[a]
+            yield f"    LEVEL{current_level}:\n"
+        connections = [(p, "PROVIDER") for p in sorted(providers[a])
+                       if p in emitted and level[p] < level[a]]
+        connections += [(p, "PEER") for p in sorted(peers[a])
+                        if p in emitted and emitted[p] < emitted[a] and level[p] > 0]
+        yield from _as_lines(a, rng.random() < hosts, connections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a topology for configurator.py")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--isds", type=int, default=1)
+    parser.add_argument("--cores", type=int, default=2)
+    parser.add_argument("--levels", type=int, default=3)
+    parser.add_argument("--fanout", type=int, nargs="+", default=[2],
+                        help="children per AS, either one value or one per level")
+    parser.add_argument("--multihoming", type=int, default=1)
+    parser.add_argument("--peering", type=float, default=0.0)
+    parser.add_argument("--hosts", type=float, default=0.0)
+    parser.add_argument("--core-degree", type=int)
+    parser.add_argument("--brs", type=int, default=3)
+    parser.add_argument("--as-rel", help="build from a CAIDA AS-relationship file instead")
+    parser.add_argument("--max-ases", type=int)
+    args = parser.parse_args()
+
+    if args.as_rel:
+        with open(args.as_rel, "r") as f:
+            relationships = f.readlines()
+        lines = from_as_relationships(relationships, max_ases=args.max_ases, hosts=args.hosts,
+                                      core_degree=args.core_degree, brs=args.brs, seed=args.seed)
+    else:
+        fanout = args.fanout[0] if len(args.fanout) == 1 else args.fanout
+        lines = generate(isds=args.isds, cores=args.cores, levels=args.levels, fanout=fanout,
+                         multihoming=args.multihoming, peering=args.peering, hosts=args.hosts,
+                         core_degree=args.core_degree, brs=args.brs, seed=args.seed)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    out.writelines(lines)
+    if args.output:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import json
+import re
+
+from seedtest.readiness import parse_container_name
+
+
+# Index of a rendered and running topology. Links are declared while the
+# topology is built (next to scion.addXcLink/addIxLink), interface names and
+# addresses are filled in from the rendered routers and containers are
+# attached after compose up:
+#
+#   index = TopologyIndex()
+#   index.add_link((1, 150), (1, 153), "transit")
+#   emu.render()
+#   index.resolve(base)
+#   whales.compose.up(detach=True)
+#   index.attach(ctrs)
+#   index.save("./output/topology-index.json")
+#
+# Later experiments can attach to the running network without rendering it
+# again:
+#
+#   index = TopologyIndex.load("./output/topology-index.json").attach_docker(docker.from_env())
+#
+# Nodes are keyed by (isd, asn, role, name) with the container roles of
+# seedemu (brd, cs, rs, h, r), link ends by (isd, asn, peer isd, peer asn).
+# There is one link end per AS pair and direction.
+
+NODE = re.compile(r"^as(\d+)(brd|cs|rs|h|r)-(.+)$")
+
+# What the other end of a link is to each end: (to a, to b)
+RELATIONS = {
+    "core": ("core", "core"),
+    "transit": ("customers", "providers"),
+    "peer": ("peers", "peers"),
+}
+
+
+class TopologyIndex:
+    def __init__(self):
+        self.isds = {}        # asn -> isd
+        self.links = {}       # (isd, asn, peer isd, peer asn) -> link end
+        self.neighbours = {}  # (isd, asn) -> {relation: [(isd, asn), ...]}
+        self.nodes = {}       # (isd, asn, role, name) -> container name
+        self.ctrs = {}        # (isd, asn, role, name) -> container
+
+    def add_as(self, isd, asn):
+        self.isds[asn] = isd
+        self.neighbours.setdefault((isd, asn), {})
+
+    def add_link(self, a, b, relation, a_router="br0", b_router="br0", ix=None):
+        # a and b are (isd, asn); for "transit" links a is the provider of b.
+        # Without `ix` the link is a cross-connect between the two routers.
+        a_relation, b_relation = RELATIONS[relation]
+        for (isd, asn), router, (peer_isd, peer_asn), peer_router, rel in [
+                (a, a_router, b, b_router, a_relation), (b, b_router, a, a_router, b_relation)]:
+            self.add_as(isd, asn)
+            self.neighbours[(isd, asn)].setdefault(rel, []).append((peer_isd, peer_asn))
+            self.links[(isd, asn, peer_isd, peer_asn)] = {
+                "relation": rel,
+                "router": router,
+                "peer_router": peer_router,
+                "ix": ix,
+                "iface": f"ix{ix}" if ix is not None else None,
+                "address": None,
+            }
+
+    def resolve(self, base):
+        # Interface names and addresses from the rendered routers of the base layer
+        for (isd, asn, peer_isd, peer_asn), end in self.links.items():
+            router = base.getAutonomousSystem(asn).getRouter(end["router"])
+            if end["ix"] is None:
+                address, iface, _ = router.getCrossConnect(peer_asn, end["peer_router"])
+                end["iface"] = iface
+                end["address"] = str(address)
+            else:
+                for interface in router.getInterfaces():
+                    if interface.getNet().getName() == end["iface"]:
+                        end["address"] = str(interface.getAddress())
+        for end in self.links.values():
+            end["peer_iface"] = None
+            end["peer_address"] = None
+        for (isd, asn, peer_isd, peer_asn), end in self.links.items():
+            peer = self.links[(peer_isd, peer_asn, isd, asn)]
+            peer["peer_iface"] = end["iface"]
+            peer["peer_address"] = end["address"]
+        return self
+
+    def attach(self, ctrs):
+        # ctrs: container name -> container
+        for name, ctr in ctrs.items():
+            parsed = parse_container_name(name)
+            if parsed is None:
+                continue
+            asn, role, node = parsed
+            key = (self.isds.get(asn, 1), asn, role, node)
+            self.nodes[key] = name
+            self.ctrs[key] = ctr
+        return self
+
+    def attach_docker(self, client):
+        # Attach to a running network by the container names of the index
+        running = {ctr.name: ctr for ctr in client.containers.list()}
+        self.ctrs = {key: running[name] for key, name in self.nodes.items() if name in running}
+        return self
+
+    def container(self, asn, role, name, isd=None):
+        key = (self.isds.get(asn, 1) if isd is None else isd, asn, role, name)
+        if key not in self.ctrs:
+            raise Exception(f"No container for {key}")
+        return self.ctrs[key]
+
+    def node(self, name):
+        # Container of a node given as "as{asn}{role}-{name}", e.g. "as155brd-br0"
+        m = NODE.match(name)
+        if m is None:
+            raise Exception(f"Invalid node {name}, expected as<asn><role>-<name>")
+        return self.container(int(m.group(1)), m.group(2), m.group(3))
+
+    def router(self, asn, name="br0", isd=None):
+        return self.container(asn, "brd", name, isd)
+
+    def host(self, asn, name="host", isd=None):
+        return self.container(asn, "h", name, isd)
+
+    def link(self, isd, asn, peer_isd, peer_asn):
+        return self.links[(isd, asn, peer_isd, peer_asn)]
+
+    def link_end(self, isd, asn, peer_isd, peer_asn):
+        # (router container, interface) of the link towards the peer AS
+        end = self.links[(isd, asn, peer_isd, peer_asn)]
+        return self.router(asn, end["router"], isd), end["iface"]
+
+    def neighbours_of(self, asn, relation=None, isd=None):
+        neighbours = self.neighbours[(self.isds[asn] if isd is None else isd, asn)]
+        if relation is not None:
+            return list(neighbours.get(relation, []))
+        return [n for ns in neighbours.values() for n in ns]
+
+    def to_dict(self):
+        return {
+            "isds": {str(asn): isd for asn, isd in self.isds.items()},
+            "links": [{"key": list(key), **end} for key, end in self.links.items()],
+            "neighbours": [{"as": list(key), "relations": {r: [list(n) for n in ns] for r, ns in rels.items()}}
+                           for key, rels in self.neighbours.items()],
+            "nodes": [{"key": list(key), "container": name} for key, name in self.nodes.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.isds = {int(asn): isd for asn, isd in data["isds"].items()}
+        for link in data["links"]:
+            end = dict(link)
+            index.links[tuple(end.pop("key"))] = end
+        for entry in data["neighbours"]:
+            index.neighbours[tuple(entry["as"])] = {r: [tuple(n) for n in ns] for r, ns in entry["relations"].items()}
+        index.nodes = {tuple(node["key"]): node["container"] for node in data["nodes"]}
+        return index
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
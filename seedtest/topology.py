@@ -0,0 +1,324 @@
+from collections import defaultdict
+from contextlib import nullcontext
+
+import yaml
+
+from seedtest.bundles import IP_FAILOVER, SCION_FAST_FAILOVER
+from seedtest.topoindex import TopologyIndex
+
+
+# One in-memory model of a config.yaml topology, built into a SCION or a BGP
+# emulation:
+#
+#   model = TopologyModel.load("config/config.yaml")
+#   plan = AddressPlan.load("config/config.plan.json")
+#   emu, base, index = build_scion(model, plan, bundles)
+#   emu, base, index = build_bgp(model, plan, bundles)
+#
+# Both variants share ASes, routers, networks, hosts, addresses and
+# cross-connects; they differ only in the routing layers and the failover
+# application installed on the hosts. Links are added in the order of the
+# config (core links as each core AS is added, then the CONNECTIONS of every
+# level), which is the order seedemu assigns SCION interface IDs in, see
+# seedtest/paths.py.
+#
+# Control services and beaconing are set per AS in config.yaml:
+#
+#   AS150:
+#     ASN: 150
+#     BRs: 3
+#     CONTROL_SERVICES: ["net0", "net2"]   # or a count, spread over net0, net1, ...
+#     BEACONING: {PROPAGATION: 10s, REGISTRATION: 10s, ORIGINATION: 5s}
+#
+# Without CONTROL_SERVICES a core AS gets cs1 on net0 and, with 2 or more
+# BRs, cs2 on net1; every other AS cs1 on net0. BEACONING of an AS overrides
+# that of its ISD, which overrides the one under MAIN; intervals not set
+# anywhere are the SCION defaults. Both are ignored by the BGP variant.
+#
+# seedemu is imported by the build functions only, so the model itself can be
+# used without it. With a seedtest.profiling.Profiler the setup of the layers,
+# rendering and every layer within it are timed.
+
+
+BEACONING_INTERVALS = ("PROPAGATION", "REGISTRATION", "ORIGINATION")
+
+
+class AsSpec:
+    # control_services: network of every control service, cs1 first.
+    # beaconing: interval per BEACONING_INTERVALS key, e.g. {"PROPAGATION": "10s"}
+    def __init__(self, isd, asn, core=False, level=0, brs=1, inter_br=None, host=False, control_services=None,
+                 beaconing=None):
+        self.isd = isd
+        self.asn = asn
+        self.core = core
+        self.level = level
+        self.brs = brs
+        self.inter_br = inter_br
+        self.host = host
+        if control_services is None:
+            control_services = ["net0", "net1"] if core and brs >= 2 else ["net0"]
+        self.control_services = control_services
+        self.beaconing = beaconing or {}
+
+    @property
+    def ia(self):
+        return f"{self.isd}-{self.asn}"
+
+
+class LinkSpec:
+    # relation as in seedtest.topoindex: "core" (over the IX of the ISD),
+    # "transit" (a is the provider of b) or "peer"
+    def __init__(self, isd, a, b, relation, a_router="br0", b_router="br0", ix=None):
+        self.isd = isd
+        self.a = a
+        self.b = b
+        self.relation = relation
+        self.a_router = a_router
+        self.b_router = b_router
+        self.ix = ix
+
+    @property
+    def name(self):
+        # Link notation of seedtest.faults
+        return f"({self.isd},{self.a})-({self.isd},{self.b})"
+
+
+def _control_services(as_data, brs):
+    # Networks of the control services of an AS from its CONTROL_SERVICES
+    # entry (a count or a list of networks), None for the default placement
+    value = as_data.get("CONTROL_SERVICES")
+    if value is None:
+        return None
+    networks = [f"net{i % brs}" for i in range(value)] if isinstance(value, int) else list(value)
+    if not networks:
+        raise Exception(f"AS {as_data['ASN']} has no control service")
+    for net in networks:
+        if net not in [f"net{i}" for i in range(brs)]:
+            raise Exception(f"AS {as_data['ASN']} has no network {net} for a control service, it has {brs} BRs")
+    return networks
+
+
+def _beaconing(*levels):
+    # BEACONING entries from the most general to the most specific, merged
+    intervals = {}
+    for level in levels:
+        for key, value in (level or {}).items():
+            if key not in BEACONING_INTERVALS:
+                raise Exception(f"Unknown beaconing interval {key}, expected one of {', '.join(BEACONING_INTERVALS)}")
+            intervals[key] = f"{value}s" if isinstance(value, (int, float)) else value
+    return intervals
+
+
+class TopologyModel:
+    def __init__(self):
+        self.isds = {}   # isd -> IX number
+        self.ases = {}   # asn -> AsSpec, in order of addition
+        self.links = []  # LinkSpec, in order of addition
+
+    def add_isd(self, isd, ix=None):
+        self.isds[isd] = 100 + isd if ix is None else ix
+
+    def add_as(self, isd, asn, **kwargs):
+        self.ases[asn] = AsSpec(isd, asn, **kwargs)
+        return self.ases[asn]
+
+    def add_link(self, a, b, relation, a_router="br0", b_router="br0"):
+        isd = self.ases[b].isd
+        ix = self.isds[isd] if relation == "core" else None
+        self.links.append(LinkSpec(isd, a, b, relation, a_router, b_router, ix))
+        return self.links[-1]
+
+    @classmethod
+    def from_config(cls, config):
+        model = cls()
+        main_beaconing = config["MAIN"].get("BEACONING")
+        for _isd in range(1, config["MAIN"]["ISDs"] + 1):
+            isd_config = config[f"ISD{_isd}"]
+            isd = isd_config["ISDN"]
+            model.add_isd(isd)
+            core_ases = []
+            for _, as_data in isd_config["ASes"]["CORE"].items():
+                asn = as_data["ASN"]
+                model.add_as(isd, asn, core=True, brs=as_data["BRs"], inter_br=as_data["INTER_BR"],
+                             control_services=_control_services(as_data, as_data["BRs"]),
+                             beaconing=_beaconing(main_beaconing, isd_config.get("BEACONING"), as_data.get("BEACONING")))
+                # Full mesh by default, CORE_DEGREE limits each core AS to the previous k core ASes
+                core_degree = isd_config.get("CORE_DEGREE", len(core_ases))
+                for previous_core_as in core_ases[max(0, len(core_ases) - core_degree):]:
+                    model.add_link(previous_core_as, asn, "core", a_router="br1", b_router="br1")
+                core_ases.append(asn)
+            for level in range(1, isd_config["LEVELS"] + 1):
+                for _, as_data in isd_config["ASes"][f"LEVEL{level}"].items():
+                    asn = as_data["ASN"]
+                    model.add_as(isd, asn, level=level, host=bool(as_data.get("HOST")),
+                                 control_services=_control_services(as_data, 1),
+                                 beaconing=_beaconing(main_beaconing, isd_config.get("BEACONING"),
+                                                      as_data.get("BEACONING")))
+                    for connection in as_data["CONNECTIONS"]:
+                        if connection["RELATION"] == "PROVIDER":
+                            relation = "transit"
+                        elif connection["RELATION"] == "PEER":
+                            relation = "peer"
+                        else:
+                            raise Exception(f"Unknown Connection Relation: {connection['RELATION']}")
+                        model.add_link(connection["AS"], asn, relation, a_router=connection["BR"])
+        return model
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_config(yaml.safe_load(f))
+
+    def cores(self, isd):
+        return [s.asn for s in self.ases.values() if s.isd == isd and s.core]
+
+    def hosts(self):
+        return [s.asn for s in self.ases.values() if s.host]
+
+    def links_by_b(self):
+        # Links grouped by the AS that declares them in the config
+        links = defaultdict(list)
+        for link in self.links:
+            links[link.b].append(link)
+        return links
+
+    def index(self, links=None):
+        # Topology index of all ASes and `links` (default: all links)
+        index = TopologyIndex()
+        for spec in self.ases.values():
+            index.add_as(spec.isd, spec.asn)
+        for link in self.links if links is None else links:
+            index.add_link((link.isd, link.a), (link.isd, link.b), link.relation,
+                           a_router=link.a_router, b_router=link.b_router, ix=link.ix)
+        return index
+
+
+def _routers(as_, spec, isd_ix):
+    # Border routers of an AS, each on its own network and the next one's;
+    # the INTER_BR of a core AS joins the IX
+    routers = {}
+    for br_id in range(spec.brs):
+        router = as_.createRouter(f"br{br_id}")
+        router.joinNetwork(f"net{br_id}")
+        if spec.brs > 1:
+            router.joinNetwork(f"net{(br_id + 1) % spec.brs}")
+        if spec.core and f"br{br_id}" == spec.inter_br:
+            router.joinNetwork(f"ix{isd_ix}")
+        routers[f"br{br_id}"] = router
+    return routers
+
+
+def _build(model, plan, base, add_as, add_link, setup_host, create_rs):
+    # Creates ASes, networks, routers and hosts, and the cross-connects of all
+    # non-core links, in config order. add_as(as_, spec) and add_link(link)
+    # add the variant-specific parts.
+    routers = {}
+    links = model.links_by_b()
+    # Register every IX before the first AS is placed, so no AS of an earlier
+    # ISD takes the 10.<ix>.0.0/16 of a later one
+    for isd_ix in model.isds.values():
+        plan.ix_network(isd_ix)
+    for isd, isd_ix in model.isds.items():
+        base.createInternetExchange(isd_ix, prefix=plan.ix_network(isd_ix), create_rs=create_rs)
+        for spec in [s for s in model.ases.values() if s.isd == isd]:
+            as_ = base.createAutonomousSystem(spec.asn)
+            for net in range(spec.brs):
+                as_.createNetwork(f"net{net}", prefix=plan.network(spec.asn, net) if spec.core else plan.network(spec.asn))
+            routers[spec.asn] = _routers(as_, spec, isd_ix)
+            add_as(as_, spec)
+            if spec.host:
+                as_.createHost("host").joinNetwork("net0", address=plan.host_address(spec.asn))
+                setup_host(as_.getHost("host"))
+            for link in links[spec.asn]:
+                if link.ix is None:
+                    b_addr, a_addr = plan.link_addresses(f"{link.a}-{link.b}")
+                    routers[link.b][link.b_router].crossConnect(link.a, link.a_router, b_addr)
+                    routers[link.a][link.a_router].crossConnect(link.b, link.b_router, a_addr)
+                add_link(link)
+    return routers
+
+
+def _render(emu, layers, profiler):
+    for layer in layers:
+        emu.addLayer(profiler.wrap(layer) if profiler else layer)
+    with profiler.phase("render") if profiler else nullcontext():
+        emu.render()
+
+
+def build_scion(model, plan, bundles, profiler=None):
+    # SCION variant with scion-fast-failover on every host, rendered.
+    # Returns (emu, base, index).
+    from seedemu.core import Emulator, OptionMode, OptionRegistry
+    from seedemu.layers import Ospf, Scion, ScionBase, ScionIsd, ScionRouting
+    from seedemu.layers.Scion import LinkType as ScLinkType
+    from seedemu.services import ScionBwtestService
+
+    emu = Emulator()
+    base = ScionBase()
+    scion_isd = ScionIsd()
+    scion = Scion()
+    link_types = {"core": ScLinkType.Core, "transit": ScLinkType.Transit, "peer": ScLinkType.Peer}
+    issuers = {isd: model.cores(isd)[0] for isd in model.isds}
+    for isd in model.isds:
+        base.createIsolationDomain(isd)
+
+    def add_as(as_, spec):
+        as_.setOption(OptionRegistry().scion_disable_bfd("false", mode=OptionMode.RUN_TIME))
+        scion_isd.addIsdAs(spec.isd, spec.asn, is_core=spec.core)
+        if not spec.core:
+            scion_isd.setCertIssuer((spec.isd, spec.asn), issuers[spec.isd])
+        for i, net in enumerate(spec.control_services):
+            as_.createControlService(f"cs{i + 1}").joinNetwork(net)
+        if spec.beaconing:
+            as_.setBeaconingIntervals(*(spec.beaconing.get(key) for key in BEACONING_INTERVALS))
+
+    def add_link(link):
+        a, b = (link.isd, link.a), (link.isd, link.b)
+        if link.ix is not None:
+            scion.addIxLink(link.ix, a, b, link_types[link.relation], a_router=link.a_router, b_router=link.b_router)
+        else:
+            scion.addXcLink(a, b, link_types[link.relation])
+
+    with profiler.phase("setup") if profiler else nullcontext():
+        _build(model, plan, base, add_as, add_link, lambda host: bundles.install(host, SCION_FAST_FAILOVER),
+               create_rs=False)
+    _render(emu, [base, ScionRouting(), Ospf(), scion_isd, scion, ScionBwtestService()], profiler)
+    return emu, base, model.index().resolve(base)
+
+
+def build_bgp(model, plan, bundles, profiler=None):
+    # BGP variant with ip-failover on every host, rendered. Core ASes peer over
+    # the route server of their ISD's IX, so the index has a core link between
+    # every pair of core ASes. Returns (emu, base, index).
+    from seedemu.core import Emulator
+    from seedemu.layers import Base, Ebgp, Ibgp, Ospf, PeerRelationship, Routing
+
+    emu = Emulator()
+    base = Base()
+    ebgp = Ebgp()
+    relationships = {"transit": PeerRelationship.Provider, "peer": PeerRelationship.Peer}
+
+    def add_as(as_, spec):
+        if spec.core:
+            ebgp.addRsPeer(model.isds[spec.isd], spec.asn)
+
+    def add_link(link):
+        if link.ix is None:
+            ebgp.addCrossConnectPeering(link.a, link.b, relationships[link.relation])
+
+    def setup_host(host):
+        host.addSoftware("traceroute")
+        bundles.install(host, IP_FAILOVER)
+
+    with profiler.phase("setup") if profiler else nullcontext():
+        _build(model, plan, base, add_as, add_link, setup_host, create_rs=True)
+    _render(emu, [base, Routing(), Ospf(), Ibgp(), ebgp], profiler)
+
+    links = []
+    for isd, isd_ix in model.isds.items():
+        cores = model.cores(isd)
+        for i, a in enumerate(cores):
+            for b in cores[i + 1:]:
+                links.append(LinkSpec(isd, a, b, "core", model.ases[a].inter_br, model.ases[b].inter_br, isd_ix))
+    links += [link for link in model.links if link.ix is None]
+    return emu, base, model.index(links).resolve(base)
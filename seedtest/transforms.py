@@ -0,0 +1,143 @@
+import fnmatch
+import json
+import os
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Post-compile transforms. seedemu stores the files of a node under hashed
+# names and copies them into place with COPY lines in the node's Dockerfile.
+# The index below maps every node directory of the compiled output to its
+# kind, AS and the container paths of its files, so a transform registered
+# for "/etc/scion/topology.json" on "all nodes of AS 150" only opens those
+# files. Files are only written back if a transform changed them.
+
+NODE_DIR = re.compile(r"^(brd|cs|rs|h|r)node_(\d+)_(.+)$")
+
+
+class Node:
+    def __init__(self, root, name, kind, asn, node):
+        self.dir = os.path.join(root, name)
+        self.name = name
+        self.kind = kind
+        self.asn = asn
+        self.node = node
+        self.files = self._files()
+
+    def _files(self):
+        # Container path -> file in the node directory
+        files = {}
+        dockerfile = os.path.join(self.dir, "Dockerfile")
+        if os.path.exists(dockerfile):
+            with open(dockerfile, "r") as f:
+                for line in f:
+                    tokens = line.split()
+                    if len(tokens) < 3 or tokens[0] != "COPY":
+                        continue
+                    args = [t for t in tokens[1:] if not t.startswith("--")]
+                    src, dst = args[0], args[-1]
+                    path = os.path.join(self.dir, src)
+                    if len(args) == 2 and os.path.isfile(path):
+                        if dst.endswith("/"):
+                            dst += os.path.basename(src)
+                        files[dst] = path
+        copied = set(files.values())
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if os.path.isfile(path) and path not in copied:
+                files[name] = path
+        return files
+
+
+class OutputIndex:
+    def __init__(self, root):
+        self.root = root
+        self.nodes = []
+        for name in sorted(os.listdir(root)):
+            m = NODE_DIR.match(name)
+            if m and os.path.isdir(os.path.join(root, name)):
+                self.nodes.append(Node(root, name, m.group(1), int(m.group(2)), m.group(3)))
+
+    def select(self, selector):
+        return [node for node in self.nodes if selector(node)]
+
+
+# Node selectors
+
+def in_as(*asns):
+    return lambda node: node.asn in asns
+
+
+def kind(*kinds):
+    return lambda node: node.kind in kinds
+
+
+def named(*names):
+    return lambda node: node.node in names
+
+
+def has_file(pattern):
+    return lambda node: any(fnmatch.fnmatch(path, pattern) for path in node.files)
+
+
+def all_of(*selectors):
+    return lambda node: all(s(node) for s in selectors)
+
+
+def any_node(node):
+    return True
+
+
+def json_transform(fn):
+    # Wraps fn(obj, node) into a transform on the file content. fn modifies
+    # obj in place and returns True if it changed anything.
+    def transform(content, node):
+        try:
+            obj = json.loads(content)
+        except ValueError:
+            return content
+        if not fn(obj, node):
+            return content
+        return json.dumps(obj, indent=2)
+    return transform
+
+
+class TransformPipeline:
+    def __init__(self, workers=8):
+        self.workers = workers
+        self.transforms = []
+
+    def register(self, selector, pattern, transform):
+        # transform(content, node) -> new content, applied to every file whose
+        # container path matches `pattern` in every node matched by `selector`
+        self.transforms.append((selector, pattern, transform))
+        return self
+
+    def _apply_file(self, path, node, transforms):
+        with open(path, "r") as f:
+            original = f.read()
+        content = original
+        for transform in transforms:
+            content = transform(content, node)
+        if content == original:
+            return None
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def apply(self, root):
+        # Returns the files that were rewritten
+        index = OutputIndex(root)
+        tasks = {}
+        for selector, pattern, transform in self.transforms:
+            for node in index.select(selector):
+                for container_path, path in node.files.items():
+                    if fnmatch.fnmatch(container_path, pattern):
+                        tasks.setdefault(path, (node, []))[1].append(transform)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            changed = pool.map(lambda item: self._apply_file(item[0], *item[1]), tasks.items())
+            return [path for path in changed if path is not None]
+
+    def __call__(self, root):
+        return self.apply(root)